@@ -1,5 +1,21 @@
-from txkoji.connection import Connection
-
 __version__ = '0.10.0'
 
 __all__ = ['Connection']
+
+
+def __getattr__(name):
+    """
+    Import Connection the first time someone uses it.
+
+    Connection imports Twisted and our rich classes. Programs that only need
+    a small module (eg. txkoji.task_states) should not pay for that.
+    """
+    if name == 'Connection':
+        from txkoji.connection import Connection
+        globals()['Connection'] = Connection
+        return Connection
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,106 @@
+from twisted.internet import defer
+from twisted.internet import reactor
+from txkoji.multicall import MAX_CALLS
+
+
+"""
+Transparent batching of individual Connection.call()s into multicalls.
+"""
+
+
+class AutoBatcher(object):
+    """
+    Collect individual RPCs and send them together in one system.multicall.
+
+    The first call we receive opens a batching window. Every call that
+    arrives before the window closes goes into the same multicall. Each
+    caller gets its own deferred, which fires with that call's result (or
+    fails with that call's KojiException).
+
+    :param connection: ``txkoji.Connection``
+    :param window: ``float``, number of seconds to collect calls. Zero means
+                   "until the end of this reactor iteration".
+    :param max_calls: ``int``, maximum number of calls in one multicall.
+    """
+    clock = reactor
+
+    def __init__(self, connection, window=0, max_calls=MAX_CALLS):
+        self.connection = connection
+        self.window = window
+        self.max_calls = max_calls
+        self.pending = []
+        self._delayed = None
+
+    def accepts(self, method):
+        """
+        Return True if we can batch this RPC method.
+
+        Koji does not allow multicalls within multicalls.
+        """
+        return method != 'system.multicall'
+
+    def call(self, method, *args, **kwargs):
+        """
+        Queue a call for the next multicall.
+
+        :returns: deferred that when fired returns the plain (unconverted)
+                  result for this individual call.
+        """
+        d = defer.Deferred()
+        self.pending.append((d, method, args, kwargs))
+        # We send a batch immediately once it has max_calls calls, even if
+        # the window has not closed yet.
+        if len(self.pending) >= self.max_calls:
+            self.flush()
+        elif self._delayed is None:
+            self._delayed = self.clock.callLater(self.window, self.flush)
+        return d
+
+    def flush(self):
+        """
+        Send all the queued calls now.
+        """
+        if self._delayed is not None and self._delayed.active():
+            self._delayed.cancel()
+        self._delayed = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        if len(pending) == 1:
+            # A multicall is not worth it for one call.
+            (d, method, args, kwargs) = pending[0]
+            self.connection._call(method, *args, **kwargs).chainDeferred(d)
+            return
+        multicall = self.connection.MultiCall()
+        for (_, method, args, kwargs) in pending:
+            multicall.call(method, *args, **kwargs)
+        deferreds = [d for (d, _, _, _) in pending]
+        result = multicall()
+        result.addCallbacks(self._multicall_callback, self._multicall_errback,
+                            callbackArgs=(deferreds,),
+                            errbackArgs=(deferreds,))
+
+    def _multicall_callback(self, results, deferreds):
+        """
+        Fire each caller's deferred with its own result.
+
+        :param results: KojiMultiCallIterator
+        :param deferreds: list of deferreds, one for each call.
+        """
+        for i, d in enumerate(deferreds):
+            try:
+                value = results.value(i)
+            except Exception:
+                # A KojiException for this call, or the error from this
+                # call's RPC if MultiCall split the batch and that RPC
+                # failed.
+                d.errback()
+            else:
+                d.callback(value)
+
+    def _multicall_errback(self, failure, deferreds):
+        """
+        The entire multicall failed. Fail every caller's deferred.
+        """
+        for d in deferreds:
+            d.errback(failure)
@@ -1,13 +1,13 @@
 import posixpath
 from datetime import datetime, UTC
-from munch import Munch
 from twisted.internet import defer
 from txkoji import build_states
+from txkoji.memo import MemoMunch, memoized_property
 
 
-class Build(Munch):
+class Build(MemoMunch):
 
-    @property
+    @memoized_property
     def completed(self):
         """
         Return a parsed completion datetime for a build.
@@ -19,7 +19,7 @@ class Build(Munch):
             return None
         return datetime.fromtimestamp(self.completion_ts, UTC)
 
-    @property
+    @memoized_property
     def started(self):
         """
         Return a parsed started datetime for a build.
@@ -87,7 +87,7 @@ class Build(Munch):
         est_completion = self.started + avg_delta
         defer.returnValue(est_completion)
 
-    @property
+    @memoized_property
     def gitbuildhash(self):
         """
         Return the dist-git sha1 from the Git source URL (if available).
@@ -143,7 +143,7 @@ class Build(Munch):
             return defer.succeed(None)
         return self.connection.getTaskInfo(self.task_id)
 
-    @property
+    @memoized_property
     def task_id(self):
         """
         Hack to return a task ID for a build, including container CG builds.
@@ -1,23 +1,220 @@
-import errno
+from collections import OrderedDict
 import os
 from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import threads
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+from txkoji.cache_backends import FileBackend
+from txkoji.exceptions import KojiException
+
+
+# Default number of names we keep in memory.
+MEMORY_SIZE = 1024
+
+# Default time-to-live for each type of name, in seconds. Koji admins can
+# rename tags and users, so we refresh cached names periodically. A type
+# that is not listed here never expires.
+DAY = 24 * 60 * 60
+TTLS = {
+    'tag': DAY,
+    'user': 7 * DAY,
+}
+
+# Default time-to-live for "this object does not exist" results, in
+# seconds. We only keep these in memory.
+NEGATIVE_TTL = 5 * 60
+
+# Default maximum number of names we keep on disk, per profile.
+MAX_ENTRIES = 50000
+
+# Run an eviction pass on disk after this many writes.
+EVICT_INTERVAL = 1000
+
+# Default number of threads for disk I/O.
+THREADS = 1
+
+# Number of seconds we wait to collect writes before we flush them to disk.
+FLUSH_DELAY = 1.0
+
+# Every Cache shares one disk I/O thread pool and one set of shutdown
+# triggers, so short-lived Connections (eg. from connect_from_web()) do not
+# each leave an idle thread, and the reactor does not hold every Cache until
+# it stops.
+_threadpool = None
+# Caches with names queued for disk:
+_pending = set()
+_triggers = False
+
+
+def _add_triggers():
+    """
+    Flush every cache's queued names, and stop our thread pool, when the
+    reactor shuts down.
+    """
+    global _triggers
+    if _triggers:
+        return
+    reactor.addSystemEventTrigger('before', 'shutdown', _flush_all)
+    reactor.addSystemEventTrigger('during', 'shutdown', _stop_threadpool)
+    _triggers = True
+
+
+def _flush_all():
+    """
+    Write every cache's queued names to disk.
+
+    :returns: deferred that fires when we have written all the names.
+    """
+    return defer.gatherResults([cache.flush() for cache in list(_pending)],
+                               consumeErrors=True)
+
+
+def _get_threadpool(threads):
+    """
+    Return the shared disk I/O thread pool, with at least this many threads.
+    """
+    global _threadpool
+    if _threadpool is None:
+        _threadpool = ThreadPool(minthreads=0, maxthreads=threads,
+                                 name='txkoji-cache')
+        _threadpool.start()
+        _add_triggers()
+    elif threads > _threadpool.max:
+        _threadpool.adjustPoolsize(maxthreads=threads)
+    return _threadpool
+
+
+def _stop_threadpool():
+    global _threadpool
+    if _threadpool is not None:
+        _threadpool.stop()
+        _threadpool = None
+
+
+class LRU(object):
+    """
+    Bounded in-memory mapping that evicts the least recently used entry.
+
+    :param size: ``int``, maximum number of entries.
+    """
+    def __init__(self, size=MEMORY_SIZE):
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key):
+        """
+        Look up a value and mark it as recently used.
+
+        :returns: the value, or None if we have no value for this key.
+        """
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def delete(self, key):
+        """ Forget the value for this key, if we have one. """
+        self.data.pop(key, None)
+
+    def put(self, key, value):
+        """ Store a value, evicting the oldest entries if we are full. """
+        self.data.pop(key, None)
+        self.data[key] = value
+        while len(self.data) > self.size:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self):
+        """
+        Return a snapshot of this LRU's counters.
+
+        :returns: ``dict`` of metric names and values.
+        """
+        return {
+            'size': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
 
 
 class Cache(object):
-    def __init__(self, connection, directory=None):
+    clock = reactor
+
+    def __init__(self, connection, directory=None, memory_size=MEMORY_SIZE,
+                 ttls=None, max_entries=MAX_ENTRIES, backend=None,
+                 negative_ttl=NEGATIVE_TTL, threads=THREADS):
         """
         Read-through cache manager for user and tag names.
 
         This cache will write everything into XDG_CACHE_HOME, or ~/.cache.
+        It keeps the most recently used names in memory too, so hot names
+        do not touch the disk at all.
+
+        By default we store one file per name on disk. Pass a
+        txkoji.cache_backends.SQLiteBackend to store all names in one
+        database file instead.
+
+        Names expire after a per-type TTL, so we eventually pick up renamed
+        tags and users. After every EVICT_INTERVAL writes, we delete expired
+        names from disk, and then the oldest names until we are within
+        max_entries.
+
+        If several callers load the same missing name at the same time, we
+        send only one RPC. If the hub says an object does not exist, we
+        remember that in memory for negative_ttl seconds.
 
-        This class does no eviction or expiration - all the data will persist
-        in the cache forever. If you want to clear the cache, you'll need to
-        delete files manually for now.
+        The deferred-returning methods (eg. user_name() and tag_name()) never
+        touch the disk in the reactor thread. They read from the disk in a
+        thread pool that all caches share, and they queue new names in memory
+        and write them to disk in batches every FLUSH_DELAY seconds. The
+        plain get_name(s) and put_name(s) methods still block.
 
         :param connection: txkoji.Connection
         :param directory: optional, directory on disk to store cache data.
+        :param memory_size: ``int``, number of names to keep in memory.
+        :param ttls: ``dict``, optional. Time-to-live in seconds for each
+                     type, eg. {'tag': 3600}. These override the defaults in
+                     TTLS. A TTL of None means names of that type never
+                     expire.
+        :param max_entries: ``int``, maximum number of names to keep on disk
+                            for this profile.
+        :param backend: optional txkoji.cache_backends.Backend. The default
+                        is a FileBackend in the cache directory.
+        :param negative_ttl: ``int``, seconds to remember that an object
+                             does not exist.
+        :param threads: ``int``, number of threads this cache wants in the
+                        shared disk I/O pool. If this is 0, we do all disk
+                        I/O in the reactor thread.
         """
         self.connection = connection
+        self.memory = LRU(memory_size)
+        self.ttls = dict(TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.writes = 0
+        # (type, id) -> list of deferreds waiting for a load in flight.
+        self.loading = {}
+        self.threads = threads
+        # type -> {id: name} that we have not written to disk yet.
+        self.pending = {}
+        self._flush_call = None
         self.directory = directory
         if self.directory is None:
             xdg_cache_home = os.getenv('XDG_CACHE_HOME')
@@ -25,6 +222,9 @@ class Cache(object):
                 self.directory = os.path.join(xdg_cache_home, 'txkoji')
             else:
                 self.directory = os.path.expanduser('~/.cache/txkoji')
+        if backend is None:
+            backend = FileBackend(self.directory)
+        self.backend = backend
 
     def get_name(self, type_, id_):
         """
@@ -32,15 +232,91 @@ class Cache(object):
 
         :param type_: str, "owner" or "tag"
         :param id_: int, eg. 123456
-        :returns: str, or None
+        :returns: str, or None if we have no name, or the name has expired,
+                  or the object does not exist.
         """
-        cachefile = self.filename(type_, id_)
-        try:
-            with open(cachefile, 'r') as f:
-                return f.read()
-        except (OSError, IOError) as e:
-            if e.errno != errno.ENOENT:
-                raise
+        return self.get_names(type_, [id_]).get(id_)
+
+    def get_names(self, type_, ids):
+        """
+        Read several cached names at once.
+
+        :param type_: str, "user" or "tag"
+        :param ids: list of ints
+        :returns: dict of {id: name} for the names we have (and have not
+                  expired). The name is None if we recently found that the
+                  object does not exist.
+        """
+        (result, missing) = self._memory_names(type_, ids)
+        if missing:
+            profile = self.connection.profile
+            entries = self.backend.get_many(profile, type_, missing)
+            result.update(self._remember(type_, entries))
+        return result
+
+    def _memory_names(self, type_, ids):
+        """
+        Read several names from memory (without touching the disk).
+
+        :returns: a tuple of ({id: name}, [missing ids])
+        """
+        now = self.clock.seconds()
+        pending = self.pending.get(type_, {})
+        result = {}
+        missing = []
+        for id_ in ids:
+            entry = self.memory.get((type_, id_))
+            if entry is not None:
+                (name, expires) = entry
+                if expires is None or expires > now:
+                    result[id_] = name
+                    continue
+                self.memory.delete((type_, id_))
+            if id_ in pending:
+                result[id_] = pending[id_]
+                continue
+            missing.append(id_)
+        return (result, missing)
+
+    def _read_names(self, type_, ids):
+        """
+        Read several names from the disk, in a thread.
+
+        :returns: deferred that when fired returns a dict of {id: name} for
+                  the names we have (and have not expired).
+        """
+        profile = self.connection.profile
+        d = self._in_thread(self.backend.get_many, profile, type_, ids)
+        d.addCallback(lambda entries: self._remember(type_, entries))
+        return d
+
+    def _remember(self, type_, entries):
+        """
+        Store names from the disk in memory.
+
+        :param entries: dict of {id: (name, stored)}
+        :returns: dict of {id: name} for the names that have not expired.
+        """
+        now = self.clock.seconds()
+        result = {}
+        for (id_, (name, stored)) in entries.items():
+            expires = self._expires(type_, stored)
+            if expires is not None and expires <= now:
+                continue
+            self.memory.put((type_, id_), (name, expires))
+            result[id_] = name
+        return result
+
+    def _in_thread(self, f, *args):
+        """
+        Call f in the shared disk I/O thread pool.
+
+        :returns: deferred that fires with f's result.
+        """
+        if not self.threads:
+            return defer.maybeDeferred(f, *args)
+        threadpool = _get_threadpool(self.threads)
+        return threads.deferToThreadPool(reactor, threadpool, f, *args)
 
     def put_name(self, type_, id_, name):
         """
@@ -50,26 +326,124 @@ class Cache(object):
         :param id_: int, eg. 123456
         :returns: None
         """
-        cachefile = self.filename(type_, id_)
-        dirname = os.path.dirname(cachefile)
-        try:
-            os.makedirs(dirname)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-        with open(cachefile, 'w') as f:
-            f.write(name)
+        self.put_names(type_, {id_: name})
+
+    def put_missing(self, type_, ids):
+        """
+        Remember (in memory only) that these objects do not exist.
+
+        :param type_: str, "user" or "tag"
+        :param ids: list of ints
+        :returns: None
+        """
+        expires = self.clock.seconds() + self.negative_ttl
+        for id_ in ids:
+            self.memory.put((type_, id_), (None, expires))
+
+    def put_names(self, type_, names):
+        """
+        Write several cached names at once.
+
+        :param type_: str, "user" or "tag"
+        :param names: dict of {id: name}
+        :returns: None
+        """
+        stored = self.clock.seconds()
+        self.backend.put_many(self.connection.profile, type_, names, stored)
+        expires = self._expires(type_, stored)
+        for (id_, name) in names.items():
+            self.memory.put((type_, id_), (name, expires))
+        if self._count_writes(len(names)):
+            self.evict()
+
+    def queue_names(self, type_, names):
+        """
+        Store several names in memory now, and write them to disk later.
+
+        We write all the queued names to disk (in a thread) FLUSH_DELAY
+        seconds after the first one, or when the reactor shuts down.
+
+        :param type_: str, "user" or "tag"
+        :param names: dict of {id: name}
+        :returns: None
+        """
+        expires = self._expires(type_, self.clock.seconds())
+        for (id_, name) in names.items():
+            self.memory.put((type_, id_), (name, expires))
+        if not self.pending:
+            # Flush before we exit, too.
+            _add_triggers()
+            _pending.add(self)
+            self._flush_call = self.clock.callLater(FLUSH_DELAY, self.flush)
+        self.pending.setdefault(type_, {}).update(names)
+
+    def flush(self):
+        """
+        Write all the queued names to disk (in a thread).
+
+        :returns: deferred that fires when we have written the names.
+        """
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        pending = self.pending
+        self.pending = {}
+        _pending.discard(self)
+        profile = self.connection.profile
+        stored = self.clock.seconds()
+        deferreds = []
+        for (type_, names) in pending.items():
+            d = self._in_thread(self.backend.put_many, profile, type_, names,
+                                stored)
+            deferreds.append(d)
+            if self._count_writes(len(names)):
+                deferreds.append(self._in_thread(self.evict))
+        return defer.gatherResults(deferreds, consumeErrors=True)
+
+    def _count_writes(self, count):
+        """
+        Count new writes to the disk.
+
+        :returns: True if it is time to run an eviction pass.
+        """
+        before = self.writes // EVICT_INTERVAL
+        self.writes += count
+        return self.writes // EVICT_INTERVAL > before
+
+    def _expires(self, type_, stored):
+        """
+        Find the expiration time for a name.
+
+        :param type_: str, "user" or "tag"
+        :param stored: ``float``, time we stored the name (epoch seconds)
+        :returns: ``float`` epoch seconds, or None if this type never expires.
+        """
+        ttl = self.ttls.get(type_)
+        if ttl is None:
+            return None
+        return stored + ttl
+
+    def evict(self):
+        """
+        Delete expired names from disk, then the oldest names until we have
+        at most max_entries names for this profile.
+
+        :returns: ``int``, number of names we deleted.
+        """
+        return self.backend.evict(self.connection.profile, self.ttls,
+                                  self.max_entries, self.clock.seconds())
 
     def filename(self, type_, id_):
         """
         cache filename to read for this type/id.
 
+        Only the default FileBackend stores names in separate files.
+
         :param type_: str, "user" or "tag"
         :param id_: int, eg. 123456
         :returns: str
         """
         profile = self.connection.profile
-        return os.path.join(self.directory, profile, type_, str(id_))
+        return FileBackend(self.directory).filename(profile, type_, id_)
 
     @defer.inlineCallbacks
     def get_or_load_name(self, type_, id_, method):
@@ -82,18 +456,64 @@ class Cache(object):
         :param type_: str, "user" or "tag"
         :param id_: int, eg. 123456
         :param method: function to call if this value is not in the cache.
-                       This method must return a deferred that fires with an
-                       object with a ".name" attribute.
+                       This method must return a deferred that fires with a
+                       dict (or Munch) with a "name" key, or None.
         :returns: deferred that when fired returns a str, or None
         """
-        name = self.get_name(type_, id_)
-        if name is not None:
+        (names, _) = self._memory_names(type_, [id_])
+        if id_ in names:
+            defer.returnValue(names[id_])
+        key = (type_, id_)
+        if key in self.loading:
+            name = yield self._wait(key)
             defer.returnValue(name)
+        self.loading[key] = []
+        try:
+            name = yield self._load_name(type_, id_, method)
+        except Exception:
+            self._loaded(key, Failure())
+            raise
+        self._loaded(key, name)
+        defer.returnValue(name)
+
+    @defer.inlineCallbacks
+    def _load_name(self, type_, id_, method):
+        """
+        Read a name from the disk, or else from the live Koji server.
+
+        :returns: deferred that when fired returns a str, or None
+        """
+        names = yield self._read_names(type_, [id_])
+        if id_ in names:
+            defer.returnValue(names[id_])
         instance = yield method(id_)
         if instance is None:
+            self.put_missing(type_, [id_])
             defer.returnValue(None)
-        self.put_name(type_, id_, instance.name)
-        defer.returnValue(instance.name)
+        # Index the result, so this works in every result_mode.
+        name = instance['name']
+        self.queue_names(type_, {id_: name})
+        defer.returnValue(name)
+
+    def _wait(self, key):
+        """
+        Wait for a load that is already in flight.
+
+        :returns: deferred that fires with the name (or failure) for key.
+        """
+        d = defer.Deferred()
+        self.loading[key].append(d)
+        return d
+
+    def _loaded(self, key, result):
+        """
+        Pass a load's name (or failure) to everyone waiting for it.
+        """
+        for d in self.loading.pop(key):
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
 
     def user_name(self, id_):
         """
@@ -112,3 +532,151 @@ class Cache(object):
         :returns: deferred that when fired returns a str, or None
         """
         return self.get_or_load_name('tag', id_, self.connection.getTag)
+
+    @defer.inlineCallbacks
+    def get_or_load_names(self, type_, ids, method_name):
+        """
+        read-through cache for many objects' names at once.
+
+        We look up all the IDs in the cache first. Then we load all the
+        missing names from the live Koji server in one multicall (which
+        MultiCall splits into several RPCs if necessary), and store them in
+        one batch.
+
+        :param type_: str, "user" or "tag"
+        :param ids: list of ints
+        :param method_name: str, RPC to call for each missing name, eg.
+                            "getUser". The RPC must return a dict with a
+                            "name" key, or None.
+        :returns: deferred that when fired returns a dict of {id: name}. The
+                  name is None if the object does not exist, or if its RPC
+                  failed while other RPCs in the multicall succeeded. We do
+                  not cache those failures.
+        """
+        ids = list(set(ids))
+        (names, missing) = self._memory_names(type_, ids)
+        waiting = {}
+        to_load = []
+        for id_ in missing:
+            key = (type_, id_)
+            if key in self.loading:
+                # Another caller is already loading this name.
+                waiting[id_] = self._wait(key)
+            else:
+                self.loading[key] = []
+                to_load.append(id_)
+        waiting_ids = list(waiting)
+        deferreds = [waiting[id_] for id_ in waiting_ids]
+        if to_load:
+            deferreds.append(self._load_names(type_, to_load, method_name))
+        try:
+            results = yield defer.gatherResults(deferreds,
+                                                consumeErrors=True)
+        except defer.FirstError as e:
+            # Raise the hub or transport error itself.
+            e.subFailure.raiseException()
+        names.update(zip(waiting_ids, results))
+        if to_load:
+            names.update(results[-1])
+        defer.returnValue(names)
+
+    @defer.inlineCallbacks
+    def _load_names(self, type_, ids, method_name):
+        """
+        Read names from the disk, or else from the live Koji server.
+
+        Passes each name to anyone waiting for it.
+
+        :returns: deferred that when fired returns a dict of {id: name}.
+        """
+        try:
+            names = yield self._read_names(type_, ids)
+        except Exception:
+            failure = Failure()
+            for id_ in ids:
+                self._loaded((type_, id_), failure)
+            raise
+        for (id_, name) in names.items():
+            self._loaded((type_, id_), name)
+        missing = [id_ for id_ in ids if id_ not in names]
+        if missing:
+            multicall = self.connection.MultiCall()
+            for id_ in missing:
+                multicall.call(method_name, id_)
+            d = multicall()
+            d.addCallback(self._multicall_names, missing)
+            d.addBoth(self._loaded_names, type_, missing)
+            loaded = yield d
+            names.update(loaded)
+        defer.returnValue(names)
+
+    def _multicall_names(self, results, ids):
+        """
+        Find the names in a multicall's results.
+
+        :returns: a (names, missing, failed) tuple. names is a dict of
+                  {id: name}. The name is None if that call failed or
+                  returned None. missing is a list of the ids that do not
+                  exist. failed is a dict of {id: Failure} for the calls
+                  whose RPC failed (eg. one chunk of a split multicall timed
+                  out).
+        """
+        names = {}
+        missing = []
+        failed = {}
+        for (i, id_) in enumerate(ids):
+            try:
+                value = results.value(i)
+            except KojiException:
+                names[id_] = None
+                continue
+            except Exception:
+                names[id_] = None
+                failed[id_] = Failure()
+                continue
+            if value is None:
+                missing.append(id_)
+                names[id_] = None
+            else:
+                names[id_] = value['name']
+        return (names, missing, failed)
+
+    def _loaded_names(self, result, type_, ids):
+        """
+        Store a multicall's names, and pass them to anyone waiting for them.
+
+        Anyone waiting for an id whose RPC failed gets that failure.
+
+        :returns: dict of {id: name}, or the multicall's failure.
+        """
+        if isinstance(result, Failure):
+            for id_ in ids:
+                self._loaded((type_, id_), result)
+            return result
+        (names, missing, failed) = result
+        found = dict((id_, name) for (id_, name) in names.items()
+                     if name is not None)
+        if found:
+            self.queue_names(type_, found)
+        self.put_missing(type_, missing)
+        for id_ in ids:
+            self._loaded((type_, id_), failed.get(id_, names[id_]))
+        return names
+
+    def user_names(self, ids):
+        """
+        read-through cache for many user names.
+
+        :param ids: list of ints
+        :returns: deferred that when fired returns a dict of {id: name}
+        """
+        return self.get_or_load_names('user', ids, 'getUser')
+
+    def tag_names(self, ids):
+        """
+        read-through cache for many tag names.
+
+        :param ids: list of ints
+        :returns: deferred that when fired returns a dict of {id: name}
+        """
+        return self.get_or_load_names('tag', ids, 'getTag')
@@ -0,0 +1,306 @@
+import errno
+import os
+import sqlite3
+import threading
+
+
+"""
+Storage backends for txkoji.cache.Cache.
+
+A backend stores names on disk, keyed by Koji profile, type ("user" or
+"tag") and ID. Each name has a "stored" timestamp (epoch seconds), which the
+Cache uses to expire old names.
+"""
+
+# Maximum number of SQL variables in one query. Older SQLite versions
+# allow at most 999.
+MAX_VARIABLES = 500
+
+# Number of seconds to wait for another process's write lock.
+TIMEOUT = 30
+
+
+class Backend(object):
+    """
+    Interface for name cache backends.
+
+    Subclasses must implement get_many(), put_many() and evict().
+    """
+
+    def get(self, profile, type_, id_):
+        """
+        Read one name.
+
+        :returns: a (name, stored) tuple, or None.
+        """
+        return self.get_many(profile, type_, [id_]).get(id_)
+
+    def put(self, profile, type_, id_, name, stored):
+        """
+        Write one name.
+        """
+        self.put_many(profile, type_, {id_: name}, stored)
+
+    def get_many(self, profile, type_, ids):
+        """
+        Read several names at once.
+
+        :param profile: ``str``, Koji profile name, eg. "cbs"
+        :param type_: ``str``, "user" or "tag"
+        :param ids: list of ``int`` IDs
+        :returns: ``dict`` of {id: (name, stored)} for the names we have.
+        """
+        raise NotImplementedError()
+
+    def put_many(self, profile, type_, names, stored):
+        """
+        Write several names at once.
+
+        :param profile: ``str``, Koji profile name, eg. "cbs"
+        :param type_: ``str``, "user" or "tag"
+        :param names: ``dict`` of {id: name}
+        :param stored: ``float``, epoch seconds
+        """
+        raise NotImplementedError()
+
+    def evict(self, profile, ttls, max_entries, now):
+        """
+        Delete expired names, then the oldest names until we have at most
+        max_entries names for this profile.
+
+        :param ttls: ``dict`` of {type: ttl seconds, or None}
+        :returns: ``int``, number of names we deleted.
+        """
+        raise NotImplementedError()
+
+
+class FileBackend(Backend):
+    """
+    Store each name in its own file, <directory>/<profile>/<type>/<id>.
+
+    The file's mtime is the name's "stored" timestamp.
+
+    :param directory: ``str``, top-level cache directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def filename(self, profile, type_, id_):
+        """
+        cache filename to read for this type/id.
+
+        :returns: str
+        """
+        return os.path.join(self.directory, profile, type_, str(id_))
+
+    def get_many(self, profile, type_, ids):
+        result = {}
+        for id_ in ids:
+            cachefile = self.filename(profile, type_, id_)
+            try:
+                with open(cachefile, 'r') as f:
+                    name = f.read()
+                    mtime = os.fstat(f.fileno()).st_mtime
+            except (OSError, IOError) as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            result[id_] = (name, mtime)
+        return result
+
+    def put_many(self, profile, type_, names, stored):
+        dirname = os.path.join(self.directory, profile, type_)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        for (id_, name) in names.items():
+            cachefile = self.filename(profile, type_, id_)
+            with open(cachefile, 'w') as f:
+                f.write(name)
+            os.utime(cachefile, (stored, stored))
+
+    def evict(self, profile, ttls, max_entries, now):
+        root = os.path.join(self.directory, profile)
+        try:
+            types = os.listdir(root)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return 0
+        deleted = 0
+        entries = []
+        for type_ in types:
+            ttl = ttls.get(type_)
+            dirname = os.path.join(root, type_)
+            for id_ in os.listdir(dirname):
+                cachefile = os.path.join(dirname, id_)
+                mtime = os.stat(cachefile).st_mtime
+                if ttl is not None and mtime + ttl <= now:
+                    os.remove(cachefile)
+                    deleted += 1
+                else:
+                    entries.append((mtime, cachefile))
+        excess = len(entries) - max_entries
+        if excess > 0:
+            entries.sort()
+            for (_, cachefile) in entries[:excess]:
+                os.remove(cachefile)
+                deleted += 1
+        return deleted
+
+    def walk(self):
+        """
+        Find every name in this directory, for all profiles and types.
+
+        :returns: generator of (profile, type, id, name, stored) tuples.
+        """
+        try:
+            profiles = os.listdir(self.directory)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return
+        for profile in profiles:
+            root = os.path.join(self.directory, profile)
+            if not os.path.isdir(root):
+                continue
+            for type_ in os.listdir(root):
+                dirname = os.path.join(root, type_)
+                if not os.path.isdir(dirname):
+                    continue
+                for id_ in os.listdir(dirname):
+                    cachefile = os.path.join(dirname, id_)
+                    with open(cachefile, 'r') as f:
+                        name = f.read()
+                        mtime = os.fstat(f.fileno()).st_mtime
+                    yield (profile, type_, id_, name, mtime)
+
+
+class SQLiteBackend(Backend):
+    """
+    Store all names for all profiles in one SQLite database file.
+
+    We use SQLite's write-ahead log (WAL), so several processes can read and
+    write the same file concurrently. Each thread opens its own connection,
+    so txkoji.cache.Cache can use this backend from its thread pool.
+
+    :param path: ``str``, database filename, eg.
+                 "~/.cache/txkoji/names.sqlite"
+    :param timeout: ``float``, seconds to wait for another process's lock.
+    """
+    def __init__(self, path, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        """
+        Open (and create) the database the first time this thread needs it.
+        """
+        if getattr(self._local, 'db', None) is None:
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                try:
+                    os.makedirs(dirname)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute('PRAGMA journal_mode=WAL')
+            with db:
+                db.execute('CREATE TABLE IF NOT EXISTS names ('
+                           'profile TEXT NOT NULL, '
+                           'type TEXT NOT NULL, '
+                           'id TEXT NOT NULL, '
+                           'name TEXT NOT NULL, '
+                           'stored REAL NOT NULL, '
+                           'PRIMARY KEY (profile, type, id))')
+                db.execute('CREATE INDEX IF NOT EXISTS names_stored '
+                           'ON names (profile, stored)')
+                db.execute('CREATE TABLE IF NOT EXISTS migrations ('
+                           'directory TEXT PRIMARY KEY)')
+            self._local.db = db
+        return self._local.db
+
+    def close(self):
+        """ Close this thread's database connection. """
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def get_many(self, profile, type_, ids):
+        keys = dict((str(id_), id_) for id_ in ids)
+        result = {}
+        ids = list(keys)
+        for i in range(0, len(ids), MAX_VARIABLES):
+            chunk = ids[i:i + MAX_VARIABLES]
+            sql = ('SELECT id, name, stored FROM names '
+                   'WHERE profile = ? AND type = ? AND id IN (%s)'
+                   % ', '.join('?' * len(chunk)))
+            rows = self.db.execute(sql, [profile, type_] + chunk)
+            for (id_, name, stored) in rows:
+                result[keys[id_]] = (name, stored)
+        return result
+
+    def put_many(self, profile, type_, names, stored):
+        rows = [(profile, type_, str(id_), name, stored)
+                for (id_, name) in names.items()]
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO names '
+                                '(profile, type, id, name, stored) '
+                                'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def evict(self, profile, ttls, max_entries, now):
+        deleted = 0
+        with self.db:
+            for (type_, ttl) in ttls.items():
+                if ttl is None:
+                    continue
+                cursor = self.db.execute('DELETE FROM names WHERE '
+                                         'profile = ? AND type = ? AND '
+                                         'stored <= ?',
+                                         (profile, type_, now - ttl))
+                deleted += cursor.rowcount
+            (count,) = self.db.execute('SELECT COUNT(*) FROM names '
+                                       'WHERE profile = ?',
+                                       (profile,)).fetchone()
+            excess = count - max_entries
+            if excess > 0:
+                cursor = self.db.execute('DELETE FROM names WHERE rowid IN ('
+                                         'SELECT rowid FROM names '
+                                         'WHERE profile = ? '
+                                         'ORDER BY stored LIMIT ?)',
+                                         (profile, excess))
+                deleted += cursor.rowcount
+        return deleted
+
+    def migrate(self, directory):
+        """
+        Import all the names from a FileBackend directory, once.
+
+        We record each directory we import, so calling this again for the
+        same directory does nothing. We do not delete the old files.
+
+        :param directory: ``str``, top-level FileBackend cache directory.
+        :returns: ``int``, number of names we imported.
+        """
+        directory = os.path.abspath(directory)
+        count = 0
+        with self.db:
+            # Record the migration first. This takes the write lock, so if
+            # another process is migrating the same directory, we wait for
+            # it, and then find its record and do nothing.
+            cursor = self.db.execute('INSERT OR IGNORE INTO migrations '
+                                     '(directory) VALUES (?)', (directory,))
+            if cursor.rowcount == 0:
+                return 0
+            for entry in FileBackend(directory).walk():
+                self.db.execute('INSERT OR IGNORE INTO names '
+                                '(profile, type, id, name, stored) '
+                                'VALUES (?, ?, ?, ?, ?)', entry)
+                count += 1
+        return count
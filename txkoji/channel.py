@@ -47,5 +47,6 @@ class Channel(Munch):
         total_capacity = 0
         hosts = yield self.hosts(enabled=True)
         for host in hosts:
-            total_capacity += host.capacity
+            # Index the host, so this works in every result_mode.
+            total_capacity += host['capacity']
         defer.returnValue(total_capacity)
@@ -0,0 +1,108 @@
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+
+"""
+Coalesce identical in-flight RPCs (single-flight).
+"""
+
+# Koji RPCs with no side effects. If we send one of these and an identical
+# request is already waiting for a response, it is safe to share that
+# response.
+READ_METHODS = frozenset([
+    'getAPIVersion',
+    'getAverageBuildDuration',
+    'getBuild',
+    'getBuildTarget',
+    'getChannel',
+    'getHost',
+    'getPackage',
+    'getTag',
+    'getTaskChildren',
+    'getTaskDescendents',
+    'getTaskInfo',
+    'getTaskResult',
+    'getUser',
+    'listBuilds',
+    'listChannels',
+    'listHosts',
+    'listTagged',
+    'listTags',
+    'listTasks',
+])
+
+
+def call_key(method, args, kwargs):
+    """
+    Return a hashable key for this RPC and its arguments.
+
+    :returns: a tuple, or None if the arguments are not hashable.
+    """
+    try:
+        key = (method, _freeze(args), _freeze(kwargs))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _freeze(value):
+    """ Convert (nested) lists and dicts into tuples. """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class Coalescer(object):
+    """
+    Share one in-flight RPC between all callers that make the same request.
+
+    If a caller makes an allowed RPC while an identical one is still waiting
+    for the hub's response, we do not send another request. Instead, the
+    second caller's deferred fires with the first request's response.
+
+    Each caller converts the shared response into its own result objects,
+    except in txkoji.results.RAW mode, where all the callers receive the same
+    plain data. Copy RAW results before you modify them.
+
+    :param methods: allow-list of RPC method names that we may coalesce.
+                    These methods must not have side effects.
+    """
+    def __init__(self, methods=READ_METHODS):
+        self.methods = frozenset(methods)
+        self.pending = {}
+
+    def call(self, send, method, *args, **kwargs):
+        """
+        Send this RPC, or attach to an identical in-flight RPC.
+
+        :param send: function that sends the RPC and returns a deferred,
+                     for example Connection._call.
+        :returns: deferred that when fired returns the RPC's result.
+        """
+        key = None
+        if method in self.methods:
+            key = call_key(method, args, kwargs)
+        if key is None:
+            return send(method, *args, **kwargs)
+        if key in self.pending:
+            d = defer.Deferred()
+            self.pending[key].append(d)
+            return d
+        waiters = []
+        self.pending[key] = waiters
+        d = send(method, *args, **kwargs)
+        d.addBoth(self._fire_waiters, key, waiters)
+        return d
+
+    def _fire_waiters(self, result, key, waiters):
+        """ Pass the original call's result (or failure) to every waiter. """
+        del self.pending[key]
+        for d in waiters:
+            if isinstance(result, Failure):
+                d.errback(result)
+            else:
+                d.callback(result)
+        return result
@@ -0,0 +1,158 @@
+from glob import glob
+import os
+try:
+    from configparser import ConfigParser
+except ImportError:
+    from ConfigParser import SafeConfigParser as ConfigParser
+
+
+"""
+Parse koji.conf.d profile files once per process.
+
+Connection looks up several settings for every new connection, and
+Connection.connect_from_web() checks every profile's weburl. Instead of
+globbing and parsing all the files each time, we keep one ConfigIndex and
+re-read the files only when a directory or file mtime changes.
+"""
+
+
+def _stat(path):
+    """
+    Return a signature that changes when this file or directory changes.
+
+    :returns: tuple of (mtime, size), or None if the path does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class WebTrie(object):
+    """
+    Prefix trie that matches URLs to the kojiweb URLs that start them.
+
+    Each node is a dict of {character: child node}. A None key holds the
+    rank of the weburl that ends at that node.
+    """
+    def __init__(self):
+        self.root = {}
+
+    def add(self, weburl, rank):
+        """
+        Add a kojiweb URL.
+
+        :param weburl: ``str``, eg. "https://koji.example.com/koji"
+        :param rank: sortable value. If several weburls match a URL, we
+                     return the one with the lowest rank.
+        """
+        node = self.root
+        for char in weburl:
+            node = node.setdefault(char, {})
+        if None not in node or rank < node[None]:
+            node[None] = rank
+
+    def match(self, url):
+        """
+        Find the best weburl that is a prefix of this url.
+
+        :returns: the rank of the matching weburl, or None.
+        """
+        node = self.root
+        best = node.get(None)
+        for char in url:
+            node = node.get(char)
+            if node is None:
+                break
+            rank = node.get(None)
+            if rank is not None and (best is None or rank < best):
+                best = rank
+        return best
+
+
+class ConfigIndex(object):
+    """
+    All the koji.conf.d profiles, parsed once.
+
+    Call refresh() with the glob patterns before each use. It re-reads the
+    files only if they changed since the last refresh().
+    """
+    def __init__(self):
+        self.patterns = None
+        # Directory signatures from the last glob:
+        self._dirs = None
+        # Paths with their file signatures from the last refresh:
+        self._files = None
+        self.paths = []
+        # profile name -> list of ConfigParsers with that section, in order
+        self.parsers = {}
+        # profile name for each weburl rank:
+        self.weburl_profiles = []
+        self.weburls = WebTrie()
+
+    def refresh(self, patterns):
+        """
+        Re-read the config files if any of them changed.
+
+        :param patterns: list of glob patterns, like
+                         txkoji.connection.PROFILES.
+        :returns: this ConfigIndex
+        """
+        patterns = tuple(os.path.expanduser(pattern) for pattern in patterns)
+        dirs = [_stat(os.path.dirname(pattern)) for pattern in patterns]
+        if patterns != self.patterns or dirs != self._dirs:
+            paths = []
+            for pattern in patterns:
+                paths += glob(pattern)
+            self.paths = paths
+            self.patterns = patterns
+            self._dirs = dirs
+        files = [(path, _stat(path)) for path in self.paths]
+        if files != self._files:
+            self._parse()
+            self._files = files
+        return self
+
+    def _parse(self):
+        parsers = {}
+        weburl_profiles = []
+        weburls = WebTrie()
+        for path in self.paths:
+            cfg = ConfigParser()
+            cfg.read(path)
+            for profile in cfg.sections():
+                parsers.setdefault(profile, []).append(cfg)
+                if cfg.has_option(profile, 'weburl'):
+                    # Earlier files and sections win.
+                    weburls.add(cfg.get(profile, 'weburl'),
+                                len(weburl_profiles))
+                    weburl_profiles.append(profile)
+        self.parsers = parsers
+        self.weburl_profiles = weburl_profiles
+        self.weburls = weburls
+
+    def lookup(self, profile, setting):
+        """
+        Find a profile's setting.
+
+        :returns: ``str``, value for this setting, or None.
+        """
+        for cfg in self.parsers.get(profile, ()):
+            if cfg.has_option(profile, setting):
+                return cfg.get(profile, setting)
+
+    def match_weburl(self, url):
+        """
+        Find the profile with a weburl that starts this url.
+
+        :returns: ``str``, profile name, or None.
+        """
+        rank = self.weburls.match(url)
+        if rank is None:
+            return None
+        return self.weburl_profiles[rank]
+
+
+# One index for the whole process:
+INDEX = ConfigIndex()
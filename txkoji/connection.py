@@ -1,40 +1,58 @@
-from datetime import timedelta
-from glob import glob
 import os
 import re
-from munch import munchify
-import treq
-import treq_kerberos
+import sys
 from twisted.internet import defer
 from twisted.internet import reactor
-from twisted.internet.ssl import PrivateCertificate
-from twisted.web.client import Agent
-from twisted.web.client import BrowserLikePolicyForHTTPS
-from twisted.web.client import ResponseFailed
-from txkoji.proxy import TrustedProxy
-from txkoji.ssl import trustRoot, ClientCertPolicy
 try:
-    from configparser import ConfigParser
     from urllib.parse import urlencode, urlparse, parse_qs
     import xmlrpc
 except ImportError:
-    from ConfigParser import SafeConfigParser as ConfigParser
     from urllib import urlencode
     from urlparse import urlparse, parse_qs
     import xmlrpclib as xmlrpc
-from txkoji.query_factory import KojiQueryFactory
+from txkoji.config import INDEX
+from txkoji.batch import AutoBatcher
+from txkoji.coalesce import Coalescer
+from txkoji.scheduler import Scheduler, INTERACTIVE, MAX_CONCURRENT
+from txkoji.pager import Pager, PAGE_SIZE, CONCURRENCY
+from txkoji.pager import fetch_pages, stable_order
+from txkoji.converters import converter_for
+from txkoji.results import wrap, COMPACT, MUNCH, RAW
+from txkoji.records import record_type
+from txkoji.task import Task
 from txkoji.cache import Cache
+from txkoji.objects import ObjectCache, build_final, task_final
 from txkoji.call import Call
 from txkoji.multicall import MultiCall
-from txkoji.channel import Channel
-from txkoji.task import Task
-from txkoji.build import Build
-from txkoji.package import Package
+from txkoji.sizing import BatchSizer
 from txkoji.exceptions import KojiException, KojiLoginException
 
 
 PROFILES = ('~/.koji/config.d/*.conf', '/etc/koji.conf.d/*.conf')
 
+# Maximum number of idle keep-alive connections we hold open to each hub.
+POOL_SIZE = 4
+
+# Seconds to hold an idle keep-alive connection open. Apache httpd closes idle
+# connections after five seconds by default (KeepAliveTimeout), so we close
+# ours slightly before the hub does.
+POOL_TIMEOUT = 4
+
+
+def __getattr__(name):
+    """
+    Import TrustedProxy the first time we need it.
+
+    txkoji.proxy imports Twisted's HTTP client and TLS modules, which are
+    most of our import time. Short-lived programs that only read the cache
+    or build URLs never need them.
+    """
+    if name == 'TrustedProxy':
+        from txkoji.proxy import TrustedProxy
+        globals()['TrustedProxy'] = TrustedProxy
+        return TrustedProxy
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
 
 def profiles():
     """
@@ -45,16 +63,58 @@ def profiles():
                '/etc/koji.conf.d/stg.conf',
                '/etc/koji.conf.d/fedora.conf']
     """
-    paths = []
-    for pattern in PROFILES:
-        pattern = os.path.expanduser(pattern)
-        paths += glob(pattern)
-    return paths
+    return list(INDEX.refresh(PROFILES).paths)
 
 
 class Connection(object):
 
-    def __init__(self, profile):
+    def __init__(self, profile, pool_size=POOL_SIZE,
+                 pool_timeout=POOL_TIMEOUT, batch_window=None,
+                 coalesce_methods=None, max_concurrent=MAX_CONCURRENT,
+                 priority=INTERACTIVE, compress_threshold=None,
+                 result_mode=MUNCH):
+        """
+        Connect to a Koji hub.
+
+        :param profile: ``str``, a koji.conf.d profile name, eg. "mykoji".
+        :param pool_size: ``int``, maximum number of idle persistent HTTP
+                          connections to keep open to this hub.
+        :param pool_timeout: ``int``, number of seconds to keep an idle
+                             persistent HTTP connection open.
+        :param batch_window: ``float``, optional. If you set this, we collect
+                             all the calls you make within this many seconds
+                             and send them in one system.multicall RPC. Zero
+                             means "all calls made in this reactor
+                             iteration". The default (None) sends every call
+                             individually.
+        :param coalesce_methods: optional allow-list of side-effect-free RPC
+                                 method names, for example
+                                 txkoji.coalesce.READ_METHODS. If you set
+                                 this, and you call one of these methods while
+                                 an identical call (same method and args) is
+                                 still in flight, we do not send a second
+                                 request. Both callers get the first
+                                 request's result. The default (None) sends
+                                 every call.
+        :param max_concurrent: ``int``, maximum number of RPCs in flight to
+                               this hub. We queue the rest.
+        :param priority: ``int``, default queue priority for this
+                         connection's RPCs, txkoji.scheduler.INTERACTIVE or
+                         txkoji.scheduler.BACKGROUND.
+        :param compress_threshold: ``int``, optional. If you set this, we gzip
+                                   any XML-RPC request larger than this many
+                                   bytes. Your hub's web server must accept
+                                   gzipped request bodies. We always accept
+                                   gzipped responses.
+        :param result_mode: how to convert XML-RPC results:
+                            txkoji.results.MUNCH (the default) converts all
+                            nested dicts to Munch objects, LAZY converts them
+                            only when you access them, and RAW returns plain
+                            dicts and lists. Rich objects like Task and Build
+                            are always Munch subclasses, except in COMPACT
+                            mode, where listTasks and friends return compact
+                            read-only records (see txkoji.records).
+        """
         self.profile = profile
         self.url = self.lookup(profile, 'server')
         self.weburl = self.lookup(profile, 'weburl')
@@ -62,30 +122,88 @@ class Connection(object):
         if not self.url:
             msg = 'no server configured at %s for %s' % (PROFILES, profile)
             raise ValueError(msg)
-        self.trustRoot = trustRoot(self.serverca)
-        self.proxy = TrustedProxy(self.url.encode(), allowNone=True,
-                                  trustRoot=self.trustRoot)
-        self.proxy.queryFactory = KojiQueryFactory
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self.compress_threshold = compress_threshold
+        # We create these on first use:
+        self._trustRoot = None
+        self._pool = None
+        self._proxy = None
         self.cache = Cache(self)
+        self.objects = ObjectCache(self)
+        self.scheduler = Scheduler(max_concurrent)
+        self.sizer = BatchSizer()
+        self.result_mode = result_mode
+        self._record_types = {}
+        self.priority = priority
+        self.batcher = None
+        if batch_window is not None:
+            self.batcher = AutoBatcher(self, batch_window)
+        self.coalescer = None
+        if coalesce_methods is not None:
+            self.coalescer = Coalescer(coalesce_methods)
         # We populate these on login:
         self.session_id = None
         self.session_key = None
         self.callnum = None
 
+    @property
+    def trustRoot(self):
+        """ Load our CA certificates the first time we need them. """
+        if self._trustRoot is None:
+            from txkoji.ssl import trustRoot
+            self._trustRoot = trustRoot(self.serverca)
+        return self._trustRoot
+
+    @property
+    def pool(self):
+        """
+        Share one set of keep-alive connections between XML-RPC calls,
+        multicalls, and GSSAPI logins.
+        """
+        if self._pool is None:
+            from twisted.web.client import HTTPConnectionPool
+            self._pool = HTTPConnectionPool(reactor)
+            self._pool.maxPersistentPerHost = self.pool_size
+            self._pool.cachedConnectionTimeout = self.pool_timeout
+        return self._pool
+
+    @property
+    def proxy(self):
+        """ Create our XML-RPC proxy the first time we need it. """
+        if self._proxy is None:
+            from txkoji.query_factory import KojiQueryFactory
+            # Look this up on the module, so tests can replace it.
+            TrustedProxy = sys.modules[__name__].TrustedProxy
+            proxy = TrustedProxy(self.url.encode(), allowNone=True,
+                                 trustRoot=self.trustRoot, pool=self.pool,
+                                 compressThreshold=self.compress_threshold)
+            proxy.queryFactory = KojiQueryFactory
+            proxy.onResponse = self._response_size
+            self._proxy = proxy
+        return self._proxy
+
+    @proxy.setter
+    def proxy(self, value):
+        self._proxy = value
+
+    def _response_size(self, method, args, size):
+        """
+        Tell our sizer how large a multicall's response was.
+
+        Our proxy calls this after each successful RPC.
+        """
+        if method == 'system.multicall' and self.sizer is not None:
+            methods = [call['methodName'] for call in args[0]]
+            self.sizer.observe_size(methods, size)
+
     def lookup(self, profile, setting):
         """ Check koji.conf.d files for this profile's setting.
 
         :param setting: ``str`` like "server" (for kojihub) or "weburl"
         :returns: ``str``, value for this setting
         """
-        for path in profiles():
-            cfg = ConfigParser()
-            cfg.read(path)
-            if profile not in cfg.sections():
-                continue
-            if not cfg.has_option(profile, setting):
-                continue
-            return cfg.get(profile, setting)
+        return INDEX.refresh(PROFILES).lookup(profile, setting)
 
     @classmethod
     def connect_from_web(klass, url):
@@ -93,7 +211,8 @@ class Connection(object):
         Find a connection that matches this kojiweb URL.
 
         Check all koji.conf.d files' kojiweb URLs and load the profile that
-        matches the url we pass in here.
+        matches the url we pass in here. We keep the parsed files in memory
+        (see txkoji.config), so this is cheap to call for every URL.
 
         For example, if a user pastes a kojiweb URL into chat, we want to
         discover the corresponding Koji instance hub automatically.
@@ -108,15 +227,9 @@ class Connection(object):
         if re.search(r'\s', url):
             return
         url = url.split(' ', 1)[0]
-        for path in profiles():
-            cfg = ConfigParser()
-            cfg.read(path)
-            for profile in cfg.sections():
-                if not cfg.has_option(profile, 'weburl'):
-                    continue
-                weburl = cfg.get(profile, 'weburl')
-                if url.startswith(weburl):
-                    return klass(profile)
+        profile = INDEX.refresh(PROFILES).match_weburl(url)
+        if profile is not None:
+            return klass(profile)
 
     def from_web(self, url):
         """
@@ -178,21 +291,127 @@ class Connection(object):
         the "creation_ts" database column. Many of Koji's XML-RPC methods have
         optional kwargs that you can set as needed.
 
+        If you created this Connection with a batch_window, we will send this
+        call in a system.multicall together with the other calls in the
+        window.
+
+        If you created this Connection with coalesce_methods, and an identical
+        call is already in flight, this call will share that call's result.
+
+        The result is a Munch (dict-like) object by default. Set this
+        connection's result_mode to txkoji.results.LAZY or RAW for cheaper
+        results. Methods in the txkoji.converters registry return rich
+        objects, eg. "getBuild" returns a Build.
+
         :returns: deferred that when fired returns a dict with data from this
                   XML-RPC call.
         """
+        d = self._request(method, *args, **kwargs)
+        d.addCallback(lambda value: self._convert(method, value))
+        return d
+
+    def _request(self, method, *args, **kwargs):
+        """
+        Make an XML-RPC call, and return the plain parsed result.
+
+        Like call(), but without converting the result to a Munch.
+        """
+        if self.coalescer is not None:
+            return self.coalescer.call(self._send, method, *args, **kwargs)
+        return self._send(method, *args, **kwargs)
+
+    def _send(self, method, *args, **kwargs):
+        """
+        Queue this call in the current batch, or send it right now.
+
+        See call().
+        """
+        if self.batcher is not None and self.batcher.accepts(method):
+            return self.batcher.call(method, *args, **kwargs)
+        return self._call(method, *args, **kwargs)
+
+    def _call(self, method, *args, **kwargs):
+        """
+        Send one XML-RPC call to the server right now.
+
+        See call().
+        """
         if kwargs:
             kwargs['__starstar'] = True
             args = args + (kwargs,)
+        return self._submit(method, args)
+
+    def _submit(self, method, args, priority=None, on_item=None,
+                on_start=None):
+        """
+        Queue one XML-RPC call in our scheduler.
+
+        :param method: ``str``, XML-RPC method name.
+        :param args: ``tuple`` of XML-RPC params (with kwargs already packed).
+        :param priority: ``int``, queue priority. The default (None) uses this
+                         connection's priority.
+        :param on_item: optional function to call with each element of the
+                        response array as we parse it. See
+                        TrustedProxy.streamRemote().
+        :param on_start: optional function to call (with no arguments) when
+                         the scheduler sends this call, after any time it
+                         waited in the queue.
+        :returns: deferred that when fired returns the plain data (dicts,
+                  lists, etc) from this XML-RPC call.
+        """
+        if priority is None:
+            priority = self.priority
+        d = self.scheduler.submit(priority, self._call_remote, method, args,
+                                  on_item, on_start)
+        d.addErrback(self._parse_errback)
+        return d
+
+    def _call_remote(self, method, args, on_item=None, on_start=None):
+        """
+        Send one XML-RPC call to the server.
+
+        The scheduler calls this when it is time to send the request. We
+        choose the session callnum here (not when the caller queued the call),
+        so the hub sees the callnums in the order we send them.
+        """
+        if on_start is not None:
+            on_start()
         if self.session_id:
             self.proxy.path = self._authenticated_path()
-        d = self.proxy.callRemote(method, *args)
-        d.addCallback(self._munchify_callback)
-        d.addErrback(self._parse_errback)
+        if on_item is None:
+            d = self.proxy.callRemote(method, *args)
+        else:
+            d = self.proxy.streamRemote(on_item, method, *args)
         if self.callnum is not None:
             self.callnum += 1
         return d
 
+    def _stream(self, callback, mode, method, *args, **kwargs):
+        """
+        Make an XML-RPC call that returns a list, and stream the results.
+
+        :param callback: function to call with each rich item (eg. a Build) as
+                         soon as we parse it from the response.
+        :param mode: result mode for the items, or None for this
+                     connection's result_mode.
+        :param method: ``str``, XML-RPC method name, eg. "listBuilds".
+        :returns: deferred that fires with None when the response is
+                  complete.
+        """
+        converter = converter_for(method)
+        if mode is None:
+            mode = self.result_mode
+
+        def on_item(data):
+            callback(converter(self, data, mode))
+
+        if kwargs:
+            kwargs['__starstar'] = True
+            args = args + (kwargs,)
+        d = self._submit(method, args, on_item=on_item)
+        d.addCallback(lambda _: None)
+        return d
+
     def _authenticated_path(self):
         """
         Get the path of our XML-RPC endpoint with session auth params added.
@@ -227,27 +446,34 @@ class Connection(object):
                   estimated duration, or None if we could find no estimate for
                   this package.
         """
-        seconds = yield self.call('getAverageBuildDuration', package, **kwargs)
-        if seconds is None:
-            defer.returnValue(None)
-        defer.returnValue(timedelta(seconds=seconds))
+        seconds = yield self._request('getAverageBuildDuration', package,
+                                      **kwargs)
+        defer.returnValue(self._convert('getAverageBuildDuration', seconds))
 
     @defer.inlineCallbacks
     def getBuild(self, build_id, **kwargs):
         """
         Load all information about a build and return a custom Build class.
 
-        Calls "getBuild" XML-RPC.
+        Calls "getBuild" XML-RPC. We cache the result (see txkoji.objects)
+        unless you pass other keyword arguments to the RPC.
 
         :param build_id: ``int``, for example 12345
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a Build (Munch, dict-like)
                   object representing this Koji build, or None if no build was
                   found.
         """
-        buildinfo = yield self.call('getBuild', build_id, **kwargs)
-        build = Build.fromDict(buildinfo)
-        if build:
-            build.connection = self
+        mode = kwargs.pop('result_mode', None)
+        if kwargs:
+            buildinfo = yield self._request('getBuild', build_id, **kwargs)
+        else:
+            buildinfo = yield self.objects.load(
+                'build', build_id,
+                lambda: self._request('getBuild', build_id),
+                build_final)
+        build = self._convert('getBuild', buildinfo, mode)
         defer.returnValue(build)
 
     @defer.inlineCallbacks
@@ -258,14 +484,15 @@ class Connection(object):
         Calls "getChannel" XML-RPC.
 
         :param channel_id: ``int``, for example 12345, or ``str`` for name.
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a Channel (Munch, dict-like)
                   object representing this Koji channel, or None if no channel
                   was found.
         """
-        channelinfo = yield self.call('getChannel', channel_id, **kwargs)
-        channel = Channel.fromDict(channelinfo)
-        if channel:
-            channel.connection = self
+        mode = kwargs.pop('result_mode', None)
+        channelinfo = yield self._request('getChannel', channel_id, **kwargs)
+        channel = self._convert('getChannel', channelinfo, mode)
         defer.returnValue(channel)
 
     @defer.inlineCallbacks
@@ -276,14 +503,15 @@ class Connection(object):
         Calls "getPackage" XML-RPC.
 
         :param package_id: ``int``, for example 12345
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a Package (Munch, dict-like)
                   object representing this Koji package, or None if no build
                   was found.
         """
-        packageinfo = yield self.call('getPackage', name, **kwargs)
-        package = Package.fromDict(packageinfo)
-        if package:
-            package.connection = self
+        mode = kwargs.pop('result_mode', None)
+        packageinfo = yield self._request('getPackage', name, **kwargs)
+        package = self._convert('getPackage', packageinfo, mode)
         defer.returnValue(package)
 
     @defer.inlineCallbacks
@@ -292,19 +520,30 @@ class Connection(object):
         Load all information about a task's descendents into Task classes.
 
         Calls "getTaskDescendents" XML-RPC (with request=True to get the full
-        information.)
+        information.) The hub always decodes the task requests for this RPC.
+        We cache the result (see txkoji.objects) unless you pass other
+        keyword arguments to the RPC.
 
         :param task_id: ``int``, for example 12345, parent task ID
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a list of Task (Munch,
                   dict-like) objects representing Koji tasks.
         """
-        kwargs['request'] = True
-        data = yield self.call('getTaskDescendents', task_id, **kwargs)
-        tasks = []
-        for tdata in data[str(task_id)]:
-            task = Task.fromDict(tdata)
-            task.connection = self
-            tasks.append(task)
+        mode = kwargs.pop('result_mode', None)
+        if kwargs:
+            kwargs['request'] = True
+            data = yield self._request('getTaskDescendents', task_id,
+                                       **kwargs)
+        else:
+            data = yield self.objects.load(
+                'descendents', task_id,
+                lambda: self._request('getTaskDescendents', task_id,
+                                      request=True),
+                lambda data: self._descendents_final(task_id, data))
+        # Only convert the list we return, not every parent's list.
+        tasks = [self._wrap(Task, task, mode)
+                 for task in data[str(task_id)]]
         defer.returnValue(tasks)
 
     @defer.inlineCallbacks
@@ -313,20 +552,43 @@ class Connection(object):
         Load all information about a task and return a custom Task class.
 
         Calls "getTaskInfo" XML-RPC (with request=True to get the full
-        information.)
+        information.) We cache the result (see txkoji.objects) unless you
+        pass other keyword arguments to the RPC.
 
         :param task_id: ``int``, for example 12345
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a Task (Munch, dict-like)
                   object representing this Koji task, or none if no task was
                   found.
         """
-        kwargs['request'] = True
-        taskinfo = yield self.call('getTaskInfo', task_id, **kwargs)
-        task = Task.fromDict(taskinfo)
-        if task:
-            task.connection = self
+        mode = kwargs.pop('result_mode', None)
+        if kwargs:
+            kwargs['request'] = True
+            taskinfo = yield self._request('getTaskInfo', task_id, **kwargs)
+        else:
+            taskinfo = yield self.objects.load(
+                'task', task_id,
+                lambda: self._request('getTaskInfo', task_id, request=True),
+                task_final)
+        task = self._convert('getTaskInfo', taskinfo, mode)
         defer.returnValue(task)
 
+    def _descendents_final(self, task_id, data):
+        """
+        Return True if this getTaskDescendents result can no longer change.
+
+        A parent task can spawn new subtasks until it finishes, so we need
+        to know that the parent task is final, as well as all its
+        descendents. We only check the parent task in self.objects, without
+        another RPC.
+        """
+        parent = self.objects.peek('task', task_id)
+        if parent is None or not parent[1]:
+            return False
+        return all(task_final(task)
+                   for tasks in data.values() for task in tasks)
+
     @defer.inlineCallbacks
     def listBuilds(self, package, **kwargs):
         """
@@ -338,24 +600,88 @@ class Connection(object):
         server-side.
 
         :param package: ``int`` (packageID) or ``str`` (package name).
+        :param callback: optional function. If you pass this, we call it with
+                         each Build as soon as we parse it from the hub's
+                         response, instead of building the whole list in
+                         memory. The deferred fires with None.
+        :param result_mode: optional, txkoji.results.RAW, LAZY, MUNCH, or
+                            COMPACT. COMPACT returns memory-efficient
+                            BuildRecord objects. The default is this
+                            connection's result_mode.
+        :param page_size: ``int``, optional. If you pass this, we count the
+                          builds first, and then fetch them in pages of
+                          this size, several pages at a time. This is much
+                          faster for very large results.
+        :param concurrency: ``int``, the maximum number of pages in flight
+                            when you pass page_size.
         :returns: deferred that when fired returns a list of Build objects
                   for this package.
         """
-        if isinstance(package, int):
-            package_id = package
-        else:
-            package_data = yield self.getPackage(package)
-            if package_data is None:
-                defer.returnValue([])
-            package_id = package_data.id
-        data = yield self.call('listBuilds', package_id, **kwargs)
-        builds = []
-        for bdata in data:
-            build = Build.fromDict(bdata)
-            build.connection = self
-            builds.append(build)
+        callback = kwargs.pop('callback', None)
+        mode = kwargs.pop('result_mode', None)
+        page_size = kwargs.pop('page_size', None)
+        concurrency = kwargs.pop('concurrency', CONCURRENCY)
+        if callback is not None and page_size is not None:
+            raise ValueError('cannot combine callback and page_size')
+        package_id = yield self._package_id(package)
+        if package_id is None:
+            defer.returnValue([])
+        if page_size is not None:
+            queryOpts = dict(kwargs.pop('queryOpts', None) or {})
+            count_opts = dict(queryOpts, countOnly=True)
+            count = yield self._request('listBuilds', package_id,
+                                        queryOpts=count_opts, **kwargs)
+            queryOpts['order'] = stable_order(queryOpts.get('order'),
+                                              'build_id')
+
+            def fetch(offset, limit):
+                page_opts = dict(queryOpts, offset=offset, limit=limit)
+                return self.listBuilds(package_id, queryOpts=page_opts,
+                                       result_mode=mode, **kwargs)
+            builds = yield fetch_pages(fetch, count, page_size, concurrency)
+            defer.returnValue(builds)
+        if callback is not None:
+            yield self._stream(callback, mode, 'listBuilds', package_id,
+                               **kwargs)
+            defer.returnValue(None)
+        data = yield self._request('listBuilds', package_id, **kwargs)
+        builds = self._convert('listBuilds', data, mode)
         defer.returnValue(builds)
 
+    def iterBuilds(self, package, page_size=PAGE_SIZE, **kwargs):
+        """
+        Get all builds of a package, one page at a time.
+
+        Calls "listBuilds" XML-RPC with a queryOpts limit and offset for each
+        page. We sort by build_id (after any "order" you pass in queryOpts)
+        so the pages do not skip or repeat builds.
+
+        :param package: ``int`` (packageID) or ``str`` (package name).
+        :param page_size: ``int``, number of builds per listBuilds call.
+        :param **kwargs: keyword args to pass through to listBuilds(), eg.
+                         state, queryOpts or result_mode.
+        :returns: a txkoji.pager.Pager. Each call to its next() method
+                  returns a deferred that fires with the next list of Build
+                  objects.
+        """
+        queryOpts = dict(kwargs.pop('queryOpts', None) or {})
+        queryOpts['order'] = stable_order(queryOpts.get('order'), 'build_id')
+        # Look up a package name only once, not once per page.
+        package_ids = {}
+
+        @defer.inlineCallbacks
+        def fetch(offset, limit):
+            if package not in package_ids:
+                package_id = yield self._package_id(package)
+                package_ids[package] = package_id
+            if package_ids[package] is None:
+                defer.returnValue([])
+            page_opts = dict(queryOpts, offset=offset, limit=limit)
+            builds = yield self.listBuilds(package_ids[package],
+                                           queryOpts=page_opts, **kwargs)
+            defer.returnValue(builds)
+        return Pager(fetch, page_size)
+
     @defer.inlineCallbacks
     def listTagged(self, *args, **kwargs):
         """
@@ -363,18 +689,30 @@ class Connection(object):
 
         Calls "listTagged" XML-RPC.
 
+        :param callback: optional function. If you pass this, we call it with
+                         each Build as soon as we parse it from the hub's
+                         response, instead of building the whole list in
+                         memory. The deferred fires with None.
+        :param result_mode: optional, txkoji.results.RAW, LAZY, MUNCH, or
+                            COMPACT. COMPACT returns memory-efficient
+                            BuildRecord objects. The default is this
+                            connection's result_mode.
         :returns: deferred that when fired returns a list of Build objects.
         """
-        data = yield self.call('listTagged', *args, **kwargs)
-        builds = []
-        for bdata in data:
-            build = Build.fromDict(bdata)
-            build.connection = self
-            builds.append(build)
+        callback = kwargs.pop('callback', None)
+        mode = kwargs.pop('result_mode', None)
+        if callback is not None:
+            yield self._stream(callback, mode, 'listTagged', *args,
+                               **kwargs)
+            defer.returnValue(None)
+        data = yield self._request('listTagged', *args, **kwargs)
+        builds = self._convert('listTagged', data, mode)
         defer.returnValue(builds)
 
     @defer.inlineCallbacks
-    def listTasks(self, opts={}, queryOpts={}):
+    def listTasks(self, opts={}, queryOpts={}, callback=None,
+                  result_mode=None, decode=True, page_size=None,
+                  concurrency=CONCURRENCY):
         """
         Get information about all Koji tasks.
 
@@ -382,35 +720,115 @@ class Connection(object):
 
         :param dict opts: Eg. {'state': [task_states.OPEN]}
         :param dict queryOpts: Eg. {'order' : 'priority,create_time'}
+        :param callback: optional function. If you pass this, we call it with
+                         each Task as soon as we parse it from the hub's
+                         response, instead of building the whole list in
+                         memory. The deferred fires with None.
+        :param result_mode: optional, txkoji.results.RAW, LAZY, MUNCH, or
+                            COMPACT. COMPACT returns memory-efficient
+                            TaskRecord objects. The default is this
+                            connection's result_mode.
+        :param bool decode: If True (the default), the hub decodes each
+                            task's "request" into nested XML-RPC data. If
+                            False, the hub returns each request as a raw
+                            string, and Task.params decodes it only when you
+                            access it. This is much cheaper when you only
+                            need fields like state, weight or timestamps.
+        :param page_size: ``int``, optional. If you pass this, we count the
+                          tasks first, and then fetch them in pages of this
+                          size, several pages at a time. This is much faster
+                          for very large results.
+        :param concurrency: ``int``, the maximum number of pages in flight
+                            when you pass page_size.
         :returns: deferred that when fired returns a list of Task objects.
         """
-        opts['decode'] = True  # decode xmlrpc data in "request"
-        data = yield self.call('listTasks', opts, queryOpts)
-        tasks = []
-        for tdata in data:
-            task = Task.fromDict(tdata)
-            task.connection = self
-            tasks.append(task)
+        opts = dict(opts, decode=decode)  # decode xmlrpc data in "request"
+        if callback is not None and page_size is not None:
+            raise ValueError('cannot combine callback and page_size')
+        if page_size is not None:
+            count_opts = dict(queryOpts, countOnly=True)
+            count = yield self._request('listTasks', opts, count_opts)
+            queryOpts = dict(queryOpts)
+            queryOpts['order'] = stable_order(queryOpts.get('order'), 'id')
+
+            def fetch(offset, limit):
+                page_opts = dict(queryOpts, offset=offset, limit=limit)
+                return self.listTasks(opts, page_opts, result_mode=result_mode,
+                                      decode=decode)
+            tasks = yield fetch_pages(fetch, count, page_size, concurrency)
+            defer.returnValue(tasks)
+        if callback is not None:
+            yield self._stream(callback, result_mode, 'listTasks', opts,
+                               queryOpts)
+            defer.returnValue(None)
+        data = yield self._request('listTasks', opts, queryOpts)
+        tasks = self._convert('listTasks', data, result_mode)
         defer.returnValue(tasks)
 
+    def iterTasks(self, opts={}, queryOpts={}, page_size=PAGE_SIZE,
+                  **kwargs):
+        """
+        Get information about all Koji tasks, one page at a time.
+
+        Calls "listTasks" XML-RPC with a queryOpts limit and offset for each
+        page. We sort by task id (after any "order" you pass in queryOpts)
+        so the pages do not skip or repeat tasks.
+
+        :param dict opts: Eg. {'state': [task_states.OPEN]}
+        :param dict queryOpts: Eg. {'order' : 'priority,create_time'}
+        :param page_size: ``int``, number of tasks per listTasks call.
+        :param **kwargs: keyword args to pass through to listTasks(), eg.
+                         result_mode or decode.
+        :returns: a txkoji.pager.Pager. Each call to its next() method
+                  returns a deferred that fires with the next list of Task
+                  objects.
+        """
+        queryOpts = dict(queryOpts)
+        queryOpts['order'] = stable_order(queryOpts.get('order'), 'id')
+
+        def fetch(offset, limit):
+            page_opts = dict(queryOpts, offset=offset, limit=limit)
+            return self.listTasks(opts, page_opts, **kwargs)
+        return Pager(fetch, page_size)
+
     @defer.inlineCallbacks
     def listChannels(self, **kwargs):
         """
         Get information about all Koji channels.
 
         :param **kwargs: keyword args to pass through to listChannels RPC.
+        :param result_mode: optional, txkoji.results.RAW, LAZY, or MUNCH.
+                            The default is this connection's result_mode.
         :returns: deferred that when fired returns a list of Channel objects.
         """
-        data = yield self.call('listChannels', **kwargs)
-        channels = []
-        for cdata in data:
-            channel = Channel.fromDict(cdata)
-            channel.connection = self
-            channels.append(channel)
+        mode = kwargs.pop('result_mode', None)
+        data = yield self._request('listChannels', **kwargs)
+        channels = self._convert('listChannels', data, mode)
         defer.returnValue(channels)
 
-    def MultiCall(self):
-        return MultiCall(self)
+    def MultiCall(self, priority=None, **kwargs):
+        """
+        Start a new multicall for this connection.
+
+        :param priority: optional queue priority for this multicall.
+        :param kwargs: max_calls, max_bytes, concurrency or sizer, see
+                       txkoji.multicall.MultiCall. The default sizer is
+                       this connection's sizer, which learns from all our
+                       multicalls.
+        :returns: a txkoji.multicall.MultiCall
+        """
+        kwargs.setdefault('sizer', self.sizer)
+        return MultiCall(self, priority, **kwargs)
+
+    def close(self):
+        """
+        Close all idle persistent connections to this hub.
+
+        :returns: deferred that fires when all the connections have closed.
+        """
+        if self._pool is None:
+            return defer.succeed(None)
+        return self.pool.closeCachedConnections()
 
     @defer.inlineCallbacks
     def login(self):
@@ -448,11 +866,12 @@ class Connection(object):
 
         :returns: deferred that when fired returns a dict from sslLogin
         """
+        import treq_kerberos
+        from twisted.web.client import Agent
         method = treq_kerberos.post
         auth = treq_kerberos.TreqKerberosAuth(force_preemptive=True)
 
-        policy = BrowserLikePolicyForHTTPS(trustRoot=self.trustRoot)
-        agent = Agent(reactor, policy)
+        agent = Agent(reactor, self.proxy.policy, pool=self.pool)
 
         return self._request_login(method, agent=agent, auth=auth)
 
@@ -460,6 +879,9 @@ class Connection(object):
         """
         Get a Twisted Agent that performs Client SSL authentication for Koji.
         """
+        from twisted.internet.ssl import PrivateCertificate
+        from twisted.web.client import Agent
+        from txkoji.ssl import ClientCertPolicy
         # Load "cert" into a PrivateCertificate.
         certfile = self.lookup(self.profile, 'cert')
         certfile = os.path.expanduser(certfile)
@@ -469,6 +891,9 @@ class Connection(object):
 
         policy = ClientCertPolicy(trustRoot=self.trustRoot,
                                   client_cert=client_cert)
+        # Note: we do not share self.pool here. The pool keys connections on
+        # scheme/host/port alone, so it could hand us a connection that did
+        # not present our client certificate.
         return Agent(reactor, policy)
 
     def _ssl_login(self):
@@ -477,6 +902,7 @@ class Connection(object):
 
         :returns: deferred that when fired returns a dict from sslLogin
         """
+        import treq
         method = treq.post
         agent = self._ssl_agent()
         return self._request_login(method, agent=agent)
@@ -493,6 +919,8 @@ class Connection(object):
 
         :returns: deferred that when fired returns a dict from sslLogin
         """
+        from twisted.web.client import ResponseFailed
+        from txkoji.query_factory import KojiQueryFactory
         url = self.url + '/ssllogin'
         # Build the XML-RPC HTTP request body by hand and send it with
         # treq.
@@ -513,17 +941,64 @@ class Connection(object):
             result = xmlrpc.client.loads(content)[0][0]
         defer.returnValue(result)
 
-    def _munchify_callback(self, value):
+    def _convert(self, method, value, mode=None):
         """
-        Fires when we get information back from the XML-RPC server.
+        Convert an RPC's plain result with its registered converter.
 
-        This is a generic callback for when we do not want to post-process the
-        XML-RPC server's data further.
+        :param method: ``str``, XML-RPC method name, eg. "getBuild".
+        :param value: plain data from the XML-RPC server.
+        :param mode: result mode, or None for this connection's result_mode.
+        :returns: the converted value (see txkoji.converters).
+        """
+        if mode is None:
+            mode = self.result_mode
+        return converter_for(method)(self, value, mode)
+
+    def _wrap(self, type_, value, mode=None):
+        """
+        Build a rich object (eg. a Task) for this connection.
+
+        :param type_: rich item class, eg. Build or Task.
+        :param value: ``dict`` of plain data from the XML-RPC server, or None.
+        :param mode: result mode, or None for this connection's result_mode.
+        :returns: an instance of type_ (or its compact record), or None
+        """
+        if mode is None:
+            mode = self.result_mode
+        if mode == COMPACT and value is not None:
+            record = self._record_type(type_)
+            if record is not None:
+                return record(value)
+        item = wrap(type_, value, mode)
+        if item is not None:
+            item.connection = self
+        return item
+
+    def _package_id(self, package):
+        """
+        Find the ID number for a package.
+
+        :param package: ``int`` (packageID) or ``str`` (package name).
+        :returns: deferred that when fired returns the ``int`` package ID, or
+                  None if there is no such package.
+        """
+        if isinstance(package, int):
+            return defer.succeed(package)
+        d = self.getPackage(package, result_mode=RAW)
+        d.addCallback(lambda package_data: package_data and package_data.id)
+        return d
+
+    def _record_type(self, type_):
+        """
+        Return the compact record class for this type, for this connection.
 
-        :param value: dict of data from XML-RPC server.
-        :returns: ``Munch`` (dict-like) object
+        :param type_: rich item class, eg. Build or Task.
+        :returns: a txkoji.records.Record subclass, or None if we have no
+                  compact version of type_.
         """
-        return munchify(value)
+        if type_ not in self._record_types:
+            self._record_types[type_] = record_type(type_, self)
+        return self._record_types[type_]
 
     def _parse_errback(self, error):
         """
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from txkoji.build import Build
+from txkoji.channel import Channel
+from txkoji.package import Package
+from txkoji.results import convert
+from txkoji.task import Task
+
+
+"""
+Registry of how to convert each RPC method's result.
+
+Connection.call(), the typed Connection helpers (eg. getBuild()) and
+MultiCall all look up each method's converter here, so every path returns
+the same rich objects for the same RPC.
+
+A converter is a function that takes (connection, value, mode) arguments
+and returns the converted value. Methods that are not in the registry use
+plain(), which converts according to the result mode.
+
+To teach txkoji about another method, register it:
+
+    from txkoji.converters import register, rich
+
+    register('getLatestBuild', rich(Build))
+"""
+
+
+def plain(connection, value, mode):
+    """ Convert a result according to the result mode only. """
+    return convert(value, mode)
+
+
+def rich(type_):
+    """
+    Make a converter for methods that return one dict, or a list of dicts,
+    that describe a type_ (eg. Build).
+
+    :param type_: rich item class, eg. Build or Task.
+    :returns: converter function
+    """
+    def converter(connection, value, mode):
+        if isinstance(value, dict):
+            return connection._wrap(type_, value, mode)
+        if isinstance(value, list):
+            return [converter(connection, item, mode) for item in value]
+        return convert(value, mode)
+    converter.type_ = type_
+    return converter
+
+
+def duration(connection, value, mode):
+    """ Convert a number of seconds into a timedelta. """
+    if value is None:
+        return None
+    return timedelta(seconds=value)
+
+
+def descendents(connection, value, mode):
+    """
+    Convert getTaskDescendents' dict of {parent id: [task dicts]}.
+    """
+    if value is None:
+        return None
+    return dict((parent_id, [connection._wrap(Task, task, mode)
+                             for task in tasks])
+                for (parent_id, tasks) in value.items())
+
+
+# method name -> converter
+CONVERTERS = {
+    'getAverageBuildDuration': duration,
+    'getBuild': rich(Build),
+    'getLatestBuilds': rich(Build),
+    'listBuilds': rich(Build),
+    'listTagged': rich(Build),
+    'getChannel': rich(Channel),
+    'listChannels': rich(Channel),
+    'getPackage': rich(Package),
+    'listPackages': rich(Package),
+    'getTaskInfo': rich(Task),
+    'getTaskChildren': rich(Task),
+    'listTasks': rich(Task),
+    'getTaskDescendents': descendents,
+}
+
+
+def register(method, converter):
+    """
+    Set the converter for an RPC method.
+
+    :param method: ``str``, XML-RPC method name, eg. "getLatestBuild".
+    :param converter: function that takes (connection, value, mode)
+                      arguments, eg. rich(Build).
+    """
+    CONVERTERS[method] = converter
+
+
+def converter_for(method):
+    """
+    Find the converter for an RPC method.
+
+    :returns: converter function. plain() if we have none registered.
+    """
+    return CONVERTERS.get(method, plain)
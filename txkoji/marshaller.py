@@ -1,12 +1,16 @@
 from twisted.python.compat import long
 try:
+    from xmlrpc.client import ExpatParser
     from xmlrpc.client import Marshaller
     from xmlrpc.client import MAXINT
     from xmlrpc.client import MININT
+    from xmlrpc.client import Unmarshaller
 except ImportError:
+    from xmlrpclib import ExpatParser
     from xmlrpclib import MAXINT
     from xmlrpclib import MININT
     from xmlrpclib import Marshaller
+    from xmlrpclib import Unmarshaller
 
 
 class KojiMarshaller(Marshaller):
@@ -29,3 +33,51 @@ class KojiMarshaller(Marshaller):
 
     dispatch[int] = dump_int
     dispatch[long] = dump_int
+
+
+class StreamingUnmarshaller(Unmarshaller):
+    """
+    XML-RPC Unmarshaller that can hand off array elements as it parses them.
+
+    If the response's value is an array, and you pass an on_item callback,
+    we call on_item with each element of that array as soon as we have
+    parsed the element. We do not keep the elements, so the final result is
+    an empty list.
+
+    Koji's list* methods return large arrays, so this keeps us from holding
+    the entire response in memory at once.
+    """
+    def __init__(self, on_item=None, use_datetime=False):
+        Unmarshaller.__init__(self, use_datetime=use_datetime)
+        self.on_item = on_item
+        self._top_array = False
+
+    def start(self, tag, attrs):
+        if tag == 'array' and not self._marks and not self._stack:
+            self._top_array = self.on_item is not None
+        Unmarshaller.start(self, tag, attrs)
+
+    def end(self, tag):
+        result = Unmarshaller.end(self, tag)
+        # An element of the top-level array is complete when we close its
+        # <value> and the top-level array is the only open container.
+        if self._top_array and tag == 'value' and len(self._marks) == 1:
+            self.on_item(self._stack.pop())
+        return result
+
+
+def getparser(on_item=None, use_datetime=False):
+    """
+    Return an incremental XML-RPC parser and its unmarshaller.
+
+    Feed the response bytes to the parser as they arrive. When the response
+    is complete, close the parser and then close the unmarshaller to get the
+    result.
+
+    :param on_item: optional function to call with each element of a
+                    top-level array. See StreamingUnmarshaller.
+    :returns: two-tuple of (parser, unmarshaller)
+    """
+    unmarshaller = StreamingUnmarshaller(on_item, use_datetime)
+    parser = ExpatParser(unmarshaller)
+    return (parser, unmarshaller)
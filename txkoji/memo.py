@@ -0,0 +1,96 @@
+import functools
+from munch import Munch
+
+
+"""
+Compute derived properties once per object.
+
+Properties like Task.params or Task.package parse the same data every time
+we access them. A memoized_property stores its value the first time we
+compute it, and MemoMunch forgets all the stored values whenever its data
+changes.
+"""
+
+
+def _memo(obj):
+    """
+    Return the dict of stored property values for this object.
+    """
+    try:
+        memo = obj._memo
+    except AttributeError:
+        # An unset slot, eg. on a txkoji.records.Record.
+        memo = None
+    if memo is None:
+        memo = {}
+        # Bypass Munch.__setattr__, which would store this as a dict key.
+        object.__setattr__(obj, '_memo', memo)
+    return memo
+
+
+def memoized_property(f):
+    """
+    Like @property, but compute the value only once.
+
+    If the getter raises an exception, we do not store anything, and the
+    next access tries again.
+
+    Note that callers share the stored value. Do not modify mutable values
+    (like Task.params) in place.
+    """
+    name = f.__name__
+
+    @functools.wraps(f)
+    def getter(self):
+        memo = _memo(self)
+        try:
+            return memo[name]
+        except KeyError:
+            value = f(self)
+            memo[name] = value
+            return value
+    return property(getter)
+
+
+class MemoMunch(Munch):
+    """
+    Munch that discards its memoized property values when its data changes.
+
+    Munch's attribute access and setdefault() go through __setitem__ and
+    __delitem__. We override update() to copy the data in C, because
+    munchify() and __init__() fill every new object (and every nested dict)
+    with update(), and one Python-level __setitem__ call per key made
+    construction much slower.
+    """
+    # Stored property values, or None. A class attribute keeps the lookup in
+    # _forget() cheap until we memoize something.
+    _memo = None
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._forget()
+
+    def __setitem__(self, key, value):
+        super(MemoMunch, self).__setitem__(key, value)
+        self._forget()
+
+    def __delitem__(self, key):
+        super(MemoMunch, self).__delitem__(key)
+        self._forget()
+
+    def pop(self, *args):
+        self._forget()
+        return super(MemoMunch, self).pop(*args)
+
+    def popitem(self):
+        self._forget()
+        return super(MemoMunch, self).popitem()
+
+    def clear(self):
+        super(MemoMunch, self).clear()
+        self._forget()
+
+    def _forget(self):
+        if self._memo is not None:
+            # Bypass Munch.__setattr__, which would store this as a dict key.
+            object.__setattr__(self, '_memo', None)
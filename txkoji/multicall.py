@@ -1,26 +1,57 @@
-from datetime import timedelta
-from munch import Munch
+from twisted.internet import defer
+from twisted.python.failure import Failure
 from txkoji.call import Call
+from txkoji.converters import converter_for
 from txkoji.exceptions import KojiException
-from txkoji.build import Build
-from txkoji.channel import Channel
-from txkoji.task import Task
-from txkoji.package import Package
+from txkoji.marshaller import KojiMarshaller
 try:
     from xmlrpc.client import MultiCallIterator
 except ImportError:
     # Python 2
     from xmlrpclib import MultiCallIterator
 
+# Default maximum number of calls in one system.multicall RPC.
+MAX_CALLS = 500
+
+# Default number of system.multicall RPCs we send at the same time.
+CONCURRENCY = 4
+
 
 class MultiCall(object):
     """
     Callable abstract class representing a series of Koji RPCs.
 
+    If we have more calls than max_calls (or more than max_bytes of XML),
+    we split them into several system.multicall RPCs and send up to
+    concurrency of those at a time. Smaller RPCs avoid hub timeouts, and if
+    one RPC fails, we only lose the results for the calls in that RPC.
+
+    With a sizer (see txkoji.sizing.BatchSizer), we also fill each RPC only
+    up to the sizer's target latency and request size, and we tell the
+    sizer how long each RPC took.
+
     :param connection: ``txkoji.Connection``
+    :param priority: ``int``, optional queue priority for this multicall,
+                     eg. txkoji.scheduler.BACKGROUND. The default (None) uses
+                     the connection's priority.
+    :param max_calls: ``int``, maximum number of calls in one RPC, or None
+                      for no limit.
+    :param max_bytes: ``int``, optional maximum size of the XML-RPC
+                      parameters in one RPC. We estimate the size of each
+                      call (see estimator()), and we never split one call,
+                      so an RPC can exceed this slightly, or by more if a
+                      single call does.
+    :param concurrency: ``int``, maximum number of RPCs in flight.
+    :param sizer: optional txkoji.sizing.BatchSizer.
     """
-    def __init__(self, connection):
+    def __init__(self, connection, priority=None, max_calls=MAX_CALLS,
+                 max_bytes=None, concurrency=CONCURRENCY, sizer=None):
         self.connection = connection
+        self.priority = priority
+        self.max_calls = max_calls
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        self.sizer = sizer
         self.calls = []
 
     def __getattr__(self, name):
@@ -28,19 +59,156 @@ class MultiCall(object):
 
     def __call__(self):
         """
-        Send the all our individual calls to the the server as a single
-        "system.multicall" RPC.
+        Send the all our individual calls to the the server in
+        "system.multicall" RPCs.
 
         Resets the list of stored calls.
         :returns: deferred that when fired returns an iterator for results,
-                  one for each call. The results will either be Munch objects,
-                  or else raise exceptions.
+                  one for each call, in the order we added them. The results
+                  will either be Munch objects (see txkoji.Connection's
+                  result_mode), or else raise exceptions. If one RPC failed,
+                  each of its calls raises that RPC's error. If every RPC
+                  failed, the deferred fails with the first RPC's error.
         """
-        d = self.connection.call('system.multicall', self.calls)
-        d.addCallback(self._multicall_callback, self.calls)
+        calls = self.calls
         self.calls = []
+        chunks = self.chunks(calls)
+        if len(chunks) == 1:
+            d = self._send(chunks[0])
+        else:
+            semaphore = defer.DeferredSemaphore(self.concurrency)
+            deferreds = [semaphore.run(self._send, chunk) for chunk in chunks]
+            # Keep the other chunks' results if one fails.
+            d = defer.DeferredList(deferreds, consumeErrors=True)
+            d.addCallback(self._stitch, chunks)
+        d.addCallback(self._multicall_callback, calls)
         return d
 
+    def chunks(self, calls):
+        """
+        Split a list of calls into the lists we send in each RPC.
+
+        :param calls: list of call payloads
+        :returns: list of lists of call payloads
+        """
+        sizer = self.sizer
+        max_bytes = self.max_bytes
+        if max_bytes is None and sizer is not None:
+            max_bytes = sizer.max_bytes
+        if max_bytes is None and sizer is None:
+            if not self.max_calls:
+                return [calls]
+            return [calls[i:i + self.max_calls]
+                    for i in range(0, len(calls), self.max_calls)] or [[]]
+        estimate = self.estimator()
+        chunks = []
+        chunk = []
+        size = 0
+        load = 0.0
+        for payload in calls:
+            payload_size = 0
+            if max_bytes is not None:
+                payload_size = estimate(payload)
+            share = 0.0
+            if sizer is not None:
+                share = sizer.share(payload['methodName'])
+            full = (self.max_calls and len(chunk) >= self.max_calls) or \
+                (max_bytes is not None and
+                 size + payload_size > max_bytes) or \
+                (sizer is not None and sizer.full(load + share))
+            if chunk and full:
+                chunks.append(chunk)
+                chunk = []
+                size = 0
+                load = 0.0
+            chunk.append(payload)
+            size += payload_size
+            load += share
+        chunks.append(chunk)
+        return chunks
+
+    def estimator(self):
+        """
+        Return a function that estimates the XML size of one call payload.
+
+        Marshalling every call just to measure it costs about as much as
+        building the real request, on the reactor thread. Instead we marshal
+        the first call of each method, and scale the other calls of that
+        method by the length of their params' repr(), which is much cheaper.
+
+        We never estimate a call smaller than the first call of its method,
+        and scaling the whole XML (including its fixed overhead) by the repr()
+        length errs large, so this rarely underestimates calls with params
+        of the same shape.
+        """
+        marshaller = KojiMarshaller('utf-8', allow_none=True)
+        # method name -> (XML size, repr() length) of the first call
+        samples = {}
+
+        def estimate(payload):
+            method = payload['methodName']
+            length = len(repr(payload['params'])) or 1
+            sample = samples.get(method)
+            if sample is None:
+                size = len(marshaller.dumps([payload]))
+                samples[method] = (size, length)
+                return size
+            (size, sample_length) = sample
+            if length <= sample_length:
+                return size
+            return size * length // sample_length
+        return estimate
+
+    def _send(self, calls):
+        """ Send one system.multicall RPC. """
+        if self.sizer is None:
+            return self.connection._submit('system.multicall', (calls,),
+                                           self.priority)
+        methods = [payload['methodName'] for payload in calls]
+        # The time the scheduler sent the RPC. Time spent waiting in the
+        # scheduler's queue says nothing about the cost of these methods.
+        started = []
+        d = self.connection._submit(
+            'system.multicall', (calls,), self.priority,
+            on_start=lambda: started.append(self.sizer.clock.seconds()))
+        d.addCallbacks(self._observe, self._failed,
+                       callbackArgs=(methods, started),
+                       errbackArgs=(methods,))
+        return d
+
+    def _observe(self, result, methods, started):
+        """
+        Tell our sizer how long this RPC took, from the time the scheduler
+        sent it.
+        """
+        latency = self.sizer.clock.seconds() - started[0]
+        self.sizer.observe(methods, latency)
+        return result
+
+    def _failed(self, failure, methods):
+        self.sizer.failed(methods)
+        return failure
+
+    def _stitch(self, responses, chunks):
+        """
+        Join the responses from several RPCs into one list of results.
+
+        :param responses: list of (success, result list or Failure) tuples
+                          from DeferredList, one per chunk.
+        :param chunks: list of lists of calls that we sent.
+        :returns: list of results, with a Failure for each call in a failed
+                  RPC, or the first Failure if every RPC failed.
+        """
+        if not any(success for (success, _) in responses):
+            return responses[0][1]
+        values = []
+        for ((success, response), chunk) in zip(responses, chunks):
+            if success:
+                values.extend(response)
+            else:
+                values.extend([response] * len(chunk))
+        return values
+
     def call(self, name, *args, **kwargs):
         """
         Add a new call to the list that we will submit to the server.
@@ -80,44 +248,42 @@ class KojiMultiCallIterator(MultiCallIterator):
     An XML-RPC MultiCall iterator with some extra features for txkoji.
 
     The differences from stdlib version:
-    1. Handle Munch data types, since txkoji.Connection.call() returns these.
-    2. Inject the txkoji.Connection into each Munch value we return.
-    2. Raise KojiExceptions for all XML-RPC faults.
+    1. Convert values with the same registered converters as
+       txkoji.Connection.call() (see txkoji.converters).
+    2. Inject the txkoji.Connection into each rich value we return.
+    3. Raise KojiExceptions for all XML-RPC faults.
     """
     def __getitem__(self, i):
+        value = self.value(i)
+        method_name = self.calls[i]['methodName']
+        return self.rich_item(method_name, value)
+
+    def value(self, i):
+        """
+        Return the plain result for one call, without rich item conversion.
+
+        :param i: ``int``, index of the call in this multicall.
+        :returns: the plain (unconverted) value for this call.
+        :raises: KojiException if this call failed.
+        """
         result = self.results[i]
-        call = self.calls[i]
         # If it's a list, then this particular call succeeded. Return the
         # result.
         if isinstance(result, list):
-            method_name = call['methodName']
-            value = result[0]
-            return self.rich_item(method_name, value)
+            return result[0]
+        # If we split the multicall, and this call's RPC failed, raise that
+        # RPC's error.
+        if isinstance(result, Failure):
+            result.raiseException()
         # If it's not a list, it must be a fault.
         fault_string = result['faultString']
         # We know Koji's functioning here enough to return a response, so
         # raise a nice KojiException instead of the xmlrpc.client.Fault:
         raise KojiException(fault_string)
 
-    # TODO: need to generalize this rich item converstion logic so we use the
-    # same logic in txkoji.Connection for single RPCs.
     def rich_item(self, method_name, value):
         """
         Convert this value into the rich txkoji objects (if applicable)
         """
-        if value is None:
-            return None
-        if method_name == 'getAverageBuildDuration':
-            return timedelta(seconds=value)
-        types = (Build, Channel, Package, Task)
-        if isinstance(value, Munch):
-            for type_ in types:
-                if type_.__name__ in method_name:
-                    item = type_(value)
-                    item.connection = self.connection
-                    return item
-        if isinstance(value, list):
-            # Do this same rich item conversion for list of Munch objects
-            items_list = [self.rich_item(method_name, val) for val in value]
-            return items_list
-        return value
+        converter = converter_for(method_name)
+        return converter(self.connection, value, self.connection.result_mode)
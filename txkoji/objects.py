@@ -0,0 +1,190 @@
+import json
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.python.compat import long, unicode
+from txkoji import build_states
+from txkoji import task_states
+from txkoji.cache import LRU, EVICT_INTERVAL
+
+
+"""
+Cache Koji builds and tasks that can no longer change.
+
+Once a build is COMPLETE, or a task is CLOSED, CANCELED or FAILED, the hub
+returns the same data for it forever. We keep these "final" payloads
+indefinitely, and we keep other payloads for a few seconds, so repeated
+calls like Build.task() or Build.target() do not re-fetch the same data.
+
+(Koji admins can delete a COMPLETE build. Call forget() if you need to see
+that.)
+"""
+
+# Default number of payloads we keep in memory.
+MEMORY_SIZE = 1024
+
+# Default time-to-live for payloads that can still change, in seconds.
+TTL = 5
+
+# Default maximum number of payloads we keep on disk, per profile.
+MAX_ENTRIES = 50000
+
+# We only cache payloads for keys of these types, eg. build IDs and NVRs.
+# Koji also accepts other arguments (like a buildInfo dict), which are not
+# hashable, and which we pass straight to the hub.
+KEY_TYPES = (int, long, str, unicode)
+
+
+def build_final(build):
+    """ Return True if this getBuild payload can no longer change. """
+    return build.get('state') == build_states.COMPLETE
+
+
+def task_final(task):
+    """ Return True if this getTaskInfo payload can no longer change. """
+    return task.get('state') in task_states.DONE_GROUP
+
+
+class ObjectCache(object):
+    """
+    Read-through cache for build and task payloads.
+
+    We store the plain XML-RPC data, and Connection wraps a new Build or Task
+    around it for each caller. Do not modify nested values (like a task's
+    "request" list) in place.
+
+    :param connection: txkoji.Connection
+    :param memory_size: ``int``, number of payloads to keep in memory.
+    :param ttl: ``int``, seconds to keep payloads that can still change. If
+                this is 0, we only cache final payloads.
+    :param backend: optional txkoji.cache_backends.Backend, to store final
+                    payloads on disk too. Use a separate backend (or
+                    directory) from the name cache, so the two do not evict
+                    each other's entries. We do this disk I/O in the name
+                    cache's thread pool.
+    :param max_entries: ``int``, maximum number of payloads to keep on disk
+                        for this profile.
+    """
+    clock = reactor
+
+    def __init__(self, connection, memory_size=MEMORY_SIZE, ttl=TTL,
+                 backend=None, max_entries=MAX_ENTRIES):
+        self.connection = connection
+        self.memory = LRU(memory_size)
+        self.ttl = ttl
+        self.backend = backend
+        self.max_entries = max_entries
+        self.writes = 0
+
+    def peek(self, type_, key):
+        """
+        Look up a payload in memory.
+
+        :param type_: ``str``, eg. "build" or "task"
+        :param key: the RPC's argument, eg. a build ID or NVR.
+        :returns: a (payload, final) tuple, or None if we have no current
+                  payload in memory.
+        """
+        if not isinstance(key, KEY_TYPES):
+            return None
+        entry = self.memory.get((type_, key))
+        if entry is None:
+            return None
+        (payload, expires) = entry
+        if expires is not None and expires <= self.clock.seconds():
+            self.memory.delete((type_, key))
+            return None
+        return (payload, expires is None)
+
+    def put(self, type_, key, payload, final):
+        """
+        Store a payload.
+
+        :param final: ``bool``, True if this payload can no longer change.
+                      We keep final payloads indefinitely (and write them to
+                      the backend), and others for ttl seconds.
+        """
+        if not isinstance(key, KEY_TYPES):
+            return
+        if final:
+            self.memory.put((type_, key), (payload, None))
+            if self.backend is not None:
+                self._write(type_, key, payload)
+        elif self.ttl:
+            expires = self.clock.seconds() + self.ttl
+            self.memory.put((type_, key), (payload, expires))
+
+    def forget(self, type_, key):
+        """
+        Discard a payload from memory (but not from the backend).
+        """
+        if isinstance(key, KEY_TYPES):
+            self.memory.delete((type_, key))
+
+    @defer.inlineCallbacks
+    def load(self, type_, key, fetch, is_final):
+        """
+        Return a cached payload, or fetch and store a new one.
+
+        :param type_: ``str``, eg. "build" or "task"
+        :param key: the RPC's argument, eg. a build ID or NVR.
+        :param fetch: function that returns a deferred that fires with the
+                      payload from the hub (or None).
+        :param is_final: function that takes a payload and returns True if
+                         the payload can no longer change.
+        :returns: deferred that when fired returns the payload, or None if
+                  the hub has no such object. We never cache None. If key is
+                  not an int or str, we always call fetch.
+        """
+        if not isinstance(key, KEY_TYPES):
+            payload = yield fetch()
+            defer.returnValue(payload)
+        entry = self.peek(type_, key)
+        if entry is not None:
+            defer.returnValue(entry[0])
+        if self.backend is not None:
+            payload = yield self._read(type_, key)
+            if payload is not None:
+                self.memory.put((type_, key), (payload, None))
+                defer.returnValue(payload)
+        payload = yield fetch()
+        if payload is not None:
+            self.put(type_, key, payload, is_final(payload))
+        defer.returnValue(payload)
+
+    def _read(self, type_, key):
+        """
+        Read a final payload from the backend, in a thread.
+
+        :returns: deferred that when fired returns the payload, or None.
+        """
+        profile = self.connection.profile
+        d = self.connection.cache._in_thread(self.backend.get, profile,
+                                             type_, key)
+        d.addCallback(lambda entry: None if entry is None
+                      else json.loads(entry[0]))
+        return d
+
+    def _write(self, type_, key, payload):
+        """
+        Write a final payload to the backend, in a thread.
+        """
+        profile = self.connection.profile
+        data = json.dumps(payload)
+        now = self.clock.seconds()
+        self.writes += 1
+        evict = self.writes % EVICT_INTERVAL == 0
+        return self.connection.cache._in_thread(self._store, profile, type_,
+                                                key, data, now, evict)
+
+    def _store(self, profile, type_, key, data, now, evict):
+        self.backend.put(profile, type_, key, data, now)
+        if evict:
+            self.backend.evict(profile, {}, self.max_entries, now)
+
+    def metrics(self):
+        """
+        Return a snapshot of this cache's in-memory counters.
+
+        :returns: ``dict`` of metric names and values.
+        """
+        return self.memory.metrics()
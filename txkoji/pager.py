@@ -0,0 +1,127 @@
+from twisted.internet import defer
+
+
+"""
+Fetch large Koji listings in pages.
+"""
+
+# Default number of items we request per page.
+PAGE_SIZE = 1000
+
+# Default number of pages we fetch at the same time in fetch_pages().
+CONCURRENCY = 4
+
+
+def stable_order(order, key):
+    """
+    Make a queryOpts "order" value stable for limit/offset paging.
+
+    If several rows have the same value for the caller's order fields, the
+    hub may return them in a different order for each query, so we could
+    skip or repeat rows between pages. Add a unique key as the last sort
+    field.
+
+    :param order: ``str``, eg. "priority,-create_time", or None.
+    :param key: ``str``, unique field name, eg. "id".
+    :returns: ``str``, eg. "priority,-create_time,id"
+    """
+    if not order:
+        return key
+    fields = [field.lstrip('-') for field in order.split(',')]
+    if key in fields:
+        return order
+    return '%s,%s' % (order, key)
+
+
+def fetch_pages(fetch, count, page_size=PAGE_SIZE, concurrency=CONCURRENCY):
+    """
+    Fetch a known number of items in concurrent pages.
+
+    :param fetch: function that takes (offset, limit) arguments and returns
+                  a deferred that fires with a list of items.
+    :param count: ``int``, total number of items, eg. from a countOnly query.
+    :param page_size: ``int``, number of items to request per page.
+    :param concurrency: ``int``, maximum number of pages in flight.
+    :returns: deferred that when fired returns a list of all the items, in
+              order. If any page fails, the deferred fails with that page's
+              error.
+    """
+    semaphore = defer.DeferredSemaphore(concurrency)
+    deferreds = [semaphore.run(fetch, offset, page_size)
+                 for offset in range(0, count, page_size)]
+    d = defer.gatherResults(deferreds, consumeErrors=True)
+    d.addCallback(lambda pages: [item for page in pages for item in page])
+    d.addErrback(_first_error)
+    return d
+
+
+def _first_error(failure):
+    """ Unwrap gatherResults' FirstError into the original failure. """
+    failure.trap(defer.FirstError)
+    return failure.value.subFailure
+
+
+class Pager(object):
+    """
+    Fetch a large listing in pages, prefetching the next page.
+
+    When a page arrives, we immediately request the following page, so the
+    hub works on that while the caller handles the current page. Only one
+    page is in flight at a time. A larger page_size means fewer round trips,
+    and a smaller page_size means less memory per page.
+
+    Example::
+
+        pager = koji.iterTasks({'state': [task_states.OPEN]})
+        while True:
+            tasks = yield pager.next()
+            if not tasks:
+                break
+            for task in tasks:
+                print(task.id)
+
+    :param fetch: function that takes (offset, limit) arguments and returns
+                  a deferred that fires with a list of items.
+    :param page_size: ``int``, number of items to request per page.
+    """
+    def __init__(self, fetch, page_size=PAGE_SIZE):
+        self.fetch = fetch
+        self.page_size = page_size
+        self.offset = 0
+        self.done = False
+        self._prefetched = None
+
+    def next(self):
+        """
+        Get the next page of items.
+
+        :returns: deferred that when fired returns a list of items. The list
+                  is empty when there are no more items.
+        """
+        if self._prefetched is not None:
+            d = self._prefetched
+            self._prefetched = None
+        elif self.done:
+            return defer.succeed([])
+        else:
+            d = self._fetch()
+        d.addCallback(self._prefetch)
+        return d
+
+    def _fetch(self):
+        offset = self.offset
+        self.offset += self.page_size
+        d = self.fetch(offset, self.page_size)
+        d.addCallback(self._fetched)
+        return d
+
+    def _fetched(self, items):
+        if len(items) < self.page_size:
+            # This was the last page.
+            self.done = True
+        return items
+
+    def _prefetch(self, items):
+        if not self.done and self._prefetched is None:
+            self._prefetched = self._fetch()
+        return items
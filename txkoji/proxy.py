@@ -1,8 +1,23 @@
+from base64 import b64encode
+from functools import partial
+import gzip
+from io import BytesIO
 from twisted.web.xmlrpc import Proxy
 from twisted.web.xmlrpc import QueryProtocol
+from twisted.web.client import Agent
+from twisted.web.client import ContentDecoderAgent
+from twisted.web.client import FileBodyProducer
+from twisted.web.client import GzipDecoder
+from twisted.web.client import ResponseDone
+from twisted.web.client import readBody
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
+from twisted.internet import defer
 from twisted.internet import error
-from twisted.internet import ssl
+from twisted.internet import protocol
 from twisted.python.compat import nativeString
+from txkoji.query_factory import KojiQueryFactory
+from txkoji.ssl import ResumingPolicyForHTTPS
 
 
 """
@@ -34,11 +49,49 @@ class ErrorCheckingQueryProtocol(QueryProtocol):
             self.factory.clientConnectionLost(None, reason)
         super(ErrorCheckingQueryProtocol, self).connectionLost(reason)
 
+    def handleResponsePart(self, data):
+        """
+        Parse the response body as it arrives, rather than buffering it.
+        """
+        feed = getattr(self.factory, 'feed', None)
+        if feed is None:
+            return QueryProtocol.handleResponsePart(self, data)
+        feed(data)
+
+
+class XMLRPCResponseProtocol(protocol.Protocol):
+    """
+    Pass an Agent's response body to a KojiQueryFactory as it arrives.
+
+    :param factory: KojiQueryFactory that parses the response.
+    :param finished: deferred to fire when the response body is complete.
+    """
+    def __init__(self, factory, finished):
+        self.factory = factory
+        self.finished = finished
+
+    def dataReceived(self, data):
+        self.factory.feed(data)
+
+    def connectionLost(self, reason):
+        if reason.check(ResponseDone, PotentialDataLoss):
+            self.factory.parseResponse(b'')
+        else:
+            self.factory.clientConnectionLost(None, reason)
+        self.finished.callback(None)
+
 
 class TrustedProxy(Proxy, object):
     """
     twisted.web.xmlrpc.Proxy subclass that can do SSL verification
     """
+    queryFactory = KojiQueryFactory
+
+    # Optional function to call with (method, args, number of response
+    # bytes) after each successful call. We count the bytes after any gzip
+    # decoding, as we parse them.
+    onResponse = None
+
     def __init__(self, *args, **kwargs):
         """
         This constructor takes a new "trustRoot" kwarg. We pass this
@@ -50,19 +103,83 @@ class TrustedProxy(Proxy, object):
             ssl.Certificate.loadPEM() here. If you set trustRoot to None (the
             default), we use the result of ssl.platformTrust(), which means we
             validate the connection against the system-wide CA bundle.
+
+        It also takes an optional "pool" kwarg.
+
+        :param HTTPConnectionPool pool:
+            If you set this, we send every XML-RPC call through a
+            twisted.web.client.Agent with this pool, so we re-use persistent
+            HTTP/1.1 connections to the hub instead of opening a new TCP (and
+            TLS) connection for every call. If you set pool to None (the
+            default), we open a new connection for each call.
+
+        The following kwargs only apply when you set a pool:
+
+        :param bool acceptGzip:
+            Ask the hub to gzip its responses, and decompress them as they
+            arrive. Defaults to True.
+        :param int compressThreshold:
+            If you set this, we gzip any request body larger than this many
+            bytes (for example, a large system.multicall). Your hub's web
+            server must be able to decompress request bodies (for example,
+            with Apache's "SetInputFilter DEFLATE"). If you set this to None
+            (the default), we never compress requests.
         """
         trustRoot = kwargs.pop('trustRoot', None)
         self.trustRoot = trustRoot
+        # Build one TLS context for this proxy, rather than one per call.
+        self.policy = ResumingPolicyForHTTPS(trustRoot=trustRoot)
+        self.pool = kwargs.pop('pool', None)
+        self.acceptGzip = kwargs.pop('acceptGzip', True)
+        self.compressThreshold = kwargs.pop('compressThreshold', None)
+        self._agent = None
         # Update our QueryProtocol to raise ssl.SSL.Error rather than skipping
         # it:
         self.queryFactory.protocol = ErrorCheckingQueryProtocol
         super(TrustedProxy, self).__init__(*args, **kwargs)
 
+    @property
+    def agent(self):
+        """
+        Twisted Agent that sends XML-RPC requests with our connection pool.
+        """
+        if self._agent is None:
+            agent = Agent(self._reactor, self.policy,
+                          connectTimeout=self.connectTimeout,
+                          pool=self.pool)
+            if self.acceptGzip:
+                agent = ContentDecoderAgent(agent, [(b'gzip', GzipDecoder)])
+            self._agent = agent
+        return self._agent
+
+    @property
+    def url(self):
+        """
+        Full URL (bytes) of the XML-RPC endpoint, including the current path.
+        """
+        scheme = b'https' if self.secure else b'http'
+        netloc = self.host
+        if self.port:
+            netloc += b':%d' % self.port
+        return scheme + b'://' + netloc + self.path
+
     def callRemote(self, method, *args):
-        if not self.secure:
-            # Parent behavior is fine
-            # (Will this work on our old-style class on py2?)
-            return super(TrustedProxy, self).callRemote(method, *args)
+        return self.streamRemote(None, method, *args)
+
+    def streamRemote(self, onItem, method, *args):
+        """
+        Like callRemote(), but hand off each element of the result as we
+        parse it.
+
+        :param onItem: function to call with each element of the response's
+                       top-level array, as soon as we parse that element. If
+                       this is None, we behave exactly like callRemote().
+        :returns: deferred that fires when the response is complete. If you
+                  passed onItem and the response was an array, the result is
+                  an empty list.
+        """
+        if self.pool is not None:
+            return self._callRemotePooled(onItem, method, *args)
 
         # Copying the rest from the Proxy class in Twisted's xmlrpc.py here:
 
@@ -70,17 +187,96 @@ class TrustedProxy(Proxy, object):
             factory.deferred = None
             connector.disconnect()
 
-        factory = self.queryFactory(
-            self.path, self.host, method, self.user,
-            self.password, self.allowNone, args, cancel, self.useDateTime)
+        factory = self._queryFactory(method, args, cancel, onItem)
 
-        contextFactory = ssl.optionsForClientTLS(
-            hostname=nativeString(self.host),
-            trustRoot=self.trustRoot)
+        if not self.secure:
+            connector = self._reactor.connectTCP(
+                nativeString(self.host), self.port or 80,
+                factory, timeout=self.connectTimeout)
+            return factory.deferred
+
+        port = self.port or 443
+        contextFactory = self.policy.creatorForNetloc(self.host, port)
 
         connector = self._reactor.connectSSL(
-            nativeString(self.host), self.port or 443,
+            nativeString(self.host), port,
             factory, contextFactory,
             timeout=self.connectTimeout)
 
         return factory.deferred
+
+    def _queryFactory(self, method, args, canceller, onItem):
+        """ Create a new queryFactory instance for this call. """
+        factory = self.queryFactory(
+            self.path, self.host, method, self.user,
+            self.password, self.allowNone, args, canceller, self.useDateTime)
+        if onItem is not None:
+            factory.onItem = onItem
+        if self.onResponse is not None:
+            factory.onResponse = partial(self.onResponse, method, args)
+        return factory
+
+    def _callRemotePooled(self, onItem, method, *args):
+        """
+        Send this XML-RPC call over a (possibly re-used) pooled connection.
+
+        We still use our queryFactory to build the payload and to parse the
+        response, so the results and errors are the same as callRemote()
+        without a pool.
+        """
+        def cancel(d):
+            factory.deferred = None
+            request.cancel()
+
+        factory = self._queryFactory(method, args, cancel, onItem)
+
+        headers = Headers({
+            b'User-Agent': [b'Twisted/XMLRPClib'],
+            b'Content-Type': [b'text/xml; charset=utf-8'],
+        })
+        if self.user:
+            auth = b':'.join([self.user, self.password])
+            headers.addRawHeader(b'Authorization', b'Basic ' + b64encode(auth))
+        payload = factory.payload
+        if self.compressThreshold is not None and \
+                len(payload) > self.compressThreshold:
+            payload = gzip.compress(payload, compresslevel=6)
+            headers.addRawHeader(b'Content-Encoding', b'gzip')
+        body = FileBodyProducer(BytesIO(payload))
+
+        # The request can fire (and clear factory.deferred) synchronously.
+        d = factory.deferred
+        request = self.agent.request(b'POST', self.url, headers, body)
+        request.addCallback(self._handleResponse, factory)
+        request.addErrback(self._handleFailure, factory)
+        return d
+
+    def _handleResponse(self, response, factory):
+        """
+        Pass an HTTP response body to our queryFactory as it arrives.
+
+        We always read the entire body, even for HTTP errors. This returns the
+        connection to the pool for re-use.
+        """
+        if response.code != 200:
+            status = b'%d' % response.code
+            d = readBody(response)
+            d.addCallback(self._badStatus, factory, status, response.phrase)
+            return d
+
+        def cancel(d):
+            abort = getattr(body.transport, 'abortConnection', None)
+            if abort is not None:
+                abort()
+
+        finished = defer.Deferred(cancel)
+        body = XMLRPCResponseProtocol(factory, finished)
+        response.deliverBody(body)
+        return finished
+
+    def _badStatus(self, _, factory, status, message):
+        if factory.deferred is not None:
+            factory.badStatus(status, message)
+
+    def _handleFailure(self, failure, factory):
+        factory.clientConnectionFailed(None, failure)
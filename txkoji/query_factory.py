@@ -1,7 +1,9 @@
 from twisted.web.xmlrpc import payloadTemplate
 from twisted.python.compat import unicode
 from twisted.internet import defer
+from twisted.python import failure
 from txkoji.marshaller import KojiMarshaller
+from txkoji.marshaller import getparser
 try:
     from twisted.web.xmlrpc import QueryFactory
 except ImportError:
@@ -10,6 +12,20 @@ except ImportError:
 
 
 class KojiQueryFactory(QueryFactory):
+
+    # Optional function to call with each element of the response array as
+    # soon as we parse it. See txkoji.marshaller.StreamingUnmarshaller.
+    onItem = None
+
+    # Optional function to call with the number of response bytes we parsed,
+    # once we have parsed the whole response successfully.
+    onResponse = None
+
+    # Number of response bytes we have parsed so far.
+    received = 0
+
+    _parser = None
+
     def __init__(self, path, host, method, user=None, password=None,
                  allowNone=True, args=(), canceller=None, useDateTime=False):
         """
@@ -28,7 +44,47 @@ class KojiQueryFactory(QueryFactory):
         # Debug the client's XML-RPC payload:
         # print(self.payload)
 
-    # def parseResponse(self, contents):
-    #     """ Debugging: print the server's response to STDOUT. """
-    #     print(contents)
-    #     return _QueryFactory.parseResponse(self, contents)
+    def feed(self, data):
+        """
+        Parse the next chunk of the server's response.
+
+        Our protocols call this as the response body arrives, so we parse the
+        response incrementally instead of buffering all of it and parsing it
+        at the end.
+        """
+        if not self.deferred:
+            return
+        if self._parser is None:
+            self._parser = getparser(self.onItem, self.useDateTime)
+        self.received += len(data)
+        try:
+            self._parser[0].feed(data)
+        except BaseException:
+            deferred, self.deferred = self.deferred, None
+            deferred.errback(failure.Failure())
+
+    def parseResponse(self, contents):
+        """
+        Finish parsing the server's response, and fire our deferred.
+
+        :param contents: the remaining response bytes that we have not yet
+                         passed to feed(). This can be empty.
+        """
+        if contents:
+            self.feed(contents)
+        if not self.deferred:
+            return
+        if self._parser is None:
+            self._parser = getparser(self.onItem, self.useDateTime)
+        (parser, unmarshaller) = self._parser
+        try:
+            parser.close()
+            response = unmarshaller.close()[0]
+        except BaseException:
+            deferred, self.deferred = self.deferred, None
+            deferred.errback(failure.Failure())
+        else:
+            deferred, self.deferred = self.deferred, None
+            if self.onResponse is not None:
+                self.onResponse(self.received)
+            deferred.callback(response)
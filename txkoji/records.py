@@ -0,0 +1,162 @@
+from txkoji.build import Build
+from txkoji.task import Task
+try:
+    from sys import intern
+except ImportError:
+    # Python 2
+    pass
+
+
+"""
+Compact, read-only records for bulk listings.
+
+A Task or Build is a Munch, a full dict per object. When we hold hundreds of
+thousands of them (for example the results of a large listTasks query), the
+dicts dominate our memory use. A record instead stores its values in a
+tuple, and all the records with the same keys share one index of key names.
+Records intern repeated string values (method names, arches, owner names),
+and they share the connection reference through their class.
+
+Records have all the same properties and methods as the rich classes they
+mirror, so "record.package" or "record.estimate_completion()" work the same
+way.
+"""
+
+# Key names -> dict of {key name: position in the values tuple}
+_shapes = {}
+
+
+def _shape(keys):
+    """
+    Return the shared index for this tuple of key names.
+    """
+    index = _shapes.get(keys)
+    if index is None:
+        index = dict((intern(key), i) for (i, key) in enumerate(keys))
+        _shapes[keys] = index
+    return index
+
+
+class Record(object):
+    """
+    Base class for compact records.
+
+    :param data: ``dict`` from the XML-RPC server.
+    """
+    # _memo holds txkoji.memo.memoized_property values.
+    __slots__ = ('_index', '_values', '_memo')
+
+    # Subclasses for one txkoji.Connection override this.
+    connection = None
+
+    # Intern string values for these keys:
+    intern_keys = frozenset()
+
+    def __init__(self, data):
+        self._index = _shape(tuple(data))
+        intern_keys = self.intern_keys
+        self._values = tuple(
+            intern(value) if key in intern_keys and isinstance(value, str)
+            else value
+            for (key, value) in data.items())
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[self._index[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        return self._values[self._index[key]]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.toDict()
+        return self.toDict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.toDict())
+
+    def get(self, key, default=None):
+        if key not in self._index:
+            return default
+        return self[key]
+
+    def keys(self):
+        return sorted(self._index, key=self._index.get)
+
+    def items(self):
+        return list(zip(self.keys(), self._values))
+
+    def toDict(self):
+        """
+        Return a plain dict with this record's data.
+        """
+        return dict(self.items())
+
+
+def _borrow(cls, source):
+    """
+    Copy the properties and methods of a rich class onto a record class.
+    """
+    for (name, value) in vars(source).items():
+        if name.startswith('__') or name in vars(cls):
+            continue
+        setattr(cls, name, value)
+    return cls
+
+
+class TaskRecord(Record):
+    """ Compact version of txkoji.task.Task. """
+    __slots__ = ()
+    intern_keys = frozenset(['arch', 'label', 'method', 'owner_name'])
+
+
+class BuildRecord(Record):
+    """ Compact version of txkoji.build.Build. """
+    __slots__ = ()
+    intern_keys = frozenset(['cg_name', 'owner_name', 'package_name',
+                             'version', 'volume_name'])
+
+
+_borrow(TaskRecord, Task)
+_borrow(BuildRecord, Build)
+
+RECORD_TYPES = {
+    Task: TaskRecord,
+    Build: BuildRecord,
+}
+
+
+def record_type(type_, connection):
+    """
+    Create a record class for one connection.
+
+    All the records of this class share the connection reference.
+
+    :param type_: rich class, eg. txkoji.task.Task
+    :param connection: ``txkoji.Connection``
+    :returns: a Record subclass, or None if we have no compact version of
+              type_.
+    """
+    base = RECORD_TYPES.get(type_)
+    if base is None:
+        return None
+    attrs = {'__slots__': (), 'connection': connection}
+    return type(base.__name__, (base,), attrs)
@@ -0,0 +1,126 @@
+from munch import Munch, munchify
+
+
+"""
+Convert parsed XML-RPC data into the objects we return to callers.
+
+txkoji supports four result modes:
+
+* MUNCH (the default): recursively convert every dict into a Munch up front.
+
+* LAZY: wrap the top-level dict in a LazyMunch, which converts nested dicts
+  and lists only when you access them. This is much cheaper for large
+  responses when you only read a few fields.
+
+* RAW: return the dicts and lists exactly as the XML-RPC parser built them.
+
+* COMPACT: like RAW, except typed helpers (eg. listTasks) return compact
+  read-only records (see txkoji.records) instead of Munch objects.
+"""
+
+RAW = 'raw'
+LAZY = 'lazy'
+MUNCH = 'munch'
+COMPACT = 'compact'
+
+MODES = (RAW, LAZY, MUNCH, COMPACT)
+
+
+def _lazy(value):
+    """ Wrap a plain dict or list for lazy conversion. """
+    if type(value) is dict:
+        return LazyMunch(value)
+    if type(value) is list:
+        return LazyList(value)
+    return value
+
+
+class LazyMunch(Munch):
+    """
+    Munch that converts its nested dicts and lists on first access.
+
+    Accessing a value (with attribute access, [] or get()) converts it to a
+    LazyMunch or LazyList and stores the converted value, so we convert each
+    nested container at most once.
+    """
+    def __getitem__(self, key):
+        value = super(LazyMunch, self).__getitem__(key)
+        lazy = _lazy(value)
+        if lazy is not value:
+            dict.__setitem__(self, key, lazy)
+        return lazy
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+
+class LazyList(list):
+    """
+    List that converts its dict and list elements on first access.
+    """
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyList(list.__getitem__(self, index))
+        value = list.__getitem__(self, index)
+        lazy = _lazy(value)
+        if lazy is not value:
+            list.__setitem__(self, index, lazy)
+        return lazy
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+_lazy_types = {}
+
+
+def lazy_type(type_):
+    """
+    Return a lazily-converting subclass of a rich Munch class, eg. Task.
+
+    :param type_: Munch subclass, eg. txkoji.task.Task
+    :returns: subclass of type_ and LazyMunch.
+    """
+    if type_ not in _lazy_types:
+        name = 'Lazy%s' % type_.__name__
+        _lazy_types[type_] = type(name, (LazyMunch, type_), {})
+    return _lazy_types[type_]
+
+
+def convert(value, mode):
+    """
+    Convert a plain XML-RPC value according to a result mode.
+
+    :param value: parsed XML-RPC data (dicts, lists, and scalars)
+    :param mode: RAW, LAZY, MUNCH, or COMPACT
+    :returns: the converted value
+    """
+    if mode == MUNCH:
+        return munchify(value)
+    if mode == LAZY:
+        return _lazy(value)
+    return value
+
+
+def wrap(type_, value, mode):
+    """
+    Build a rich object (eg. a Task) directly from a parsed XML-RPC dict.
+
+    :param type_: Munch subclass, eg. txkoji.task.Task
+    :param value: ``dict`` from the XML-RPC parser, or None
+    :param mode: RAW, LAZY, MUNCH, or COMPACT. In RAW mode, the rich
+                 object's nested values remain plain dicts and lists. This
+                 method treats COMPACT like RAW, because compact records
+                 need a connection (see txkoji.records.record_type()).
+    :returns: an instance of type_ (or a lazy subclass), or None
+    """
+    if value is None:
+        return None
+    if mode == MUNCH:
+        return type_.fromDict(value)
+    if mode == LAZY:
+        return lazy_type(type_)(value)
+    return type_(value)
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+from twisted.internet import defer
+from twisted.internet import reactor
+
+
+"""
+Limit the number of RPCs in flight to a Koji hub.
+"""
+
+# Priorities. The scheduler starts lower numbers first.
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Default maximum number of RPCs we send to a hub at the same time.
+MAX_CONCURRENT = 10
+
+
+class Scheduler(object):
+    """
+    Queue outbound RPCs and send a bounded number of them at once.
+
+    Requests wait in a priority queue. Within one priority, the queue is
+    FIFO. For example, a user waiting on a chat bot response should use
+    INTERACTIVE priority, and a dashboard that refreshes estimates for
+    hundreds of tasks should use BACKGROUND priority.
+
+    :param max_concurrent: ``int``, maximum number of requests in flight.
+    """
+    clock = reactor
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.queue = []
+        self._counter = itertools.count()
+        self._dispatching = False
+        # Metrics:
+        self.dispatched = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self):
+        """ Number of requests waiting to start. """
+        return len(self.queue)
+
+    @property
+    def average_wait(self):
+        """ Average number of seconds requests waited in the queue. """
+        if not self.dispatched:
+            return 0.0
+        return self.total_wait / self.dispatched
+
+    def metrics(self):
+        """
+        Return a snapshot of this scheduler's metrics.
+
+        :returns: ``dict`` of metric names and values.
+        """
+        return {
+            'active': self.active,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'dispatched': self.dispatched,
+            'average_wait': self.average_wait,
+            'max_wait': self.max_wait,
+        }
+
+    def submit(self, priority, f, *args):
+        """
+        Queue a request, and start it when there is capacity.
+
+        :param priority: ``int``, eg. INTERACTIVE or BACKGROUND.
+        :param f: function that starts the request and returns a deferred.
+        :param *args: arguments to pass to f.
+        :returns: deferred that fires with the result of f.
+        """
+        d = defer.Deferred(self._cancel)
+        entry = [priority, next(self._counter), self.clock.seconds(), d, f,
+                 args]
+        heapq.heappush(self.queue, entry)
+        self._dispatch()
+        # Only count requests that are still waiting to start.
+        self.max_queue_depth = max(self.max_queue_depth, len(self.queue))
+        return d
+
+    def _dispatch(self):
+        """ Start queued requests until we reach max_concurrent. """
+        if self._dispatching:
+            # A request finished synchronously while we were starting it.
+            # The loop below will continue with the next request.
+            return
+        self._dispatching = True
+        try:
+            while self.queue and self.active < self.max_concurrent:
+                entry = heapq.heappop(self.queue)
+                (_, _, enqueued, d, f, args) = entry
+                wait = self.clock.seconds() - enqueued
+                self.dispatched += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.active += 1
+                result = defer.maybeDeferred(f, *args)
+                result.addBoth(self._finished)
+                result.chainDeferred(d)
+        finally:
+            self._dispatching = False
+
+    def _finished(self, result):
+        self.active -= 1
+        self._dispatch()
+        return result
+
+    def _cancel(self, d):
+        """ Remove a cancelled request from the queue (if it is queued). """
+        for entry in self.queue:
+            if entry[3] is d:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                return
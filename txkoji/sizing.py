@@ -0,0 +1,184 @@
+from twisted.internet import reactor
+
+
+"""
+Choose multicall batch sizes from observed latency and response sizes.
+
+A fixed batch size is never right for every method. Calls like
+getAverageBuildDuration are tiny, while listBuilds can return megabytes. A
+BatchSizer learns how many seconds, and how many response bytes, one call of
+each method costs. txkoji.multicall.MultiCall uses that to fill each
+system.multicall RPC up to a target latency and response size.
+"""
+
+# Default number of seconds we aim to spend on one system.multicall RPC.
+TARGET_LATENCY = 2.0
+
+# Until we have observed a method, assume this many calls fit in one RPC.
+INITIAL_CALLS = 100
+
+# Koji hubs reject requests larger than this (hub.conf MaxRequestLength).
+MAX_REQUEST_LENGTH = 4 * 1024 * 1024
+
+# Default maximum size of one response. We parse each response on the
+# reactor thread and hold all its results in memory at once.
+MAX_RESPONSE_LENGTH = 16 * 1024 * 1024
+
+# Weight of each new observation in our moving average of costs.
+ALPHA = 0.3
+
+# Allow for float rounding when we add up fractions of an RPC.
+EPSILON = 1e-9
+
+
+class BatchSizer(object):
+    """
+    Learn the per-call cost of each RPC method, and size batches to match.
+
+    After each RPC, observe() compares the RPC's latency with what we
+    predicted, and scales the costs of the methods in that RPC to match. We
+    keep an exponentially weighted moving average, so one slow response does
+    not swing the batch sizes too far.
+
+    Our connection also tells observe_size() how many bytes each response
+    had, and we learn the bytes per call of each method the same way.
+
+    :param target: ``float``, seconds we aim to spend on one RPC.
+    :param max_bytes: ``int``, maximum size of one request. The hub rejects
+                      larger requests.
+    :param max_response_bytes: ``int``, maximum size of one response.
+    :param initial_calls: ``int``, number of calls of an unknown method that
+                          we put in one RPC.
+    :param alpha: ``float``, weight of each new observation, 0 to 1.
+    """
+    clock = reactor
+
+    def __init__(self, target=TARGET_LATENCY, max_bytes=MAX_REQUEST_LENGTH,
+                 initial_calls=INITIAL_CALLS, alpha=ALPHA,
+                 max_response_bytes=MAX_RESPONSE_LENGTH):
+        self.target = target
+        self.max_bytes = max_bytes
+        self.max_response_bytes = max_response_bytes
+        self.default_cost = float(target) / initial_calls
+        self.alpha = alpha
+        # method name -> estimated seconds per call
+        self.costs = {}
+        # method name -> estimated response bytes per call
+        self.sizes = {}
+        # Metrics:
+        self.observations = 0
+        self.failures = 0
+        self.last_latency = None
+        self.last_size = None
+
+    def cost(self, method):
+        """
+        Estimate the number of seconds one call of this method takes.
+        """
+        return self.costs.get(method, self.default_cost)
+
+    def batch_size(self, method, max_calls=None):
+        """
+        Number of calls of this method that fit in one RPC.
+
+        :param max_calls: ``int``, optional upper limit.
+        :returns: ``int``, at least 1.
+        """
+        size = int(self.target / self.cost(method) + EPSILON)
+        response_size = self.sizes.get(method)
+        if response_size:
+            size = min(size, int(self.max_response_bytes / response_size +
+                                 EPSILON))
+        size = max(1, size)
+        if max_calls:
+            size = min(size, max_calls)
+        return size
+
+    def share(self, method):
+        """
+        Fraction of one RPC that one call of this method uses.
+
+        txkoji.multicall.MultiCall adds up these shares to fill each RPC,
+        so an RPC of one method holds exactly batch_size() calls.
+        """
+        return 1.0 / self.batch_size(method)
+
+    def full(self, load):
+        """
+        Return True if an RPC with this total share has no room left.
+        """
+        return load > 1 + EPSILON
+
+    def observe(self, methods, latency):
+        """
+        Learn from one RPC that succeeded.
+
+        :param methods: list of the method names of each call in this RPC.
+        :param latency: ``float``, seconds the RPC took.
+        """
+        self.observations += 1
+        self.last_latency = latency
+        predicted = sum(self.cost(method) for method in methods)
+        if not predicted:
+            return
+        self._scale(set(methods), latency / predicted)
+
+    def observe_size(self, methods, size):
+        """
+        Learn from one RPC's response size.
+
+        :param methods: list of the method names of each call in this RPC.
+        :param size: ``int``, number of bytes in the response.
+        """
+        self.last_size = size
+        if not methods:
+            return
+        # Until we know a method's size, assume an even share.
+        even = float(size) / len(methods)
+        predicted = sum(self.sizes.get(method, even) for method in methods)
+        if not predicted:
+            return
+        ratio = size / predicted
+        for method in set(methods):
+            old = self.sizes.get(method, even)
+            self.sizes[method] = (1 - self.alpha) * old + \
+                self.alpha * old * ratio
+
+    def failed(self, methods):
+        """
+        Learn from one RPC that failed (eg. a timeout). We halve the batch
+        sizes for these methods.
+
+        We double their costs directly, without the moving average, so one
+        failure really halves the next batch.
+        """
+        self.failures += 1
+        for method in set(methods):
+            self.costs[method] = self.cost(method) * 2
+
+    def _scale(self, methods, ratio):
+        for method in methods:
+            cost = self.cost(method)
+            self.costs[method] = (1 - self.alpha) * cost + \
+                self.alpha * cost * ratio
+
+    def metrics(self):
+        """
+        Return a snapshot of this sizer's decisions.
+
+        :returns: ``dict`` of metric names and values. "batch_sizes" is a
+                  dict of {method name: calls per RPC}, and
+                  "response_sizes" is a dict of {method name: estimated
+                  response bytes per call}.
+        """
+        methods = set(self.costs) | set(self.sizes)
+        return {
+            'target': self.target,
+            'observations': self.observations,
+            'failures': self.failures,
+            'last_latency': self.last_latency,
+            'last_size': self.last_size,
+            'batch_sizes': dict((method, self.batch_size(method))
+                                for method in methods),
+            'response_sizes': dict(self.sizes),
+        }
@@ -2,6 +2,7 @@ import os
 from twisted.internet.ssl import platformTrust
 from twisted.internet.ssl import optionsForClientTLS
 from twisted.internet._sslverify import IOpenSSLTrustRoot
+from twisted.internet.interfaces import IOpenSSLClientConnectionCreator
 from twisted.web.client import BrowserLikePolicyForHTTPS
 from zope.interface import implementer
 
@@ -39,6 +40,66 @@ class ClientCertPolicy(BrowserLikePolicyForHTTPS):
                                    clientCertificate=self.client_cert)
 
 
+class ResumingPolicyForHTTPS(BrowserLikePolicyForHTTPS):
+    """
+    SSL client policy that builds one TLS context per host and re-uses it.
+
+    BrowserLikePolicyForHTTPS creates a new context (and loads the CA
+    certificates again) for every new connection. This policy creates one
+    ResumingClientTLSOptions for each hostname and port, so we load the CA
+    certificates once, and new connections can resume earlier TLS sessions.
+    """
+    def __init__(self, trustRoot=None):
+        self._creators = {}
+        super(ResumingPolicyForHTTPS, self).__init__(trustRoot)
+
+    def creatorForNetloc(self, hostname, port):
+        key = (hostname, port)
+        if key not in self._creators:
+            creator = optionsForClientTLS(hostname=hostname.decode('ascii'),
+                                          trustRoot=self._trustRoot)
+            self._creators[key] = ResumingClientTLSOptions(creator)
+        return self._creators[key]
+
+
+@implementer(IOpenSSLClientConnectionCreator)
+class ResumingClientTLSOptions(object):
+    """
+    Client TLS connection creator that resumes our previous TLS session.
+
+    This wraps the result of optionsForClientTLS(). That object creates every
+    connection from the same (cached) OpenSSL context, so we only load the CA
+    certificates once. Each time we create a new connection, we offer the
+    server the session from our previous connection, so the server can skip
+    the full handshake.
+    """
+    def __init__(self, creator):
+        self._creator = creator
+        self._connection = None
+        self._session = None
+
+    def clientConnectionForTLS(self, tlsProtocol):
+        self._save_session()
+        connection = self._creator.clientConnectionForTLS(tlsProtocol)
+        if self._session is not None:
+            connection.set_session(self._session)
+        self._connection = connection
+        return connection
+
+    def _save_session(self):
+        """
+        Store the session from the previous connection (if it has one).
+
+        We read the session as late as possible, because TLS 1.3 servers send
+        session tickets after the handshake is complete.
+        """
+        if self._connection is None:
+            return
+        session = self._connection.get_session()
+        if session is not None:
+            self._session = session
+
+
 @implementer(IOpenSSLTrustRoot)
 class RootCATrustRoot(object):
     """
@@ -1,17 +1,19 @@
+import base64
 from datetime import datetime, timedelta, UTC
 import os.path
 import posixpath
-from munch import Munch, unmunchify
+from munch import unmunchify
 from twisted.internet import defer
 from txkoji import task_states
 from txkoji.channel import Channel
 from txkoji.estimates import average_build_duration
+from txkoji.memo import MemoMunch, memoized_property
 try:
     from urllib.parse import urlparse
-    import xmlrpc
+    from xmlrpc.client import loads
 except ImportError:
     from urlparse import urlparse
-    import xmlrpclib as xmlrpc
+    from xmlrpclib import loads
 
 
 # The default kojid sleeptime upstream is 15. The RH builders have this dialed
@@ -22,9 +24,9 @@ SLEEPTIME = timedelta(seconds=45)
 # _do_parseTaskParams in the CLI.
 
 
-class Task(Munch):
+class Task(MemoMunch):
 
-    @property
+    @memoized_property
     def arch(self):
         """
         Return an architecture for this task.
@@ -41,7 +43,7 @@ class Task(Munch):
         if self.method == 'indirectionimage':
             return self.params[0]['arch']
 
-    @property
+    @memoized_property
     def arches(self):
         """
         Return a list of architectures for this task.
@@ -55,7 +57,7 @@ class Task(Munch):
             return [self.arch]
         return []
 
-    @property
+    @memoized_property
     def build_id(self):
         """
         Find a build ID for this task.
@@ -82,7 +84,7 @@ class Task(Munch):
         """
         return Channel({'id': self.channel_id, 'connection': self.connection})
 
-    @property
+    @memoized_property
     def completed(self):
         """
         Return a parsed completion datetime for a task.
@@ -94,7 +96,7 @@ class Task(Munch):
             return None
         return datetime.fromtimestamp(self.completion_ts, UTC)
 
-    @property
+    @memoized_property
     def created(self):
         """
         Return a parsed created datetime for a task.
@@ -103,7 +105,7 @@ class Task(Munch):
         """
         return datetime.fromtimestamp(self.create_ts, UTC)
 
-    @property
+    @memoized_property
     def started(self):
         """
         Return a parsed started datetime for a task.
@@ -286,7 +288,7 @@ class Task(Munch):
             subtasks = [t for t in subtasks if t.state == state]
         defer.returnValue(subtasks)
 
-    @property
+    @memoized_property
     def package(self):
         """
         Find a package name from a build task's parameters.
@@ -324,22 +326,21 @@ class Task(Munch):
             return package
         raise ValueError('could not parse source "%s"' % source)
 
-    @property
+    @memoized_property
     def params(self):
         """
         Return a list of parameters in this task's request.
 
         If self.request is already a list, simply return it.
 
-        If self.request is a raw XML-RPC string, parse it and return the
-        params.
+        If self.request is a raw (undecoded) string, parse it and return the
+        params. We parse it only once per Task.
         """
         if isinstance(self.request, list):
             return unmunchify(self.request)
-        (params, _) = xmlrpc.loads(self.request)
-        return params
+        return decode_request(self.request)
 
-    @property
+    @memoized_property
     def is_scratch(self):
         for param in self.params:
             if isinstance(param, dict):
@@ -347,7 +348,7 @@ class Task(Munch):
                     return True
         return False
 
-    @property
+    @memoized_property
     def tag(self):
         """
         Return the tag's name (or id number) for this task.
@@ -370,7 +371,7 @@ class Task(Munch):
         if self.method == 'buildMaven':
             return self.params[1]['name']
 
-    @property
+    @memoized_property
     def target(self):
         if self.method in ('build', 'buildContainer', 'chainmaven', 'maven'):
             return self.params[1]
@@ -398,6 +399,23 @@ class Task(Munch):
         return posixpath.join(self.connection.weburl, endpoint)
 
 
+def decode_request(request):
+    """
+    Parse the params from a raw (undecoded) task request.
+
+    Koji stores each task request as an XML-RPC params string, and the hub
+    returns that string as-is. Tasks stored in Koji's legacy format have a
+    base64-encoded request instead. We decode those as a fallback.
+
+    :param request: ``str``, raw request from the hub.
+    :returns: a list of task parameters.
+    """
+    if not request.lstrip().startswith('<'):
+        request = base64.b64decode(request)
+    (params, _) = loads(request)
+    return list(params)
+
+
 class NoDescendentsError(Exception):
     """ Could not find open buildArch descendents for this task. """
     pass
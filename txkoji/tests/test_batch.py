@@ -0,0 +1,118 @@
+from twisted.internet import defer
+from twisted.internet.task import Clock
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.exceptions import KojiException
+from txkoji.task import Task
+from txkoji.proxy import TrustedProxy
+
+
+class FakeProxy(TrustedProxy):
+    """ Record every RPC and answer a couple of hard-coded methods. """
+
+    results = {
+        'getAPIVersion': 1,
+        'getTaskInfo': {'id': 12345, 'method': 'tagBuild'},
+    }
+
+    def callRemote(self, action, *args):
+        self.actions.append(action)
+        if action != 'system.multicall':
+            return defer.succeed(self.results[action])
+        response = []
+        for call in args[0]:
+            method_name = call['methodName']
+            if method_name in self.results:
+                response.append([self.results[method_name]])
+            else:
+                response.append({'faultCode': 1000,
+                                 'faultString': 'Invalid method: %s'
+                                 % method_name})
+        return defer.succeed(response)
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji', batch_window=0.1)
+    koji.proxy.actions = []
+    koji.batcher.clock = Clock()
+    return koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_one_multicall(koji):
+    first = koji.getAPIVersion()
+    second = koji.getTaskInfo(12345)
+    assert koji.proxy.actions == []
+    koji.batcher.clock.advance(0.1)
+    version = yield first
+    task = yield second
+    assert koji.proxy.actions == ['system.multicall']
+    assert version == 1
+    assert isinstance(task, Task)
+    assert task.connection is koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_single_call(koji):
+    d = koji.getAPIVersion()
+    koji.batcher.clock.advance(0.1)
+    version = yield d
+    assert koji.proxy.actions == ['getAPIVersion']
+    assert version == 1
+
+
+@pytest_twisted.inlineCallbacks
+def test_error(koji):
+    good = koji.getAPIVersion()
+    bad = koji.nonExistantMethod()
+    koji.batcher.clock.advance(0.1)
+    version = yield good
+    assert version == 1
+    with pytest.raises(KojiException):
+        yield bad
+
+
+@pytest_twisted.inlineCallbacks
+def test_max_calls(koji):
+    koji.batcher.max_calls = 2
+    first = koji.getAPIVersion()
+    second = koji.getAPIVersion()
+    # We sent this full batch without waiting for the window:
+    assert koji.proxy.actions == ['system.multicall']
+    results = yield defer.gatherResults([first, second])
+    assert results == [1, 1]
+
+
+class ChunkFailProxy(FakeProxy):
+    """ Fail the second system.multicall RPC with a transport error. """
+
+    def callRemote(self, action, *args):
+        if action == 'system.multicall':
+            self.multicalls += 1
+            if self.multicalls == 2:
+                self.actions.append(action)
+                return defer.fail(IOError('connection reset'))
+        return super(ChunkFailProxy, self).callRemote(action, *args)
+
+
+@pytest_twisted.inlineCallbacks
+def test_chunk_fails(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', ChunkFailProxy)
+    koji = Connection('mykoji', batch_window=0)
+    koji.proxy.actions = []
+    koji.proxy.multicalls = 0
+    koji.batcher.clock = Clock()
+    deferreds = [koji.call('getAPIVersion') for _ in range(150)]
+    koji.batcher.clock.advance(0)
+    # The connection's sizer splits this batch into two RPCs.
+    assert koji.proxy.actions == ['system.multicall'] * 2
+    results = yield defer.DeferredList(deferreds, consumeErrors=True)
+    values = [result for (success, result) in results if success]
+    failures = [result for (success, result) in results if not success]
+    assert values == [1] * len(values)
+    assert failures
+    assert all(failure.check(IOError) for failure in failures)
+    assert len(values) + len(failures) == 150
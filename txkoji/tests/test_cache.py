@@ -0,0 +1,420 @@
+import gc
+import os
+import threading
+import time
+import weakref
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+import pytest
+import pytest_twisted
+from munch import Munch
+from txkoji import Connection
+import txkoji.cache
+from txkoji.cache import Cache, LRU
+from txkoji.proxy import TrustedProxy
+from txkoji.results import RAW
+from txkoji.sizing import BatchSizer
+from txkoji.tests.util import FakeProxy
+
+
+class TestLRU(object):
+
+    def test_get(self):
+        lru = LRU(2)
+        lru.put('a', 1)
+        assert lru.get('a') == 1
+        assert lru.get('b') is None
+        assert lru.hits == 1
+        assert lru.misses == 1
+
+    def test_evict_oldest(self):
+        lru = LRU(2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('a')
+        lru.put('c', 3)
+        assert 'a' in lru
+        assert 'b' not in lru
+        assert lru.evictions == 1
+        assert len(lru) == 2
+
+    def test_metrics(self):
+        lru = LRU(1)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        lru.get('b')
+        assert lru.metrics() == {'size': 1, 'hits': 1, 'misses': 0,
+                                 'evictions': 1}
+
+
+@pytest.fixture
+def cache(tmpdir):
+    koji = Connection('mykoji')
+    cache = Cache(koji, directory=str(tmpdir), memory_size=2, threads=0)
+    cache.clock = Clock()
+    cache.clock.advance(time.time())
+    return cache
+
+
+class TestCache(object):
+
+    def test_put_and_get(self, cache):
+        cache.put_name('user', 123, 'kdreyer')
+        assert cache.get_name('user', 123) == 'kdreyer'
+        assert cache.memory.hits == 1
+
+    def test_disk_hit_fills_memory(self, cache, tmpdir):
+        cache.put_name('user', 123, 'kdreyer')
+        other = Cache(cache.connection, directory=str(tmpdir))
+        assert other.get_name('user', 123) == 'kdreyer'
+        assert ('user', 123) in other.memory
+
+    def test_memory_hit_skips_disk(self, cache, monkeypatch):
+        cache.put_name('user', 123, 'kdreyer')
+
+        def fail(*args):
+            raise AssertionError('read from disk')
+        monkeypatch.setattr('txkoji.cache.open', fail, raising=False)
+        assert cache.get_name('user', 123) == 'kdreyer'
+
+    def test_missing(self, cache):
+        assert cache.get_name('user', 123) is None
+
+    @pytest_twisted.inlineCallbacks
+    def test_get_or_load_name(self, cache):
+        calls = []
+
+        def getUser(id_):
+            calls.append(id_)
+            return defer.succeed(Munch(name='kdreyer'))
+        name = yield cache.get_or_load_name('user', 123, getUser)
+        assert name == 'kdreyer'
+        name = yield cache.get_or_load_name('user', 123, getUser)
+        assert name == 'kdreyer'
+        assert calls == [123]
+
+    @pytest_twisted.inlineCallbacks
+    def test_user_name_raw(self, monkeypatch, tmpdir):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+        koji = Connection('mykoji', result_mode=RAW)
+        cache = Cache(koji, directory=str(tmpdir), threads=0)
+        name = yield cache.user_name(2826)
+        assert name == 'kdreyer'
+
+
+class TestExpiration(object):
+
+    @pytest.fixture
+    def cache(self, cache):
+        cache.ttls = {'tag': 60, 'user': None}
+        return cache
+
+    def test_memory_expired(self, cache):
+        cache.put_name('tag', 1, 'foo-build')
+        cache.clock.advance(61)
+        assert cache.get_name('tag', 1) is None
+
+    def test_disk_expired(self, cache, tmpdir):
+        cache.put_name('tag', 1, 'foo-build')
+        other = Cache(cache.connection, directory=str(tmpdir),
+                      ttls=cache.ttls)
+        other.clock = cache.clock
+        cache.clock.advance(61)
+        assert other.get_name('tag', 1) is None
+
+    def test_not_expired(self, cache):
+        cache.put_name('tag', 1, 'foo-build')
+        cache.clock.advance(59)
+        assert cache.get_name('tag', 1) == 'foo-build'
+
+    def test_no_ttl(self, cache):
+        cache.put_name('user', 1, 'kdreyer')
+        cache.clock.advance(10 ** 9)
+        assert cache.get_name('user', 1) == 'kdreyer'
+
+    def test_evict_expired(self, cache):
+        cache.put_name('tag', 1, 'foo-build')
+        cache.put_name('user', 1, 'kdreyer')
+        cache.clock.advance(61)
+        assert cache.evict() == 1
+        assert not os.path.exists(cache.filename('tag', 1))
+        assert os.path.exists(cache.filename('user', 1))
+
+    def test_evict_oldest(self, cache):
+        cache.max_entries = 2
+        for id_ in range(3):
+            cache.put_name('user', id_, 'user%d' % id_)
+            mtime = 1000 + id_
+            os.utime(cache.filename('user', id_), (mtime, mtime))
+        assert cache.evict() == 1
+        assert not os.path.exists(cache.filename('user', 0))
+        assert os.path.exists(cache.filename('user', 2))
+
+    def test_evict_empty(self, cache):
+        assert cache.evict() == 0
+
+    def test_amortized(self, cache, monkeypatch):
+        monkeypatch.setattr('txkoji.cache.EVICT_INTERVAL', 2)
+        calls = []
+        cache.evict = lambda: calls.append(True)
+        cache.put_name('user', 1, 'kdreyer')
+        assert calls == []
+        cache.put_name('user', 2, 'ktdreyer')
+        assert calls == [True]
+
+
+class MultiCallProxy(TrustedProxy):
+    """
+    Answer getUser multicalls. ID 0 does not exist, ID -1 fails, and ID -2
+    fails the whole RPC.
+    """
+
+    def callRemote(self, action, *args):
+        assert action == 'system.multicall'
+        calls = args[0]
+        self.sent.append(calls)
+        response = []
+        for call in calls:
+            (id_,) = call['params']
+            if id_ == -2:
+                return defer.fail(OSError('connection reset'))
+            if id_ < 0:
+                response.append({'faultCode': 1000, 'faultString': 'oops'})
+            elif id_ == 0:
+                response.append([None])
+            else:
+                response.append([{'id': id_, 'name': 'user%d' % id_}])
+        return defer.succeed(response)
+
+
+class TestBulkNames(object):
+
+    @pytest.fixture
+    def cache(self, monkeypatch, tmpdir):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', MultiCallProxy)
+        koji = Connection('mykoji')
+        koji.proxy.sent = []
+        return Cache(koji, directory=str(tmpdir), threads=0)
+
+    @pytest_twisted.inlineCallbacks
+    def test_user_names(self, cache):
+        names = yield cache.user_names([1, 2, 0, -1])
+        assert names == {1: 'user1', 2: 'user2', 0: None, -1: None}
+        assert len(cache.connection.proxy.sent) == 1
+        assert cache.get_name('user', 2) == 'user2'
+
+    @pytest_twisted.inlineCallbacks
+    def test_cached(self, cache):
+        cache.put_name('user', 1, 'kdreyer')
+        names = yield cache.user_names([1, 2])
+        assert names == {1: 'kdreyer', 2: 'user2'}
+        (calls,) = cache.connection.proxy.sent
+        assert [call['params'] for call in calls] == [(2,)]
+
+    @pytest_twisted.inlineCallbacks
+    def test_all_cached(self, cache):
+        cache.put_name('user', 1, 'kdreyer')
+        names = yield cache.user_names([1])
+        assert names == {1: 'kdreyer'}
+        assert cache.connection.proxy.sent == []
+
+    @pytest_twisted.inlineCallbacks
+    def test_negative(self, cache):
+        yield cache.user_names([0])
+        names = yield cache.user_names([0])
+        assert names == {0: None}
+        assert len(cache.connection.proxy.sent) == 1
+
+    @pytest_twisted.inlineCallbacks
+    def test_fault_not_cached(self, cache):
+        yield cache.user_names([-1])
+        yield cache.user_names([-1])
+        assert len(cache.connection.proxy.sent) == 2
+
+    def test_dedup_single(self, cache):
+        cache.loading[('user', 1)] = []
+        d = cache.user_names([1, 2])
+        (calls,) = cache.connection.proxy.sent
+        assert [call['params'] for call in calls] == [(2,)]
+        cache._loaded(('user', 1), 'kdreyer')
+        assert d.result == {1: 'kdreyer', 2: 'user2'}
+
+    @pytest_twisted.inlineCallbacks
+    def test_chunks(self, cache):
+        cache.connection.sizer = BatchSizer(initial_calls=2)
+        names = yield cache.user_names([1, 2, 3])
+        assert len(names) == 3
+        assert len(cache.connection.proxy.sent) == 2
+
+    @pytest_twisted.inlineCallbacks
+    def test_chunk_fails(self, cache):
+        cache.connection.sizer = BatchSizer(initial_calls=2)
+        names = yield cache.user_names([1, 2, 3, -2, 4, 5])
+        assert sorted(names) == [-2, 1, 2, 3, 4, 5]
+        # Only the chunk with -2 failed:
+        failed = [id_ for (id_, name) in names.items() if name is None]
+        assert -2 in failed
+        assert len(failed) == 2
+        found = dict((id_, 'user%d' % id_) for id_ in names
+                     if id_ not in failed)
+        assert cache.pending['user'] == found
+        # We did not cache the failures:
+        for id_ in failed:
+            assert ('user', id_) not in cache.memory
+
+    def test_chunk_fails_waiters(self, cache):
+        for id_ in (1, 2):
+            cache.loading[('user', id_)] = []
+        good = cache._wait(('user', 1))
+        bad = cache._wait(('user', 2))
+        failure = Failure(OSError('chunk 2 timed out'))
+        cache._loaded_names(({1: 'user1', 2: None}, [], {2: failure}),
+                            'user', [1, 2])
+        assert good.result == 'user1'
+        assert bad.result is failure
+        bad.addErrback(lambda failure: None)
+
+    @pytest_twisted.inlineCallbacks
+    def test_rpc_error(self, cache):
+        with pytest.raises(OSError):
+            yield cache.user_names([1, -2])
+
+
+class TestLoading(object):
+
+    @pytest.fixture
+    def loader(self):
+        class Loader(object):
+            def __init__(self):
+                self.calls = []
+
+            def __call__(self, id_):
+                d = defer.Deferred()
+                self.calls.append((id_, d))
+                return d
+        return Loader()
+
+    def test_dedup(self, cache, loader):
+        first = cache.get_or_load_name('tag', 1, loader)
+        second = cache.get_or_load_name('tag', 1, loader)
+        assert len(loader.calls) == 1
+        (_, d) = loader.calls[0]
+        d.callback(Munch(name='foo-build'))
+        assert first.result == 'foo-build'
+        assert second.result == 'foo-build'
+        assert cache.loading == {}
+
+    def test_dedup_error(self, cache, loader):
+        first = cache.get_or_load_name('tag', 1, loader)
+        second = cache.get_or_load_name('tag', 1, loader)
+        (_, d) = loader.calls[0]
+        d.errback(ValueError('oops'))
+        for result in (first, second):
+            failure = result.result
+            result.addErrback(lambda _: None)
+            assert failure.check(ValueError)
+        # The next lookup tries again:
+        cache.get_or_load_name('tag', 1, loader)
+        assert len(loader.calls) == 2
+
+    def test_negative(self, cache, loader):
+        d = cache.get_or_load_name('user', 1, loader)
+        (_, load) = loader.calls[0]
+        load.callback(None)
+        assert d.result is None
+        d = cache.get_or_load_name('user', 1, loader)
+        assert d.result is None
+        assert len(loader.calls) == 1
+
+    def test_negative_expires(self, cache, loader):
+        cache.get_or_load_name('user', 1, loader)
+        (_, load) = loader.calls[0]
+        load.callback(None)
+        cache.clock.advance(cache.negative_ttl + 1)
+        cache.get_or_load_name('user', 1, loader)
+        assert len(loader.calls) == 2
+
+    def test_negative_not_on_disk(self, cache, loader):
+        cache.get_or_load_name('user', 1, loader)
+        (_, load) = loader.calls[0]
+        load.callback(None)
+        assert not os.path.exists(cache.filename('user', 1))
+
+
+class TestWriteBehind(object):
+
+    def test_queue(self, cache):
+        cache.queue_names('user', {1: 'kdreyer'})
+        assert cache.get_name('user', 1) == 'kdreyer'
+        assert not os.path.exists(cache.filename('user', 1))
+        cache.clock.advance(1)
+        assert os.path.exists(cache.filename('user', 1))
+        assert cache.pending == {}
+
+    def test_pending_read(self, cache):
+        # Even if the LRU drops a queued name, we can still read it.
+        cache.queue_names('user', {1: 'kdreyer', 2: 'a', 3: 'b'})
+        assert cache.get_name('user', 1) == 'kdreyer'
+
+    def test_batch(self, cache, monkeypatch):
+        calls = []
+        put_many = cache.backend.put_many
+
+        def counting_put_many(*args):
+            calls.append(args)
+            return put_many(*args)
+        monkeypatch.setattr(cache.backend, 'put_many', counting_put_many)
+        cache.queue_names('user', {1: 'kdreyer'})
+        cache.queue_names('user', {2: 'ktdreyer'})
+        cache.flush()
+        assert len(calls) == 1
+
+
+class TestThreads(object):
+
+    @pytest.fixture
+    def cache(self, tmpdir):
+        koji = Connection('mykoji')
+        return Cache(koji, directory=str(tmpdir), threads=1)
+
+    @pytest_twisted.inlineCallbacks
+    def test_read_in_thread(self, cache, monkeypatch):
+        cache.put_name('tag', 1, 'foo-build')
+        cache.memory = LRU()
+        reads = []
+        get_many = cache.backend.get_many
+
+        def recording_get_many(*args):
+            reads.append(threading.current_thread())
+            return get_many(*args)
+        monkeypatch.setattr(cache.backend, 'get_many', recording_get_many)
+        name = yield cache.tag_name(1)
+        assert name == 'foo-build'
+        assert len(reads) == 1
+        assert reads[0] is not threading.current_thread()
+
+    @pytest_twisted.inlineCallbacks
+    def test_flush_in_thread(self, cache):
+        cache.queue_names('user', {1: 'kdreyer'})
+        yield cache.flush()
+        assert os.path.exists(cache.filename('user', 1))
+
+    @pytest_twisted.inlineCallbacks
+    def test_shared_pool(self, cache, tmpdir):
+        other = Cache(Connection('mykoji'), directory=str(tmpdir), threads=1)
+        yield cache._in_thread(int)
+        pool = txkoji.cache._threadpool
+        yield other._in_thread(int)
+        assert txkoji.cache._threadpool is pool
+
+    @pytest_twisted.inlineCallbacks
+    def test_not_held(self, tmpdir):
+        cache = Cache(Connection('mykoji'), directory=str(tmpdir), threads=1)
+        yield cache._in_thread(int)
+        cache.queue_names('user', {1: 'kdreyer'})
+        yield cache.flush()
+        ref = weakref.ref(cache)
+        del cache
+        gc.collect()
+        assert ref() is None
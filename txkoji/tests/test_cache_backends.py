@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import pytest
+from txkoji import Connection
+from txkoji.cache import Cache
+from txkoji.cache_backends import FileBackend, SQLiteBackend
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def backend(request, tmpdir):
+    if request.param == 'file':
+        return FileBackend(str(tmpdir))
+    return SQLiteBackend(str(tmpdir.join('names.sqlite')))
+
+
+class TestBackend(object):
+
+    def test_get_missing(self, backend):
+        assert backend.get('mykoji', 'user', 1) is None
+
+    def test_put_get(self, backend):
+        backend.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        assert backend.get('mykoji', 'user', 1) == ('kdreyer', 1000.0)
+
+    def test_replace(self, backend):
+        backend.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        backend.put('mykoji', 'user', 1, 'ktdreyer', 2000.0)
+        assert backend.get('mykoji', 'user', 1) == ('ktdreyer', 2000.0)
+
+    def test_get_many(self, backend):
+        names = dict((id_, 'user%d' % id_) for id_ in range(600))
+        backend.put_many('mykoji', 'user', names, 1000.0)
+        result = backend.get_many('mykoji', 'user', list(range(-1, 601)))
+        assert len(result) == 600
+        assert result[599] == ('user599', 1000.0)
+
+    def test_separate_profiles(self, backend):
+        backend.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        assert backend.get('otherkoji', 'user', 1) is None
+        assert backend.get('mykoji', 'tag', 1) is None
+
+    def test_evict_expired(self, backend):
+        backend.put('mykoji', 'tag', 1, 'foo-build', 1000.0)
+        backend.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        ttls = {'tag': 60, 'user': None}
+        assert backend.evict('mykoji', ttls, 10, 1060.0) == 1
+        assert backend.get('mykoji', 'tag', 1) is None
+        assert backend.get('mykoji', 'user', 1) is not None
+
+    def test_evict_oldest(self, backend):
+        for id_ in range(3):
+            backend.put('mykoji', 'user', id_, 'user', 1000.0 + id_)
+        assert backend.evict('mykoji', {}, 2, 2000.0) == 1
+        assert backend.get('mykoji', 'user', 0) is None
+        assert backend.get('mykoji', 'user', 2) is not None
+
+
+class TestSQLiteBackend(object):
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join('cache', 'names.sqlite'))
+
+    def test_wal(self, path):
+        backend = SQLiteBackend(path)
+        (mode,) = backend.db.execute('PRAGMA journal_mode').fetchone()
+        assert mode == 'wal'
+
+    def test_shared_file(self, path):
+        # Simulate two processes using the same database file.
+        first = SQLiteBackend(path)
+        second = SQLiteBackend(path)
+        first.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        assert second.get('mykoji', 'user', 1) == ('kdreyer', 1000.0)
+
+    def test_threads(self, path):
+        backend = SQLiteBackend(path)
+        backend.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        result = []
+
+        def read():
+            result.append(backend.get('mykoji', 'user', 1))
+            backend.close()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        assert result == [('kdreyer', 1000.0)]
+
+    def test_migrate(self, path, tmpdir):
+        old = FileBackend(str(tmpdir.join('old')))
+        old.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        old.put('otherkoji', 'tag', 2, 'foo-build', 2000.0)
+        backend = SQLiteBackend(path)
+        assert backend.migrate(old.directory) == 2
+        assert backend.get('mykoji', 'user', 1) == ('kdreyer', 1000.0)
+        assert backend.get('otherkoji', 'tag', 2) == ('foo-build', 2000.0)
+        # Only once:
+        assert backend.migrate(old.directory) == 0
+
+    def test_migrate_concurrent(self, path, tmpdir, monkeypatch):
+        old = FileBackend(str(tmpdir.join('old')))
+        old.put('mykoji', 'user', 1, 'kdreyer', 1000.0)
+        first = SQLiteBackend(path)
+        second = SQLiteBackend(path)
+        # Create the tables before we race:
+        first.get('mykoji', 'user', 1)
+        result = []
+        threads = []
+        walk = FileBackend.walk
+
+        def migrate_second():
+            try:
+                result.append(second.migrate(old.directory))
+            except Exception as e:
+                result.append(e)
+
+        def racing_walk(backend):
+            # Another process starts the same migration while we walk.
+            if not threads:
+                threads.append(threading.Thread(target=migrate_second))
+                threads[0].start()
+                time.sleep(0.2)
+            for entry in walk(backend):
+                yield entry
+        monkeypatch.setattr(FileBackend, 'walk', racing_walk)
+        assert first.migrate(old.directory) == 1
+        threads[0].join()
+        assert result == [0]
+
+    def test_migrate_missing(self, path, tmpdir):
+        backend = SQLiteBackend(path)
+        assert backend.migrate(str(tmpdir.join('noexist'))) == 0
+
+    def test_cache(self, path):
+        koji = Connection('mykoji')
+        cache = Cache(koji, backend=SQLiteBackend(path))
+        cache.put_names('user', {1: 'kdreyer', 2: 'ktdreyer'})
+        other = Cache(koji, backend=SQLiteBackend(path))
+        assert other.get_names('user', [1, 2, 3]) == {1: 'kdreyer',
+                                                      2: 'ktdreyer'}
+        assert not os.path.exists(cache.filename('user', 1))
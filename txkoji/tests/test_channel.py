@@ -1,6 +1,7 @@
 import pytest
 from txkoji import Connection
 from txkoji.channel import Channel
+from txkoji.results import RAW
 from txkoji.tests.util import FakeProxy
 import pytest_twisted
 
@@ -83,3 +84,13 @@ class TestListChannels(object):
         assert channel.id == 1
         assert channel.name == 'default'
         assert isinstance(channel.connection, Connection)
+
+
+@pytest_twisted.inlineCallbacks
+def test_total_capacity_raw(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji', result_mode=RAW)
+    channel = Channel({'id': 2})
+    channel.connection = koji
+    total_capacity = yield channel.total_capacity()
+    assert total_capacity == 46.0
@@ -0,0 +1,79 @@
+from twisted.internet import defer
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.coalesce import READ_METHODS
+from txkoji.coalesce import call_key
+from txkoji.exceptions import KojiException
+from txkoji.proxy import TrustedProxy
+try:
+    import xmlrpc.client as xmlrpc_client
+except ImportError:
+    import xmlrpclib as xmlrpc_client
+
+
+class FakeProxy(TrustedProxy):
+    """ Hold every RPC in flight until the test fires it. """
+
+    def callRemote(self, action, *args):
+        d = defer.Deferred()
+        self.inflight.append((action, args, d))
+        return d
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji', coalesce_methods=READ_METHODS)
+    koji.proxy.inflight = []
+    return koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_identical_calls(koji):
+    first = koji.getTag(123)
+    second = koji.getTag(123)
+    assert len(koji.proxy.inflight) == 1
+    (_, _, d) = koji.proxy.inflight[0]
+    d.callback({'id': 123, 'name': 'foo-build'})
+    results = yield defer.gatherResults([first, second])
+    assert results[0].name == 'foo-build'
+    assert results[1].name == 'foo-build'
+
+
+def test_different_args(koji):
+    koji.getTag(123)
+    koji.getTag(456)
+    assert len(koji.proxy.inflight) == 2
+
+
+def test_not_allowed(koji):
+    koji.createTag('foo')
+    koji.createTag('foo')
+    assert len(koji.proxy.inflight) == 2
+
+
+def test_after_response(koji):
+    koji.getTag(123)
+    (_, _, d) = koji.proxy.inflight[0]
+    d.callback({'id': 123, 'name': 'foo-build'})
+    koji.getTag(123)
+    assert len(koji.proxy.inflight) == 2
+
+
+@pytest_twisted.inlineCallbacks
+def test_shared_error(koji):
+    first = koji.getTag(123)
+    second = koji.getTag(123)
+    (_, _, d) = koji.proxy.inflight[0]
+    d.errback(xmlrpc_client.Fault(1000, 'No such tag'))
+    with pytest.raises(KojiException):
+        yield first
+    with pytest.raises(KojiException):
+        yield second
+
+
+def test_call_key_kwargs_order():
+    first = call_key('listTasks', (), {'a': 1, 'b': [1, 2]})
+    second = call_key('listTasks', (), {'b': [1, 2], 'a': 1})
+    assert first == second
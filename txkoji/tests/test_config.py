@@ -0,0 +1,80 @@
+import os
+import pytest
+from txkoji.config import ConfigIndex, WebTrie
+
+
+class TestWebTrie(object):
+
+    def test_match(self):
+        trie = WebTrie()
+        trie.add('https://koji.example.com/koji', 0)
+        url = 'https://koji.example.com/koji/buildinfo?buildID=1'
+        assert trie.match(url) == 0
+
+    def test_no_match(self):
+        trie = WebTrie()
+        trie.add('https://koji.example.com/koji', 0)
+        assert trie.match('https://koji.example.com') is None
+
+    def test_lowest_rank(self):
+        trie = WebTrie()
+        trie.add('https://example.com/koji/foo', 0)
+        trie.add('https://example.com/koji', 1)
+        assert trie.match('https://example.com/koji/foo/1') == 0
+        assert trie.match('https://example.com/koji/bar') == 1
+
+
+def write(path, profile, weburl, mtime):
+    path.write('[%s]\nserver = https://%s/kojihub\nweburl = %s\n'
+               % (profile, profile, weburl))
+    os.utime(str(path), (mtime, mtime))
+
+
+class TestConfigIndex(object):
+
+    @pytest.fixture
+    def confdir(self, tmpdir):
+        write(tmpdir.join('a.conf'), 'first', 'https://a.example.com/koji',
+              1000)
+        write(tmpdir.join('b.conf'), 'second', 'https://b.example.com/koji',
+              1000)
+        return tmpdir
+
+    @pytest.fixture
+    def index(self, confdir):
+        return ConfigIndex().refresh([str(confdir.join('*.conf'))])
+
+    def test_lookup(self, index):
+        assert index.lookup('second', 'server') == 'https://second/kojihub'
+        assert index.lookup('second', 'authtype') is None
+        assert index.lookup('noexist', 'server') is None
+
+    def test_match_weburl(self, index):
+        url = 'https://b.example.com/koji/taskinfo?taskID=1'
+        assert index.match_weburl(url) == 'second'
+        assert index.match_weburl('https://c.example.com/koji') is None
+
+    def test_parse_once(self, index, confdir, monkeypatch):
+        def fail():
+            raise AssertionError('parsed again')
+        monkeypatch.setattr(index, '_parse', fail)
+        index.refresh([str(confdir.join('*.conf'))])
+
+    def test_changed_file(self, index, confdir):
+        write(confdir.join('b.conf'), 'second', 'https://c.example.com/koji',
+              2000)
+        index.refresh([str(confdir.join('*.conf'))])
+        assert index.match_weburl('https://c.example.com/koji') == 'second'
+
+    def test_new_file(self, index, confdir):
+        write(confdir.join('c.conf'), 'third', 'https://c.example.com/koji',
+              1000)
+        # Make sure the directory looks changed:
+        os.utime(str(confdir), (3000, 3000))
+        index.refresh([str(confdir.join('*.conf'))])
+        assert index.lookup('third', 'server') == 'https://third/kojihub'
+
+    def test_missing_directory(self, tmpdir):
+        index = ConfigIndex().refresh([str(tmpdir.join('noexist', '*.conf'))])
+        assert index.paths == []
+        assert index.lookup('first', 'server') is None
@@ -11,6 +11,13 @@ def test_basic():
     assert koji.url == 'https://hub.example.com/kojihub'
 
 
+def test_pool_settings():
+    koji = Connection('mykoji', pool_size=8, pool_timeout=30)
+    assert koji.pool.maxPersistentPerHost == 8
+    assert koji.pool.cachedConnectionTimeout == 30
+    assert koji.proxy.pool is koji.pool
+
+
 def test_missing_profile(monkeypatch):
     monkeypatch.setattr('txkoji.connection.PROFILES', ['/noexist'])
     with pytest.raises(ValueError) as e:
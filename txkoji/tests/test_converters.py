@@ -0,0 +1,70 @@
+from datetime import timedelta
+from munch import Munch
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.build import Build
+from txkoji.channel import Channel
+from txkoji.converters import CONVERTERS, converter_for, plain, register, rich
+from txkoji.results import RAW
+from txkoji.task import Task
+from txkoji.tests.util import FakeProxy
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    return Connection('mykoji')
+
+
+def test_unknown_method():
+    assert converter_for('getAPIVersion') is plain
+
+
+def test_rich_type():
+    assert converter_for('listBuilds').type_ is Build
+
+
+def test_descendents(koji):
+    value = {'1': [{'id': 2}], '2': []}
+    result = converter_for('getTaskDescendents')(koji, value, RAW)
+    assert isinstance(result['1'][0], Task)
+    assert result['1'][0].connection is koji
+    assert result['2'] == []
+
+
+@pytest_twisted.inlineCallbacks
+def test_call(koji):
+    build = yield koji.call('getBuild', 24284)
+    assert isinstance(build, Build)
+    assert build.connection is koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_call_duration(koji):
+    duration = yield koji.call('getAverageBuildDuration', 'ceph-ansible')
+    assert isinstance(duration, timedelta)
+
+
+@pytest_twisted.inlineCallbacks
+def test_call_unknown(koji):
+    user = yield koji.call('getUser', 1)
+    assert type(user) is Munch
+
+
+@pytest_twisted.inlineCallbacks
+def test_register(koji, monkeypatch):
+    monkeypatch.setattr('txkoji.converters.CONVERTERS', dict(CONVERTERS))
+    register('listHosts', rich(Channel))
+    hosts = yield koji.call('listHosts')
+    assert all(isinstance(host, Channel) for host in hosts)
+
+
+@pytest_twisted.inlineCallbacks
+def test_register_stream(koji, monkeypatch):
+    monkeypatch.setattr('txkoji.converters.CONVERTERS', dict(CONVERTERS))
+    register('listTasks', rich(Channel))
+    tasks = []
+    yield koji.listTasks(callback=tasks.append)
+    assert tasks
+    assert all(isinstance(task, Channel) for task in tasks)
@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+from txkoji.tests.conftest import FIXTURES_DIR
+
+
+"""
+Guard our import time: check which heavy modules each step loads.
+
+We run each script in a fresh interpreter, so earlier tests' imports do not
+hide a regression.
+"""
+
+# These modules take most of our import time, and we only need them for
+# network access or authentication.
+HEAVY = ('treq', 'treq_kerberos', 'twisted.web.client', 'twisted.web.xmlrpc',
+         'txkoji.proxy')
+
+CONNECT = """
+import txkoji.connection
+txkoji.connection.PROFILES = [%r]
+koji = txkoji.connection.Connection('mykoji')
+koji.weburl
+""" % (FIXTURES_DIR + '/*.conf')
+
+
+def loaded(script):
+    """
+    Run a Python script in a new interpreter.
+
+    :returns: dict of {module name: True if the script imported it}
+    """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    script += '\nimport json, sys\n'
+    script += 'print(json.dumps(dict((m, m in sys.modules) for m in %r)))' \
+        % (HEAVY + ('twisted.internet.reactor', 'munch'),)
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    return json.loads(output.decode())
+
+
+def test_import_package():
+    modules = loaded('import txkoji')
+    assert not any(modules.values())
+
+
+def test_import_states():
+    modules = loaded('from txkoji import task_states, build_states')
+    assert not any(modules.values())
+
+
+def test_new_connection():
+    modules = loaded(CONNECT)
+    assert [module for module in HEAVY if modules[module]] == []
+
+
+def test_first_call():
+    modules = loaded(CONNECT + 'koji.proxy\n')
+    assert modules['twisted.web.xmlrpc']
+    assert not modules['treq']
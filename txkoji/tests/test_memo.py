@@ -0,0 +1,93 @@
+import pytest
+from txkoji.memo import MemoMunch, memoized_property
+from txkoji.task import Task
+
+
+class Counter(MemoMunch):
+    calls = 0
+
+    @memoized_property
+    def double(self):
+        type(self).calls += 1
+        if self.value is None:
+            raise ValueError('no value')
+        return self.value * 2
+
+
+@pytest.fixture
+def counter():
+    Counter.calls = 0
+    return Counter({'value': 2})
+
+
+def test_compute_once(counter):
+    assert counter.double == 4
+    assert counter.double == 4
+    assert Counter.calls == 1
+
+
+def test_setattr(counter):
+    assert counter.double == 4
+    counter.value = 3
+    assert counter.double == 6
+
+
+def test_setitem(counter):
+    assert counter.double == 4
+    counter['value'] = 3
+    assert counter.double == 6
+
+
+def test_update(counter):
+    assert counter.double == 4
+    counter.update({'value': 5})
+    assert counter.double == 10
+
+
+def test_delitem(counter):
+    assert counter.double == 4
+    del counter['value']
+    with pytest.raises(AttributeError):
+        counter.double
+
+
+def test_exception_not_stored(counter):
+    counter.value = None
+    with pytest.raises(ValueError):
+        counter.double
+    with pytest.raises(ValueError):
+        counter.double
+    assert Counter.calls == 2
+
+
+def test_not_in_data(counter):
+    counter.double
+    assert counter.toDict() == {'value': 2}
+    assert '_memo' not in counter
+
+
+def test_task_params(monkeypatch):
+    request = ['git://example.com/ceph.git#abc', 'ceph-build', {}]
+    task = Task({'method': 'build', 'request': request})
+    calls = []
+
+    def counting_unmunchify(data):
+        calls.append(data)
+        return list(data)
+    monkeypatch.setattr('txkoji.task.unmunchify', counting_unmunchify)
+    assert task.package == 'ceph'
+    assert task.target == 'ceph-build'
+    assert task.is_scratch is False
+    assert len(calls) == 1
+    task.request = ['git://example.com/rbd.git#abc', 'ceph-build', {}]
+    assert task.package == 'rbd'
+    assert len(calls) == 2
+
+
+def test_construction_skips_setitem(monkeypatch):
+    def fail(self, key, value):
+        raise AssertionError('__setitem__ during construction')
+    monkeypatch.setattr(Counter, '__setitem__', fail)
+    counter = Counter.fromDict({'value': 2, 'nested': {'a': 1}})
+    assert counter.double == 4
+    assert counter.nested.a == 1
@@ -1,8 +1,11 @@
 from twisted.internet import defer
+from twisted.internet.task import Clock
 import pytest
 import pytest_twisted
 from txkoji import Connection
 from txkoji.exceptions import KojiException
+from txkoji.marshaller import KojiMarshaller
+from txkoji.sizing import BatchSizer
 from txkoji.task import Task
 from txkoji.proxy import TrustedProxy
 
@@ -13,6 +16,12 @@ class FakeProxy(TrustedProxy):
     results = {
         'getAPIVersion': 1,
         'getTaskInfo': {'id': 12345, 'method': 'tagBuild'},
+        'listTasks': [{'id': 12345, 'method': 'tagBuild',
+                       'request': "<?xml version='1.0'?><methodCall>"
+                                  "<methodName>tagBuild</methodName><params>"
+                                  "<param><value><int>1</int></value></param>"
+                                  "<param><value><int>2</int></value></param>"
+                                  "</params></methodCall>"}],
     }
 
     def callRemote(self, action, *args):
@@ -78,3 +87,166 @@ def test_multicall_type(koji):
     assert isinstance(result.connection, Connection)
     assert result.id == 12345
     assert result.method == 'tagBuild'
+
+
+@pytest_twisted.inlineCallbacks
+def test_multicall_undecoded_tasks(koji):
+    multicall = koji.MultiCall()
+    multicall.listTasks({'decode': False})
+    results = yield multicall()
+    (tasks,) = list(results)
+    assert isinstance(tasks[0], Task)
+    assert tasks[0].build_id == 2
+
+
+class ChunkProxy(FakeProxy):
+    """ Record the size of each multicall, and fail any with "boom". """
+
+    def callRemote(self, action, *args):
+        calls = args[0]
+        self.sizes.append(len(calls))
+        if any(call['methodName'] == 'boom' for call in calls):
+            return defer.fail(ValueError('hub timeout'))
+        return super(ChunkProxy, self).callRemote(action, *args)
+
+
+class TestChunks(object):
+
+    @pytest.fixture
+    def koji(self, monkeypatch):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', ChunkProxy)
+        koji = Connection('mykoji')
+        koji.proxy.sizes = []
+        return koji
+
+    @pytest_twisted.inlineCallbacks
+    def test_max_calls(self, koji):
+        multicall = koji.MultiCall(max_calls=2)
+        for _ in range(5):
+            multicall.getAPIVersion()
+        multicall.getTaskInfo(12345)
+        results = yield multicall()
+        assert koji.proxy.sizes == [2, 2, 2]
+        results = list(results)
+        assert results[:5] == [1] * 5
+        assert isinstance(results[5], Task)
+
+    @pytest_twisted.inlineCallbacks
+    def test_max_bytes(self, koji):
+        multicall = koji.MultiCall(max_bytes=300)
+        for _ in range(5):
+            multicall.getAPIVersion()
+        results = yield multicall()
+        assert len(koji.proxy.sizes) > 1
+        assert sum(koji.proxy.sizes) == 5
+        assert list(results) == [1] * 5
+
+    @pytest_twisted.inlineCallbacks
+    def test_one_chunk_fails(self, koji):
+        multicall = koji.MultiCall(max_calls=2)
+        multicall.getAPIVersion()
+        multicall.getAPIVersion()
+        multicall.getAPIVersion()
+        multicall.boom()
+        results = yield multicall()
+        assert results[0] == 1
+        assert results[1] == 1
+        with pytest.raises(ValueError):
+            results[2]
+        with pytest.raises(ValueError):
+            results[3]
+
+    @pytest_twisted.inlineCallbacks
+    def test_all_chunks_fail(self, koji):
+        multicall = koji.MultiCall(max_calls=1)
+        multicall.boom()
+        multicall.boom()
+        with pytest.raises(ValueError):
+            yield multicall()
+
+    def test_chunks(self, koji):
+        multicall = koji.MultiCall(max_calls=None, sizer=None)
+        calls = [{'methodName': 'getAPIVersion', 'params': ()}] * 1000
+        assert multicall.chunks(calls) == [calls]
+        assert koji.MultiCall().chunks([]) == [[]]
+
+
+class TestSizer(object):
+
+    @pytest.fixture
+    def koji(self, monkeypatch):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', ChunkProxy)
+        koji = Connection('mykoji')
+        koji.proxy.sizes = []
+        koji.sizer = BatchSizer(target=1.0, initial_calls=4)
+        koji.sizer.clock = Clock()
+        return koji
+
+    @pytest_twisted.inlineCallbacks
+    def test_initial_size(self, koji):
+        multicall = koji.MultiCall()
+        for _ in range(10):
+            multicall.getAPIVersion()
+        results = yield multicall()
+        assert koji.proxy.sizes == [4, 4, 2]
+        assert list(results) == [1] * 10
+        assert koji.sizer.observations == 3
+
+    def test_matches_batch_size(self, koji):
+        koji.sizer = BatchSizer()
+        multicall = koji.MultiCall()
+        calls = [{'methodName': 'getAPIVersion', 'params': ()}] * 250
+        sizes = [len(chunk) for chunk in multicall.chunks(calls)]
+        assert sizes == [100, 100, 50]
+        assert koji.sizer.batch_size('getAPIVersion') == 100
+
+    def test_response_size(self, koji):
+        calls = [{'methodName': 'listBuilds', 'params': ()}] * 4
+        koji._response_size('system.multicall', (calls,), 4000)
+        assert koji.sizer.sizes == {'listBuilds': 1000.0}
+        assert koji.proxy.onResponse == koji._response_size
+
+    def test_estimate_once(self, koji, monkeypatch):
+        dumps = []
+        original = KojiMarshaller.dumps
+
+        def counting_dumps(marshaller, values):
+            dumps.append(values)
+            return original(marshaller, values)
+        monkeypatch.setattr(KojiMarshaller, 'dumps', counting_dumps)
+        estimate = koji.MultiCall().estimator()
+        small = {'methodName': 'getTaskInfo', 'params': (1,)}
+        large = {'methodName': 'getTaskInfo', 'params': (12345678,)}
+        size = estimate(small)
+        assert estimate(small) == size
+        assert estimate(large) > size
+        assert len(dumps) == 1
+
+    def test_max_bytes(self, koji):
+        koji.sizer.max_bytes = 300
+        multicall = koji.MultiCall()
+        calls = [{'methodName': 'getAPIVersion', 'params': ()}] * 4
+        assert len(multicall.chunks(calls)) > 1
+
+    @pytest_twisted.inlineCallbacks
+    def test_queue_wait_not_cost(self, koji):
+        cost = koji.sizer.cost('getAPIVersion')
+        # Pretend the scheduler is busy, so our RPC waits in its queue.
+        koji.scheduler.active = koji.scheduler.max_concurrent
+        multicall = koji.MultiCall()
+        multicall.getAPIVersion()
+        d = multicall()
+        koji.sizer.clock.advance(100)
+        koji.scheduler.active = 0
+        koji.scheduler._dispatch()
+        yield d
+        assert koji.sizer.observations == 1
+        assert koji.sizer.cost('getAPIVersion') <= cost
+
+    @pytest_twisted.inlineCallbacks
+    def test_failed(self, koji):
+        multicall = koji.MultiCall()
+        multicall.boom()
+        with pytest.raises(ValueError):
+            yield multicall()
+        assert koji.sizer.batch_size('boom') == 2
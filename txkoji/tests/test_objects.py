@@ -0,0 +1,147 @@
+from twisted.internet import defer
+from twisted.internet.task import Clock
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji import build_states
+from txkoji import task_states
+from txkoji.build import Build
+from txkoji.cache_backends import SQLiteBackend
+from txkoji.objects import ObjectCache
+from txkoji.proxy import TrustedProxy
+from txkoji.task import Task
+
+
+class FakeProxy(TrustedProxy):
+    """ Record every RPC and answer from a dict of results. """
+
+    def callRemote(self, action, *args):
+        self.actions.append(action)
+        return defer.succeed(self.results[action])
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji')
+    koji.proxy.actions = []
+    koji.proxy.results = {
+        'getBuild': {'id': 1, 'build_id': 1, 'state': build_states.COMPLETE,
+                     'task_id': 10},
+        'getTaskInfo': {'id': 10, 'state': task_states.CLOSED},
+        'getTaskDescendents': {'10': [{'id': 11,
+                                       'state': task_states.CLOSED}],
+                               '11': []},
+    }
+    koji.objects.clock = Clock()
+    return koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_final_build(koji):
+    first = yield koji.getBuild(1)
+    koji.objects.clock.advance(3600)
+    second = yield koji.getBuild(1)
+    assert koji.proxy.actions == ['getBuild']
+    assert isinstance(second, Build)
+    assert second == first
+    # Each caller gets its own object.
+    assert second is not first
+
+
+@pytest_twisted.inlineCallbacks
+def test_open_task(koji):
+    koji.proxy.results['getTaskInfo'] = {'id': 10, 'state': task_states.OPEN}
+    yield koji.getTaskInfo(10)
+    yield koji.getTaskInfo(10)
+    assert koji.proxy.actions == ['getTaskInfo']
+    koji.objects.clock.advance(5)
+    task = yield koji.getTaskInfo(10)
+    assert koji.proxy.actions == ['getTaskInfo', 'getTaskInfo']
+    assert isinstance(task, Task)
+
+
+@pytest_twisted.inlineCallbacks
+def test_ttl_zero(koji):
+    koji.objects.ttl = 0
+    koji.proxy.results['getTaskInfo'] = {'id': 10, 'state': task_states.OPEN}
+    yield koji.getTaskInfo(10)
+    yield koji.getTaskInfo(10)
+    assert koji.proxy.actions == ['getTaskInfo', 'getTaskInfo']
+
+
+@pytest_twisted.inlineCallbacks
+def test_kwargs_bypass(koji):
+    yield koji.getBuild(1)
+    yield koji.getBuild(1, strict=True)
+    assert koji.proxy.actions == ['getBuild', 'getBuild']
+
+
+@pytest_twisted.inlineCallbacks
+def test_dict_key_bypass(koji):
+    buildinfo = {'name': 'x', 'version': '1', 'release': '1'}
+    build = yield koji.getBuild(buildinfo)
+    assert isinstance(build, Build)
+    yield koji.getBuild(buildinfo)
+    assert koji.proxy.actions == ['getBuild', 'getBuild']
+
+
+@pytest_twisted.inlineCallbacks
+def test_missing(koji):
+    koji.proxy.results['getBuild'] = None
+    build = yield koji.getBuild(1)
+    assert build is None
+    yield koji.getBuild(1)
+    assert koji.proxy.actions == ['getBuild', 'getBuild']
+
+
+@pytest_twisted.inlineCallbacks
+def test_build_task_chain(koji):
+    build = yield koji.getBuild(1)
+    yield build.task()
+    task = yield build.task()
+    assert task.id == 10
+    assert koji.proxy.actions == ['getBuild', 'getTaskInfo']
+
+
+@pytest_twisted.inlineCallbacks
+def test_descendents_unknown_parent(koji):
+    yield koji.getTaskDescendents(10)
+    assert koji.objects.peek('descendents', 10)[1] is False
+
+
+@pytest_twisted.inlineCallbacks
+def test_descendents_final_parent(koji):
+    yield koji.getTaskInfo(10)
+    tasks = yield koji.getTaskDescendents(10)
+    koji.objects.clock.advance(3600)
+    tasks = yield koji.getTaskDescendents(10)
+    assert [task.id for task in tasks] == [11]
+    assert koji.proxy.actions == ['getTaskInfo', 'getTaskDescendents']
+
+
+@pytest_twisted.inlineCallbacks
+def test_descendents_converts_one_list(koji, monkeypatch):
+    wrapped = []
+    wrap = koji._wrap
+
+    def recording_wrap(type_, value, mode=None):
+        wrapped.append(value['id'])
+        return wrap(type_, value, mode)
+    monkeypatch.setattr(koji, '_wrap', recording_wrap)
+    koji.proxy.results['getTaskDescendents']['11'] = [{'id': 12}]
+    tasks = yield koji.getTaskDescendents(10)
+    assert [task.id for task in tasks] == [11]
+    assert wrapped == [11]
+
+
+@pytest_twisted.inlineCallbacks
+def test_backend(koji, tmpdir):
+    path = str(tmpdir.join('objects.sqlite'))
+    koji.objects = ObjectCache(koji, backend=SQLiteBackend(path))
+    yield koji.getBuild(1)
+    # Simulate a new process:
+    koji.objects = ObjectCache(koji, backend=SQLiteBackend(path))
+    build = yield koji.getBuild(1)
+    assert build.task_id == 10
+    assert koji.proxy.actions == ['getBuild']
@@ -0,0 +1,196 @@
+from twisted.internet import defer
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.exceptions import KojiException
+from txkoji.pager import Pager, fetch_pages, stable_order
+from txkoji.proxy import TrustedProxy
+
+
+class FakeFetch(object):
+    """ Hold every page request until the test fires it. """
+    def __init__(self, total):
+        self.items = list(range(total))
+        self.requests = []
+
+    def __call__(self, offset, limit):
+        d = defer.Deferred()
+        self.requests.append((offset, limit, d))
+        return d
+
+    def finish(self, i):
+        (offset, limit, d) = self.requests[i]
+        d.callback(self.items[offset:offset + limit])
+
+
+class TestPager(object):
+
+    def test_first_page(self):
+        fetch = FakeFetch(5)
+        pager = Pager(fetch, page_size=2)
+        d = pager.next()
+        fetch.finish(0)
+        assert d.result == [0, 1]
+
+    def test_prefetch(self):
+        fetch = FakeFetch(5)
+        pager = Pager(fetch, page_size=2)
+        pager.next()
+        assert len(fetch.requests) == 1
+        fetch.finish(0)
+        # We requested the next page before the caller asked for it:
+        assert [offset for (offset, _, _) in fetch.requests] == [0, 2]
+        d = pager.next()
+        fetch.finish(1)
+        assert d.result == [2, 3]
+
+    def test_one_page_in_flight(self):
+        fetch = FakeFetch(10)
+        pager = Pager(fetch, page_size=2)
+        pager.next()
+        fetch.finish(0)
+        fetch.finish(1)
+        # The caller has not taken page two yet, so we wait.
+        assert len(fetch.requests) == 2
+
+    def test_last_page(self):
+        fetch = FakeFetch(3)
+        pager = Pager(fetch, page_size=2)
+        pager.next()
+        fetch.finish(0)
+        d = pager.next()
+        fetch.finish(1)
+        assert d.result == [2]
+        assert pager.next().result == []
+        assert len(fetch.requests) == 2
+
+    def test_exact_multiple(self):
+        fetch = FakeFetch(4)
+        pager = Pager(fetch, page_size=2)
+        pager.next()
+        fetch.finish(0)
+        pager.next()
+        fetch.finish(1)
+        d = pager.next()
+        fetch.finish(2)
+        assert d.result == []
+        assert pager.next().result == []
+
+
+class TestFetchPages(object):
+
+    def test_concurrency(self):
+        fetch = FakeFetch(10)
+        fetch_pages(fetch, 10, page_size=3, concurrency=2)
+        assert [offset for (offset, _, _) in fetch.requests] == [0, 3]
+        fetch.finish(1)
+        assert [offset for (offset, _, _) in fetch.requests] == [0, 3, 6]
+
+    def test_order(self):
+        fetch = FakeFetch(10)
+        d = fetch_pages(fetch, 10, page_size=3, concurrency=4)
+        for i in reversed(range(4)):
+            fetch.finish(i)
+        assert d.result == list(range(10))
+
+    def test_empty(self):
+        d = fetch_pages(FakeFetch(0), 0)
+        assert d.result == []
+
+    @pytest_twisted.inlineCallbacks
+    def test_error(self):
+        fetch = FakeFetch(10)
+        d = fetch_pages(fetch, 10, page_size=5)
+        fetch.finish(0)
+        (_, _, page) = fetch.requests[1]
+        page.errback(KojiException('oops'))
+        with pytest.raises(KojiException):
+            yield d
+
+
+@pytest.mark.parametrize(('order', 'expected'), [
+    (None, 'id'),
+    ('priority', 'priority,id'),
+    ('-id', '-id'),
+    ('priority,-create_time', 'priority,-create_time,id'),
+])
+def test_stable_order(order, expected):
+    assert stable_order(order, 'id') == expected
+
+
+class FakeProxy(TrustedProxy):
+    """ Return one full page, then a short page. """
+
+    def callRemote(self, action, *args):
+        self.sent.append((action, args))
+        if action == 'getPackage':
+            return defer.succeed({'id': 4, 'name': 'ceph'})
+        query_opts = args[-1]
+        if '__starstar' in query_opts:
+            # listBuilds passes queryOpts as a keyword argument.
+            query_opts = query_opts['queryOpts']
+        if query_opts['offset'] == 0:
+            return defer.succeed([{'id': 1}, {'id': 2}])
+        return defer.succeed([{'id': 3}])
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji')
+    koji.proxy.sent = []
+    return koji
+
+
+@pytest_twisted.inlineCallbacks
+def test_iter_tasks(koji):
+    pager = koji.iterTasks({'method': 'build'}, page_size=2)
+    tasks = []
+    while True:
+        page = yield pager.next()
+        if not page:
+            break
+        tasks.extend(page)
+    assert [task.id for task in tasks] == [1, 2, 3]
+    (_, (_, query_opts)) = koji.proxy.sent[1]
+    assert query_opts == {'order': 'id', 'offset': 2, 'limit': 2}
+
+
+@pytest_twisted.inlineCallbacks
+def test_iter_builds(koji):
+    pager = koji.iterBuilds('ceph', page_size=2)
+    first = yield pager.next()
+    second = yield pager.next()
+    assert len(first) == 2
+    assert len(second) == 1
+    actions = [action for (action, _) in koji.proxy.sent]
+    assert actions == ['getPackage', 'listBuilds', 'listBuilds']
+    (_, (package_id, kwargs)) = koji.proxy.sent[2]
+    assert package_id == 4
+    assert kwargs['queryOpts'] == {'order': 'build_id', 'offset': 2,
+                                   'limit': 2}
+
+
+class CountingProxy(TrustedProxy):
+    """ Serve listTasks queries from a list of 5 tasks. """
+    tasks = [{'id': i, 'method': 'build'} for i in range(5)]
+
+    def callRemote(self, action, opts, query_opts):
+        self.sent.append(query_opts)
+        if query_opts.get('countOnly'):
+            return defer.succeed(len(self.tasks))
+        offset = query_opts['offset']
+        return defer.succeed(self.tasks[offset:offset + query_opts['limit']])
+
+
+@pytest_twisted.inlineCallbacks
+def test_list_tasks_pages(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', CountingProxy)
+    koji = Connection('mykoji')
+    koji.proxy.sent = []
+    tasks = yield koji.listTasks({'method': 'build'}, page_size=2)
+    assert [task.id for task in tasks] == [0, 1, 2, 3, 4]
+    assert all(task.connection is koji for task in tasks)
+    assert koji.proxy.sent[0] == {'countOnly': True}
+    offsets = [query_opts['offset'] for query_opts in koji.proxy.sent[1:]]
+    assert offsets == [0, 2, 4]
@@ -0,0 +1,192 @@
+import gzip
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from twisted.web.client import ContentDecoderAgent
+from twisted.web.client import GzipDecoder
+from twisted.web.client import ResponseDone
+from twisted.web.client import HTTPConnectionPool
+from twisted.web.http_headers import Headers
+from twisted.internet import reactor
+import pytest
+import pytest_twisted
+from txkoji.proxy import TrustedProxy
+from txkoji.query_factory import KojiQueryFactory
+
+
+RESPONSE = b"""<?xml version='1.0'?>
+<methodResponse>
+<params>
+<param>
+<value><int>1</int></value>
+</param>
+</params>
+</methodResponse>
+"""
+
+
+ARRAY_RESPONSE = b"""<?xml version='1.0'?>
+<methodResponse>
+<params>
+<param>
+<value><array><data>
+<value><struct>
+<member><name>id</name><value><int>1</int></value></member>
+<member><name>arches</name><value><array><data>
+<value><string>x86_64</string></value>
+</data></array></value></member>
+</struct></value>
+<value><struct>
+<member><name>id</name><value><int>2</int></value></member>
+<member><name>arches</name><value><array><data>
+</data></array></value></member>
+</struct></value>
+</data></array></value>
+</param>
+</params>
+</methodResponse>
+"""
+
+
+class FakeResponse(object):
+    """ Fake IResponse from twisted.web.client.Agent """
+    def __init__(self, body, code=200, phrase=b'OK', chunk_size=None,
+                 headers=None):
+        self.body = body
+        self.code = code
+        self.phrase = phrase
+        self.chunk_size = chunk_size or len(body)
+        self.headers = Headers(headers or {})
+        self.length = len(body)
+
+    def deliverBody(self, protocol):
+        for i in range(0, len(self.body), self.chunk_size):
+            protocol.dataReceived(self.body[i:i + self.chunk_size])
+        protocol.connectionLost(Failure(ResponseDone()))
+
+
+class FakeAgent(object):
+    """ Record every request and reply with a canned response. """
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def request(self, method, uri, headers=None, bodyProducer=None):
+        self.requests.append((method, uri, headers))
+        self.body = bodyProducer._inputFile.read()
+        return defer.succeed(self.response)
+
+
+@pytest.fixture
+def proxy():
+    pool = HTTPConnectionPool(reactor)
+    proxy = TrustedProxy(b'https://hub.example.com/kojihub', allowNone=True,
+                         pool=pool)
+    proxy.queryFactory = KojiQueryFactory
+    return proxy
+
+
+@pytest_twisted.inlineCallbacks
+def test_pooled_call(proxy):
+    proxy._agent = FakeAgent(FakeResponse(RESPONSE))
+    result = yield proxy.callRemote('getAPIVersion')
+    assert result == 1
+    (method, uri, headers) = proxy._agent.requests[0]
+    assert method == b'POST'
+    assert uri == b'https://hub.example.com/kojihub'
+
+
+@pytest_twisted.inlineCallbacks
+def test_pooled_call_bad_status(proxy):
+    response = FakeResponse(b'oops', code=503, phrase=b'Unavailable')
+    proxy._agent = FakeAgent(response)
+    with pytest.raises(ValueError) as e:
+        yield proxy.callRemote('getAPIVersion')
+    assert e.value.args == (b'503', b'Unavailable')
+
+
+def test_agent_shares_pool(proxy):
+    proxy.acceptGzip = False
+    assert proxy.agent._pool is proxy.pool
+
+
+@pytest_twisted.inlineCallbacks
+def test_chunked_response(proxy):
+    proxy._agent = FakeAgent(FakeResponse(ARRAY_RESPONSE, chunk_size=7))
+    result = yield proxy.callRemote('listBuilds')
+    assert result == [{'id': 1, 'arches': ['x86_64']},
+                      {'id': 2, 'arches': []}]
+
+
+@pytest_twisted.inlineCallbacks
+def test_on_response(proxy):
+    proxy._agent = FakeAgent(FakeResponse(ARRAY_RESPONSE, chunk_size=7))
+    sizes = []
+    proxy.onResponse = lambda method, args, size: sizes.append(
+        (method, args, size))
+    yield proxy.callRemote('listBuilds', 1)
+    assert sizes == [('listBuilds', (1,), len(ARRAY_RESPONSE))]
+
+
+@pytest_twisted.inlineCallbacks
+def test_stream_remote(proxy):
+    proxy._agent = FakeAgent(FakeResponse(ARRAY_RESPONSE, chunk_size=7))
+    items = []
+    result = yield proxy.streamRemote(items.append, 'listBuilds')
+    assert result == []
+    assert items == [{'id': 1, 'arches': ['x86_64']},
+                     {'id': 2, 'arches': []}]
+
+
+@pytest_twisted.inlineCallbacks
+def test_stream_remote_scalar(proxy):
+    # Non-array results are returned normally.
+    proxy._agent = FakeAgent(FakeResponse(RESPONSE))
+    items = []
+    result = yield proxy.streamRemote(items.append, 'getAPIVersion')
+    assert result == 1
+    assert items == []
+
+
+@pytest_twisted.inlineCallbacks
+def test_malformed_response(proxy):
+    proxy._agent = FakeAgent(FakeResponse(b'<methodResponse><oops>'))
+    with pytest.raises(Exception):
+        yield proxy.callRemote('getAPIVersion')
+
+
+def test_accept_gzip(proxy):
+    assert isinstance(proxy.agent, ContentDecoderAgent)
+
+
+@pytest_twisted.inlineCallbacks
+def test_gzip_response(proxy):
+    headers = {b'Content-Encoding': [b'gzip']}
+    response = FakeResponse(gzip.compress(ARRAY_RESPONSE), chunk_size=7,
+                            headers=headers)
+    fake_agent = FakeAgent(response)
+    proxy._agent = ContentDecoderAgent(fake_agent, [(b'gzip', GzipDecoder)])
+    result = yield proxy.callRemote('listBuilds')
+    assert result == [{'id': 1, 'arches': ['x86_64']},
+                      {'id': 2, 'arches': []}]
+    (_, _, headers) = fake_agent.requests[0]
+    assert headers.getRawHeaders(b'Accept-Encoding') == [b'gzip']
+
+
+@pytest_twisted.inlineCallbacks
+def test_compress_request(proxy):
+    proxy.compressThreshold = 10
+    proxy._agent = FakeAgent(FakeResponse(RESPONSE))
+    yield proxy.callRemote('getAPIVersion')
+    (_, _, headers) = proxy._agent.requests[0]
+    assert headers.getRawHeaders(b'Content-Encoding') == [b'gzip']
+    assert b'getAPIVersion' in gzip.decompress(proxy._agent.body)
+
+
+@pytest_twisted.inlineCallbacks
+def test_small_request(proxy):
+    proxy.compressThreshold = 10000
+    proxy._agent = FakeAgent(FakeResponse(RESPONSE))
+    yield proxy.callRemote('getAPIVersion')
+    (_, _, headers) = proxy._agent.requests[0]
+    assert not headers.hasHeader(b'Content-Encoding')
+    assert b'getAPIVersion' in proxy._agent.body
@@ -0,0 +1,102 @@
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.build import Build
+from txkoji.records import BuildRecord, TaskRecord
+from txkoji.results import COMPACT
+from txkoji.task import Task
+from txkoji.tests.util import FakeProxy
+
+
+@pytest.fixture
+def koji(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    return Connection('mykoji')
+
+
+TASK_PROPERTIES = ('arch', 'arches', 'package', 'tag', 'target', 'state_name',
+                   'created', 'started', 'completed', 'url', 'is_scratch')
+
+
+class TestTaskRecords(object):
+
+    @pytest.fixture
+    def pairs(self, koji):
+        tasks = pytest_twisted.blockon(koji.listTasks())
+        records = pytest_twisted.blockon(koji.listTasks(result_mode=COMPACT))
+        return list(zip(tasks, records))
+
+    def test_type(self, pairs):
+        (_, record) = pairs[0]
+        assert isinstance(record, TaskRecord)
+        assert not hasattr(record, '__dict__')
+
+    @pytest.mark.parametrize('name', TASK_PROPERTIES)
+    def test_same_properties(self, pairs, name):
+        for (task, record) in pairs:
+            assert getattr(record, name) == getattr(task, name)
+
+    def test_data(self, pairs):
+        (task, record) = pairs[0]
+        assert record.id == task.id
+        assert record['id'] == task.id
+        assert record.get('noexist') is None
+        assert 'method' in record
+        data = task.toDict()
+        del data['connection']
+        assert record.toDict() == data
+
+    def test_missing_attribute(self, pairs):
+        (_, record) = pairs[0]
+        with pytest.raises(AttributeError):
+            record.noexist
+
+    def test_shared_connection(self, koji, pairs):
+        (_, first) = pairs[0]
+        (_, second) = pairs[1]
+        assert first.connection is koji
+        assert type(first) is type(second)
+
+    def test_shared_keys(self, pairs):
+        (_, first) = pairs[0]
+        (_, second) = pairs[1]
+        assert first._index is second._index
+
+    def test_interned(self, pairs):
+        (_, first) = pairs[0]
+        (_, second) = pairs[1]
+        assert first.method is second.method
+
+    @pytest_twisted.inlineCallbacks
+    def test_callback(self, koji):
+        records = []
+        yield koji.listTasks(callback=records.append, result_mode=COMPACT)
+        assert isinstance(records[0], TaskRecord)
+
+
+class TestBuildRecord(object):
+
+    @pytest.fixture
+    def pair(self, koji):
+        build = pytest_twisted.blockon(koji.getBuild(12345))
+        d = koji.getBuild(12345, result_mode=COMPACT)
+        record = pytest_twisted.blockon(d)
+        return (build, record)
+
+    def test_type(self, pair):
+        (build, record) = pair
+        assert isinstance(build, Build)
+        assert isinstance(record, BuildRecord)
+
+    @pytest.mark.parametrize('name', ('started', 'completed', 'duration',
+                                      'url', 'gitbuildhash', 'task_id'))
+    def test_same_properties(self, pair, name):
+        (build, record) = pair
+        assert getattr(record, name) == getattr(build, name)
+
+
+@pytest_twisted.inlineCallbacks
+def test_no_record_type(koji):
+    channel = yield koji.getChannel(1, result_mode=COMPACT)
+    assert channel.connection is koji
+    assert not isinstance(channel, Task)
@@ -0,0 +1,87 @@
+from munch import Munch
+import pytest
+import pytest_twisted
+from txkoji import Connection
+from txkoji.results import LazyMunch, LazyList
+from txkoji.results import convert, wrap, RAW, LAZY, MUNCH
+from txkoji.task import Task
+from txkoji.tests.util import FakeProxy
+
+
+DATA = {'id': 1, 'owner': {'name': 'kdreyer'}, 'arches': [{'id': 2}]}
+
+
+class TestConvert(object):
+
+    def test_munch(self):
+        result = convert(DATA, MUNCH)
+        assert isinstance(result.owner, Munch)
+        assert isinstance(result.arches[0], Munch)
+
+    def test_raw(self):
+        assert convert(DATA, RAW) is DATA
+
+    def test_lazy(self):
+        result = convert(DATA, LAZY)
+        assert isinstance(result, LazyMunch)
+        # We have not converted nested values yet:
+        assert type(dict.__getitem__(result, 'owner')) is dict
+        assert result.owner.name == 'kdreyer'
+        assert isinstance(dict.__getitem__(result, 'owner'), LazyMunch)
+
+    def test_lazy_list(self):
+        result = convert(DATA, LAZY)
+        assert isinstance(result.arches, LazyList)
+        assert [arch.id for arch in result.arches] == [2]
+        assert result.get('arches')[0].id == 2
+
+    def test_lazy_does_not_modify(self):
+        data = {'owner': {'name': 'kdreyer'}}
+        result = convert(data, LAZY)
+        result.owner
+        assert type(data['owner']) is dict
+
+    def test_scalar(self):
+        assert convert(1, LAZY) == 1
+
+
+class TestWrap(object):
+
+    @pytest.mark.parametrize('mode', (RAW, LAZY, MUNCH))
+    def test_type(self, mode):
+        task = wrap(Task, DATA, mode)
+        assert isinstance(task, Task)
+        assert task.id == 1
+
+    def test_none(self):
+        assert wrap(Task, None, MUNCH) is None
+
+    def test_raw_nested(self):
+        task = wrap(Task, DATA, RAW)
+        assert type(task.owner) is dict
+
+
+class TestConnectionResultMode(object):
+
+    @pytest.fixture
+    def koji(self, monkeypatch):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+        return Connection('mykoji', result_mode=RAW)
+
+    @pytest_twisted.inlineCallbacks
+    def test_call(self, koji):
+        user = yield koji.getLoggedInUser()
+        assert type(user) is dict
+
+    @pytest_twisted.inlineCallbacks
+    def test_typed(self, koji):
+        task = yield koji.getTaskInfo(291929)
+        assert isinstance(task, Task)
+        assert task.connection is koji
+        assert type(task.request) is list
+
+    @pytest_twisted.inlineCallbacks
+    def test_override(self, koji):
+        tasks = yield koji.listTasks(result_mode=LAZY)
+        assert isinstance(tasks[0], LazyMunch)
+        assert isinstance(tasks[0], Task)
@@ -0,0 +1,126 @@
+from twisted.internet import defer
+from twisted.internet.task import Clock
+import pytest
+from txkoji import Connection
+from txkoji.proxy import TrustedProxy
+from txkoji.scheduler import Scheduler, INTERACTIVE, BACKGROUND
+
+
+class FakeRequests(object):
+    """ Hold every request in flight until the test fires it. """
+    def __init__(self):
+        self.started = []
+
+    def start(self, name):
+        d = defer.Deferred()
+        self.started.append((name, d))
+        return d
+
+    def finish(self, i, result=None):
+        (_, d) = self.started[i]
+        d.callback(result)
+
+
+@pytest.fixture
+def requests():
+    return FakeRequests()
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(max_concurrent=2)
+    scheduler.clock = Clock()
+    return scheduler
+
+
+def started(requests):
+    return [name for (name, _) in requests.started]
+
+
+class TestScheduler(object):
+
+    def test_max_concurrent(self, scheduler, requests):
+        for name in ('a', 'b', 'c'):
+            scheduler.submit(INTERACTIVE, requests.start, name)
+        assert started(requests) == ['a', 'b']
+        assert scheduler.active == 2
+        assert scheduler.queue_depth == 1
+
+    def test_start_next(self, scheduler, requests):
+        for name in ('a', 'b', 'c'):
+            scheduler.submit(INTERACTIVE, requests.start, name)
+        requests.finish(0)
+        assert started(requests) == ['a', 'b', 'c']
+
+    def test_result(self, scheduler, requests):
+        d = scheduler.submit(INTERACTIVE, requests.start, 'a')
+        requests.finish(0, 'ok')
+        assert d.result == 'ok'
+
+    def test_priority(self, scheduler, requests):
+        scheduler.submit(INTERACTIVE, requests.start, 'a')
+        scheduler.submit(INTERACTIVE, requests.start, 'b')
+        scheduler.submit(BACKGROUND, requests.start, 'background')
+        scheduler.submit(INTERACTIVE, requests.start, 'interactive')
+        requests.finish(0)
+        requests.finish(1)
+        assert started(requests) == ['a', 'b', 'interactive', 'background']
+
+    def test_wait_metrics(self, scheduler, requests):
+        scheduler.submit(INTERACTIVE, requests.start, 'a')
+        # This request started right away, so it never waited:
+        assert scheduler.metrics()['max_queue_depth'] == 0
+        for name in ('b', 'c'):
+            scheduler.submit(INTERACTIVE, requests.start, name)
+        scheduler.clock.advance(3)
+        requests.finish(0)
+        metrics = scheduler.metrics()
+        assert metrics['dispatched'] == 3
+        assert metrics['max_queue_depth'] == 1
+        assert metrics['max_wait'] == 3
+        assert metrics['average_wait'] == 1
+
+    def test_cancel_queued(self, scheduler, requests):
+        scheduler.submit(INTERACTIVE, requests.start, 'a')
+        scheduler.submit(INTERACTIVE, requests.start, 'b')
+        d = scheduler.submit(INTERACTIVE, requests.start, 'c')
+        d.addErrback(lambda failure: None)
+        d.cancel()
+        assert scheduler.queue_depth == 0
+        requests.finish(0)
+        assert started(requests) == ['a', 'b']
+
+    def test_synchronous_results(self, scheduler):
+        results = []
+        for i in range(100):
+            d = scheduler.submit(INTERACTIVE, defer.succeed, i)
+            d.addCallback(results.append)
+        assert results == list(range(100))
+        assert scheduler.active == 0
+
+
+class FakeProxy(TrustedProxy):
+    """ Hold every RPC in flight until the test fires it. """
+
+    def callRemote(self, action, *args):
+        d = defer.Deferred()
+        self.inflight.append((action, d))
+        return d
+
+
+def test_connection_limit(monkeypatch):
+    monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+    koji = Connection('mykoji', max_concurrent=1)
+    koji.proxy.inflight = []
+    koji.getAPIVersion()
+    multicall = koji.MultiCall(priority=BACKGROUND)
+    multicall.getAPIVersion()
+    multicall()
+    koji.getLoggedInUser()
+    assert [action for (action, _) in koji.proxy.inflight] == \
+        ['getAPIVersion']
+    (_, d) = koji.proxy.inflight[0]
+    d.callback(1)
+    # The interactive call jumps ahead of the background multicall:
+    assert [action for (action, _) in koji.proxy.inflight] == \
+        ['getAPIVersion', 'getLoggedInUser']
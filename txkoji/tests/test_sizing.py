@@ -0,0 +1,84 @@
+from twisted.internet.task import Clock
+import pytest
+from txkoji.sizing import BatchSizer
+
+
+@pytest.fixture
+def sizer():
+    sizer = BatchSizer(target=2.0, initial_calls=100, alpha=1.0)
+    sizer.clock = Clock()
+    return sizer
+
+
+def test_initial(sizer):
+    assert sizer.batch_size('getBuild') == 100
+    assert sizer.batch_size('getBuild', max_calls=50) == 50
+
+
+def test_slow_method(sizer):
+    # 100 calls took 10 seconds:
+    sizer.observe(['listBuilds'] * 100, 10.0)
+    assert sizer.batch_size('listBuilds') == 20
+
+
+def test_fast_method(sizer):
+    sizer.observe(['getAverageBuildDuration'] * 100, 0.5)
+    assert sizer.batch_size('getAverageBuildDuration') == 400
+
+
+def test_mixed(sizer):
+    sizer.observe(['getBuild'] * 10 + ['listBuilds'] * 10, 0.4)
+    # Both methods cost the same until we see them separately:
+    assert sizer.batch_size('getBuild') == sizer.batch_size('listBuilds')
+
+
+def test_never_zero(sizer):
+    sizer.observe(['listBuilds'], 600.0)
+    assert sizer.batch_size('listBuilds') == 1
+
+
+def test_moving_average():
+    sizer = BatchSizer(target=2.0, initial_calls=100, alpha=0.5)
+    sizer.observe(['listBuilds'] * 100, 6.0)
+    # Halfway between 0.02 and 0.06 seconds per call:
+    assert sizer.cost('listBuilds') == pytest.approx(0.04)
+
+
+def test_failed(sizer):
+    sizer.failed(['listBuilds'])
+    assert sizer.batch_size('listBuilds') == 50
+
+
+def test_failed_not_smoothed():
+    sizer = BatchSizer(target=2.0, initial_calls=100, alpha=0.3)
+    sizer.failed(['listBuilds'])
+    assert sizer.batch_size('listBuilds') == 50
+    assert sizer.failures == 1
+
+
+def test_response_size(sizer):
+    sizer.observe_size(['getBuild'] * 10 + ['listBuilds'] * 10, 20000)
+    # Both methods get an even share until we see them separately:
+    assert sizer.sizes == {'getBuild': 1000.0, 'listBuilds': 1000.0}
+    sizer.observe_size(['listBuilds'] * 10, 100000)
+    assert sizer.sizes['listBuilds'] == 10000.0
+
+
+def test_max_response_bytes():
+    sizer = BatchSizer(target=2.0, initial_calls=100,
+                       max_response_bytes=100000)
+    sizer.observe_size(['listBuilds'] * 10, 50000)
+    # 5000 bytes per call:
+    assert sizer.batch_size('listBuilds') == 20
+    assert sizer.batch_size('getBuild') == 100
+
+
+def test_metrics(sizer):
+    sizer.observe(['listBuilds'] * 100, 10.0)
+    sizer.observe_size(['listBuilds'] * 100, 300000)
+    metrics = sizer.metrics()
+    assert metrics['observations'] == 1
+    assert metrics['last_latency'] == 10.0
+    assert metrics['last_size'] == 300000
+    assert metrics['batch_sizes'] == {'listBuilds': 20}
+    assert metrics['response_sizes'] == {'listBuilds': 3000.0}
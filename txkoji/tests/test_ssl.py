@@ -0,0 +1,63 @@
+from txkoji.ssl import ResumingClientTLSOptions
+from txkoji.ssl import ResumingPolicyForHTTPS
+
+
+class FakeSSLConnection(object):
+    """ Fake OpenSSL.SSL.Connection """
+    def __init__(self, session):
+        self.session = session
+        self.resumed = None
+
+    def get_session(self):
+        return self.session
+
+    def set_session(self, session):
+        self.resumed = session
+
+
+class FakeCreator(object):
+    """ Fake result of optionsForClientTLS() """
+    def __init__(self):
+        self.count = 0
+
+    def clientConnectionForTLS(self, tlsProtocol):
+        self.count += 1
+        return FakeSSLConnection('session-%d' % self.count)
+
+
+class TestResumingClientTLSOptions(object):
+
+    def test_first_connection(self):
+        options = ResumingClientTLSOptions(FakeCreator())
+        connection = options.clientConnectionForTLS(None)
+        assert connection.resumed is None
+
+    def test_resume_previous_session(self):
+        options = ResumingClientTLSOptions(FakeCreator())
+        options.clientConnectionForTLS(None)
+        connection = options.clientConnectionForTLS(None)
+        assert connection.resumed == 'session-1'
+
+    def test_keep_session_when_none(self):
+        options = ResumingClientTLSOptions(FakeCreator())
+        options.clientConnectionForTLS(None)
+        second = options.clientConnectionForTLS(None)
+        # This connection never finished a handshake:
+        second.session = None
+        third = options.clientConnectionForTLS(None)
+        assert third.resumed == 'session-1'
+
+
+class TestResumingPolicyForHTTPS(object):
+
+    def test_one_creator_per_host(self):
+        policy = ResumingPolicyForHTTPS()
+        first = policy.creatorForNetloc(b'hub.example.com', 443)
+        second = policy.creatorForNetloc(b'hub.example.com', 443)
+        assert first is second
+
+    def test_different_hosts(self):
+        policy = ResumingPolicyForHTTPS()
+        first = policy.creatorForNetloc(b'hub.example.com', 443)
+        second = policy.creatorForNetloc(b'koji.example.com', 443)
+        assert first is not second
@@ -1,11 +1,17 @@
+import base64
 from datetime import datetime, timedelta, UTC
 from munch import Munch
+from twisted.internet import defer
 import pytest
 from txkoji import Connection
 from txkoji import task_states
 from txkoji.task import Task
 from txkoji.tests.util import FakeProxy
 import pytest_twisted
+try:
+    import xmlrpc.client as xmlrpc_client
+except ImportError:
+    import xmlrpclib as xmlrpc_client
 
 
 class TestGetTask(object):
@@ -90,3 +96,67 @@ class TestListTasks(object):
     def test_first_task(self, tasks):
         task = tasks[0]
         assert task.state == task_states.FAILED
+
+
+class TestStreamTasks(object):
+
+    @pytest_twisted.inlineCallbacks
+    def test_callback(self, monkeypatch):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+        koji = Connection('mykoji')
+        opts = {'owner': 144, 'method': 'build'}
+        tasks = []
+        result = yield koji.listTasks(opts, callback=tasks.append)
+        assert result is None
+        assert len(tasks) > 0
+        for task in tasks:
+            assert isinstance(task, Task)
+            assert task.connection is koji
+
+
+class TestUndecodedRequest(object):
+
+    PARAMS = ('git://example.com/ceph.git#abc', 'ceph-build', {})
+
+    @pytest.fixture
+    def request_xml(self):
+        return xmlrpc_client.dumps(self.PARAMS, 'build')
+
+    def test_xml(self, request_xml):
+        task = Task({'method': 'build', 'request': request_xml})
+        assert task.params == list(self.PARAMS)
+        assert task.package == 'ceph'
+
+    def test_base64(self, request_xml):
+        encoded = base64.b64encode(request_xml.encode()).decode()
+        task = Task({'method': 'build', 'request': encoded})
+        assert task.params == list(self.PARAMS)
+        assert task.target == 'ceph-build'
+
+    def test_decode_once(self, request_xml, monkeypatch):
+        calls = []
+        loads = xmlrpc_client.loads
+
+        def counting_loads(data):
+            calls.append(data)
+            return loads(data)
+        monkeypatch.setattr('txkoji.task.loads', counting_loads)
+        task = Task({'method': 'build', 'request': request_xml})
+        task.package
+        task.target
+        task.is_scratch
+        assert len(calls) == 1
+
+    @pytest_twisted.inlineCallbacks
+    def test_list_tasks(self, monkeypatch):
+        monkeypatch.setattr('txkoji.connection.TrustedProxy', FakeProxy)
+        koji = Connection('mykoji')
+        sent = []
+        koji.proxy.callRemote = lambda *args: sent.append(args) or \
+            defer.succeed([])
+        opts = {'method': 'build'}
+        yield koji.listTasks(opts, decode=False)
+        (_, sent_opts, _) = sent[0]
+        assert sent_opts == {'method': 'build', 'decode': False}
+        # We do not modify the caller's opts:
+        assert opts == {'method': 'build'}
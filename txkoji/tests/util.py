@@ -21,6 +21,13 @@ class FakeProxy(TrustedProxy):
             raise
         return defer.succeed(result)
 
+    def streamRemote(self, onItem, action, *args):
+        """ Pass each fixture list item to onItem """
+        d = self.callRemote(action, *args)
+        d.addCallback(lambda result: [onItem(item) for item in result])
+        d.addCallback(lambda _: [])
+        return d
+
 
 class FakeSSLLoginResponse(object):
     """ Fake response from treq, for testing HTTP login """